@@ -151,6 +151,7 @@ AWS_ACCESS_KEY_ID = os.getenv('APMAN_AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = os.getenv('APMAN_AWS_SECRET_ACCESS_KEY')
 AWS_STORAGE_BUCKET_NAME = os.getenv('APMAN_STORAGE_BUCKET_NAME')
 AWS_QUERYSTRING_AUTH = False
+AWS_S3_ENDPOINT_URL = os.getenv('APMAN_S3_ENDPOINT_URL')  # e.g. a local S3 stand-in for tests
 AWS_S3_CUSTOM_DOMAIN = 'static.sonicplanetarium.net'
 # AWS_S3_CUSTOM_DOMAIN = '%s.s3.amazonaws.com' % AWS_STORAGE_BUCKET_NAME
 WPSTATIC_URL = '//sonicplanetarium.net/wp-content/'
@@ -174,6 +175,21 @@ REST_FRAMEWORK = {
 
 SPACETRACK_IDENTITY = os.getenv('APMAN_SPACETRACK_IDENTITY')
 SPACETRACK_PASSWORD = os.getenv('APMAN_SPACETRACK_PASSWORD')
+# point at e.g. http://127.0.0.1:8001/ to use `manage.py fake_spacetrack` for tests and benchmarks
+SPACETRACK_URL = os.getenv('APMAN_SPACETRACK_URL', 'https://www.space-track.org/')
+# https://www.space-track.org/documentation#/api: (requests, per seconds, of which may be sent in a burst)
+SPACETRACK_RATE_LIMITS = (
+    (30, 60, 5),
+    (300, 60 * 60, 20),
+)
+SPACETRACK_POOL_SIZE = 4  # connections kept open to Space-Track per process
+SPACETRACK_RETRIES = 3
+SPACETRACK_BACKOFF = 2  # seconds before the first retry, doubled for each further one
+TLE_BATCH_SIZE = 1000  # number of element sets per INSERT when pulling TLEs into the local store
+TLE_HISTORY_DAYS = 30  # days of element set history kept in the local store
+SATCAT_BATCH_SIZE = 1000  # number of satcat rows per upsert when syncing SatCatCache
+SEARCH_DEFAULT_LIMIT = 10  # satellites returned by /api/satellitesearch/ without limit
+SEARCH_MAX_LIMIT = 50
 
 AUDIO_TYPES = (
     'audio/aac',  # .aac
@@ -189,10 +205,45 @@ AUDIO_TYPES = (
     'audio/flac',
 )
 MAX_AUDIOFILE_SIZE = 30 * 1024 * 1024  # mb
+AUDIO_SNIFF_SIZE = 64 * 1024  # bytes of an upload read to detect its type
+AUDIO_UPLOAD_EXPIRY = 60 * 60  # seconds a presigned direct-to-S3 upload (and its completion token) is valid for
+FILE_UPLOAD_HANDLERS = [
+    # first, so it sees every chunk before it is kept in memory or written to a temporary file
+    'satsound.uploadhandlers.AudioSizeLimitUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# delivery renditions of uploaded audio (see process_audio): loudness normalized AAC at a fixed rate and bitrate
+FFMPEG = os.getenv('APMAN_FFMPEG', 'ffmpeg')
+AUDIO_RENDITION_CODEC = 'aac'
+AUDIO_RENDITION_EXTENSION = '.m4a'
+AUDIO_RENDITION_BITRATE = '128k'
+AUDIO_RENDITION_SAMPLE_RATE = 44100
+AUDIO_RENDITION_CHANNELS = 2
+AUDIO_RENDITION_LOUDNESS = -16  # integrated loudness target, LUFS
+AUDIO_RENDITION_TRUE_PEAK = -1.5  # maximum true peak, dBTP
+AUDIO_RENDITION_LOUDNESS_RANGE = 11  # LU
 
 MAX_IMMINENCE = 1  # number of hours to consider 'recent' when comparing audio timestamps to trajectory rise times
 TRAJECTORY_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'  # 2017-03-21T18:47:28
+# pass prediction: 'satsound.propagation.PyEphemBackend' (reference) or 'satsound.sgp4backend.SGP4Backend' (numpy)
+TRAJECTORY_BACKEND = 'satsound.propagation.PyEphemBackend'
+SGP4_STEP = 30  # seconds between samples of the elevation series searched by SGP4Backend
+TRAJECTORY_BATCH_SIZE = 1000  # number of trajectories per INSERT when replacing a satellite's trajectories
+TRAJECTORY_DEFAULT_WINDOW = 24 * 60 * 60  # seconds from now of trajectories returned without rise_time_window
+TRAJECTORY_PAGE_SIZE = 500  # trajectories per page of /api/satellitetrajectories/
+TRAJECTORY_CACHE_BUCKET = 60  # seconds a cached /api/satellitetrajectories/ response is served for
+AUDIO_MANIFEST_DEFAULT_HOURS = 24  # hours ahead covered by /api/audiomanifest/ without hours
+AUDIO_MANIFEST_MAX_HOURS = 7 * 24
+# background jobs (see run_jobs)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 60  # seconds before a failed job is tried again, doubling with each attempt
+JOB_TIMEOUT = 60 * 60  # seconds a job may run before it is assumed its worker died and queued again
+JOB_POLL_INTERVAL = 2  # seconds an idle worker waits before looking for due jobs again
+JOB_CLAIM_CANDIDATES = 10  # due jobs a worker tries to claim in one go before looking again
+JOB_HISTORY_DAYS = 30  # days done jobs are kept
 DEFAULT_TIMEZONE = 'Europe/London'
+TIMEZONE_CACHE_SIZE = 1024  # coordinates whose timezone each process remembers (see satsound.timezones)
 
 # CORS_ORIGIN_ALLOW_ALL = True
 CORS_ORIGIN_WHITELIST = (
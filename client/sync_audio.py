@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+"""Run at an installation: keeps a local cache of the audio of an observer's passes over the next hours, so playback
+at rise time never waits on the network. Needs only requests (see requirements.txt) and the standard library, not
+the server's code:
+
+    python sync_audio.py 12 --api https://example.org/api/ --dir /var/cache/apman --interval 300
+
+The player opens <dir>/files/<audiofile>, audiofile as in /api/satellitetrajectories/.
+"""
+import argparse
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from os import path
+
+import requests
+
+logger = logging.getLogger('sync_audio')
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AudioCacheError(Exception):
+    pass
+
+
+def _makedirs(directory):
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _replace(source, dest):
+    if os.name == 'nt' and path.exists(dest):
+        # no atomic replace there
+        os.remove(dest)
+    os.rename(source, dest)
+
+
+def _link(source, dest):
+    # a hard link where there are hard links (and the same file system), a copy otherwise
+    _makedirs(path.dirname(dest))
+    tmp = '%s.tmp' % dest
+    try:
+        os.link(source, tmp)
+    except (AttributeError, OSError):
+        shutil.copyfile(source, tmp)
+    _replace(tmp, dest)
+
+
+class AudioCache(object):
+    """Content-addressed local cache of the audio in an observer's /api/audiomanifest/, for installations:
+    objects/ab/abc...123.m4a holds each file once, by sha256, and files/<audiofile> links to it under the name the
+    trajectory feed gives it, so the player opens local files at rise time rather than fetching them then"""
+
+    def __init__(self, root, session=None, timeout=60):
+        self.root = root
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    def object_path(self, sha256, audiofile):
+        return path.join(self.root, 'objects', sha256[:2], sha256 + path.splitext(audiofile)[1])
+
+    def file_path(self, audiofile):
+        return path.join(self.root, 'files', *audiofile.split('/'))
+
+    def _state_path(self):
+        return path.join(self.root, 'manifest.json')
+
+    def _load_state(self):
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        _makedirs(self.root)
+        tmp = '%s.tmp' % self._state_path()
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        _replace(tmp, self._state_path())
+
+    def fetch_manifest(self, url, etag=None):
+        """Returns (manifest, etag), or (None, etag) if the manifest is unchanged since etag"""
+        headers = {'Accept': 'application/json'}
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code == 304:
+            return None, etag
+        if response.status_code != 200:
+            raise AudioCacheError('manifest request failed: %s %s' % (response.status_code, response.text[:200]))
+        return response.json(), response.headers.get('ETag')
+
+    def download(self, entry):
+        """Downloads entry's file into the cache, checking its hash and size if the manifest has them, and returns
+        its sha256"""
+        response = self.session.get(entry['url'], stream=True, timeout=self.timeout)
+        if response.status_code != 200:
+            raise AudioCacheError('%s: %s' % (entry['url'], response.status_code))
+
+        _makedirs(path.join(self.root, 'objects'))
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=path.join(self.root, 'objects'), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = sha256.hexdigest()
+            if entry.get('sha256') and digest != entry['sha256']:
+                raise AudioCacheError('%s: sha256 %s, expected %s' % (entry['url'], digest, entry['sha256']))
+            if entry.get('size') is not None and size != entry['size']:
+                raise AudioCacheError('%s: %s bytes, expected %s' % (entry['url'], size, entry['size']))
+            dest = self.object_path(digest, entry['audiofile'])
+            _makedirs(path.dirname(dest))
+            _replace(tmp, dest)
+        except BaseException:
+            if path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return digest
+
+    def sync(self, url, prune=True):
+        """Makes the cache hold every file in the manifest at url (a /api/audiomanifest/ url). Files are fetched in
+        the order they are needed and only if no file with the same content is cached already. With prune, files no
+        longer in the manifest are removed. Returns (fetched, failed)."""
+        state = self._load_state()
+        manifest, etag = self.fetch_manifest(url, state.get('etag'))
+        if manifest is None:
+            manifest = state.get('manifest', {'audio': []})
+        # audiofile: sha256 of what is cached under that name, for entries the server hasn't hashed yet
+        cached = state.get('cached', {})
+
+        fetched = failed = 0
+        current = {}
+        for entry in manifest['audio']:
+            audiofile = entry['audiofile']
+            sha256 = entry.get('sha256') or cached.get(audiofile)
+            if not sha256 or not path.exists(self.object_path(sha256, audiofile)):
+                try:
+                    sha256 = self.download(entry)
+                    fetched += 1
+                except (AudioCacheError, requests.RequestException, EnvironmentError) as e:
+                    # the rest may still be fetched; this one is tried again next sync, and meanwhile an older copy
+                    # under the same name is kept
+                    logger.error('could not fetch %s: %s' % (audiofile, e))
+                    failed += 1
+                    if audiofile in cached and path.exists(self.object_path(cached[audiofile], audiofile)):
+                        current[audiofile] = cached[audiofile]
+                    continue
+            if sha256 != cached.get(audiofile) or not path.exists(self.file_path(audiofile)):
+                _link(self.object_path(sha256, audiofile), self.file_path(audiofile))
+            current[audiofile] = sha256
+
+        if prune:
+            self.prune(current)
+        else:
+            cached.update(current)
+            current = cached
+        # an unchanged manifest (304) is synced from this copy, so failed files are retried all the same
+        self._save_state({'etag': etag, 'manifest': manifest, 'cached': current})
+        return fetched, failed
+
+    def prune(self, current):
+        """Removes files not named in current (audiofile: sha256) and objects no file links to"""
+        keep_files = set(path.normcase(self.file_path(audiofile)) for audiofile in current)
+        keep_objects = set(path.normcase(self.object_path(s, audiofile)) for audiofile, s in current.items())
+        for directory, keep in ((path.join(self.root, 'files'), keep_files),
+                                (path.join(self.root, 'objects'), keep_objects)):
+            for parent, dirs, names in os.walk(directory, topdown=False):
+                for name in names:
+                    if path.normcase(path.join(parent, name)) not in keep:
+                        os.remove(path.join(parent, name))
+                if parent != directory and not os.listdir(parent):
+                    os.rmdir(parent)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Keeps a local cache of the audio of an observer\'s upcoming passes')
+    parser.add_argument('observer', type=int, help='Id of the installation\'s observer')
+    parser.add_argument('--api', default=os.getenv('APMAN_API_URL'),
+                        help='Base url of the api, e.g. https://example.org/api/ (default: $APMAN_API_URL)')
+    parser.add_argument('-d', '--dir', default=os.getenv('APMAN_AUDIO_CACHE', 'audiocache'),
+                        help='Cache directory; the player opens files/<audiofile> in it (default: $APMAN_AUDIO_CACHE '
+                             'or ./audiocache)')
+    parser.add_argument('--hours', type=float,
+                        help='Fetch the audio of passes rising within this many hours (default: the server\'s)')
+    parser.add_argument('-i', '--interval', type=int, default=0,
+                        help='Sync again every this many seconds (default: once)')
+    parser.add_argument('--no-prune', action='store_true', help='Keep files no longer in the manifest')
+    args = parser.parse_args(argv)
+    if not args.api:
+        parser.error('no api url: pass --api or set APMAN_API_URL')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    url = '%s/audiomanifest/?observer=%s' % (args.api.rstrip('/'), args.observer)
+    if args.hours is not None:
+        url += '&hours=%s' % args.hours
+    cache = AudioCache(args.dir)
+    while True:
+        try:
+            fetched, failed = cache.sync(url, prune=not args.no_prune)
+            logger.info('fetched %s, failed %s' % (fetched, failed))
+        except (AudioCacheError, requests.RequestException, ValueError) as e:
+            # e.g. offline: whatever is cached already still plays
+            logger.error('could not sync: %s' % e)
+            if not args.interval:
+                return 1
+        if not args.interval:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,11 @@
+from collections import defaultdict
+
 from django.contrib import admin
 
 # from django.db.models import F, ExpressionWrapper, fields
+from satsound.caching import bump_trajectory_versions
 from satsound.models import *
+from satsound.timezones import timezone_at
 
 
 class SatelliteTrajectoryInline(admin.StackedInline):
@@ -24,12 +28,23 @@ class SatelliteAdmin(admin.ModelAdmin):
 
 
 class SatCatCacheAdmin(admin.ModelAdmin):
-    list_display = ['norad_id', 'name', ]
+    list_display = ['norad_id', 'name', 'intldes', 'country', 'decay', ]
+    search_fields = ['=norad_id', 'name', ]
+
+
+class SyncWatermarkAdmin(admin.ModelAdmin):
+    list_display = ['name', 'synced', ]
+
+
+class TwoLineElementAdmin(admin.ModelAdmin):
+    list_display = ['norad_id', 'epoch', 'created', ]
+    search_fields = ['=norad_id', ]
 
 
 class SatelliteAudioAdmin(admin.ModelAdmin):
-    list_display = ['__unicode__', 'satellite', 'user', 'type', 'reviewed', ]
+    list_display = ['__unicode__', 'satellite', 'user', 'type', 'reviewed', 'duration', 'processed', ]
     list_filter = ['type', 'reviewed', ]
+    readonly_fields = ['rendition', 'duration', 'peak', 'processed', ]
     list_select_related = True
 
 
@@ -65,14 +80,47 @@ class SatelliteTrajectoryAdmin(admin.ModelAdmin):
     halfdiff.short_description = u'half diff (s)'
 
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['__unicode__', 'task', 'status', 'attempts', 'run_at', 'finished', ]
+    list_filter = ['status', 'task', ]
+    readonly_fields = ['worker', 'started', 'finished', 'error', ]
+    actions = ['retry', ]
+
+    def retry(self, request, queryset):
+        queryset.exclude(status=Job.RUNNING).update(status=Job.PENDING, attempts=0, run_at=timezone.now())
+
+    retry.short_description = u'Run selected jobs again'
+
+
 class ObserverAdmin(admin.ModelAdmin):
     list_display = ['__unicode__', 'lat', 'lon', 'timezone', 'active', ]
     readonly_fields = ('timezone',)
     list_select_related = True
+    actions = ['update_timezone', ]
+
+    def update_timezone(self, request, queryset):
+        # one UPDATE per timezone; observers at the same coordinates are looked up once, and those with no timezone
+        # near keep theirs as in Observer.save
+        observers = defaultdict(list)
+        for pk, lat, lon in queryset.values_list('pk', 'lat', 'lon'):
+            observers[timezone_at(lat, lon)].append(pk)
+        observers.pop(None, None)
+        updated = []
+        for name, pks in observers.items():
+            changed = Observer.objects.filter(pk__in=pks).exclude(timezone=name)
+            updated.extend(changed.values_list('pk', flat=True))
+            changed.update(timezone=name)
+        # update() skips Observer.save: cached feeds would keep the old local times until they expire
+        bump_trajectory_versions(updated)
+
+    update_timezone.short_description = u'Look up timezones of selected observers again'
 
 
 admin.site.register(Satellite, SatelliteAdmin)
 admin.site.register(SatCatCache, SatCatCacheAdmin)
+admin.site.register(TwoLineElement, TwoLineElementAdmin)
+admin.site.register(SyncWatermark, SyncWatermarkAdmin)
+admin.site.register(Job, JobAdmin)
 admin.site.register(SatelliteTrajectory, SatelliteTrajectoryAdmin)
 admin.site.register(SatelliteAudio, SatelliteAudioAdmin)
 admin.site.register(Observer, ObserverAdmin)
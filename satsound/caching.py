@@ -0,0 +1,88 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+TRAJECTORY_VERSION_KEY = 'satsound:trajectories:version:%s'
+TRAJECTORY_RESPONSE_KEY = 'satsound:trajectories:page:%s:%s:%s:%s'  # (data, Link header)
+SATCAT_VERSION_KEY = 'satsound:satcat:version'
+TRAJECTORY_HITS_KEY = 'satsound:trajectories:hits'
+TRAJECTORY_MISSES_KEY = 'satsound:trajectories:misses'
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # missing or evicted
+        cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # no cache to count in; the stats are only advisory
+        return None
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # missing or evicted: anything cached before is older than now
+        now = int(time.time() * 1000)
+        cache.add(key, now, None)
+        version = cache.get(key)
+        if version is None:
+            # no cache (down, or DummyCache) to remember changes by: treat everything as changed now
+            version = now
+    return version
+
+
+def trajectory_version(observer_id):
+    """Current version of an observer's trajectory feed; cached responses of older versions are never read again.
+    Versions are the time of the last change in milliseconds, so they also serve as Last-Modified."""
+    return _version(TRAJECTORY_VERSION_KEY % observer_id)
+
+
+def bump_trajectory_versions(observer_ids):
+    """Invalidates the cached feeds of observer_ids, e.g. after their trajectories or audio changed"""
+    now = int(time.time() * 1000)
+    keys = [TRAJECTORY_VERSION_KEY % observer_id for observer_id in observer_ids]
+    versions = cache.get_many(keys)
+    cache.set_many(dict((key, max(now, versions.get(key, 0) + 1)) for key in keys), None)
+
+
+def trajectory_bucket():
+    # start (epoch seconds) of the current time bucket; feed responses are computed at most once per bucket
+    return int(time.time() // settings.TRAJECTORY_CACHE_BUCKET) * settings.TRAJECTORY_CACHE_BUCKET
+
+
+def trajectory_response_key(observer_id, request):
+    """Cache key of a feed response: observer, feed version, time bucket, the rest of the query and the format, which
+    may come from Accept rather than the query"""
+    query = '%s:%s' % (request.get_full_path(), request.accepted_renderer.format)
+    query = hashlib.md5(query.encode('utf-8')).hexdigest()
+    return TRAJECTORY_RESPONSE_KEY % (observer_id, trajectory_version(observer_id), trajectory_bucket(), query)
+
+
+def count_trajectory_hit(hit):
+    _incr(TRAJECTORY_HITS_KEY if hit else TRAJECTORY_MISSES_KEY)
+
+
+def trajectory_cache_stats():
+    """Returns (hits, misses) of the trajectory feed cache since the counters were last reset"""
+    counts = cache.get_many([TRAJECTORY_HITS_KEY, TRAJECTORY_MISSES_KEY])
+    return counts.get(TRAJECTORY_HITS_KEY, 0), counts.get(TRAJECTORY_MISSES_KEY, 0)
+
+
+def reset_trajectory_cache_stats():
+    cache.delete_many([TRAJECTORY_HITS_KEY, TRAJECTORY_MISSES_KEY])
+
+
+def satcat_version():
+    """Current version of SatCatCache, bumped whenever pop_satcache changes it; e.g. the name index is rebuilt when
+    it changes"""
+    return _version(SATCAT_VERSION_KEY)
+
+
+def bump_satcat_version():
+    cache.set(SATCAT_VERSION_KEY, max(int(time.time() * 1000), (cache.get(SATCAT_VERSION_KEY) or 0) + 1), None)
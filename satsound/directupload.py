@@ -0,0 +1,51 @@
+from os import path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.crypto import get_random_string
+
+
+def s3_key(name):
+    # storage name -> bucket key, e.g. prefixed with the 'media' location of MediaRootS3BotoStorage
+    return default_storage._normalize_name(default_storage._clean_name(name))
+
+
+def available_name(name):
+    # like Storage.get_available_name, which S3Boto3Storage skips as it overwrites files: a browser uploading under
+    # a name already taken (e.g. another upload for the same satellite in the same second) would replace that file
+    root, ext = path.splitext(name)
+    while default_storage.exists(name):
+        name = '%s_%s%s' % (root, get_random_string(7), ext)
+    return name
+
+
+def presigned_post(name, content_type):
+    """Returns the url and form fields with which a browser can POST an audio file of up to
+    settings.MAX_AUDIOFILE_SIZE straight to the bucket as storage name, for settings.AUDIO_UPLOAD_EXPIRY seconds.
+    The object is private until completing the upload has checked it (see make_public)."""
+    client = default_storage.connection.meta.client
+    return client.generate_presigned_post(
+        default_storage.bucket_name, s3_key(name),
+        Fields={'acl': 'private', 'Content-Type': content_type},
+        Conditions=[
+            {'acl': 'private'},
+            ['starts-with', '$Content-Type', 'audio/'],
+            ['content-length-range', 1, settings.MAX_AUDIOFILE_SIZE],
+        ],
+        ExpiresIn=settings.AUDIO_UPLOAD_EXPIRY,
+    )
+
+
+def uploaded_object(name):
+    return default_storage.bucket.Object(s3_key(name))
+
+
+def make_public(name):
+    # the ACL the storage gives the files it saves itself
+    uploaded_object(name).Acl().put(ACL=default_storage.default_acl)
+
+
+def read_header(name):
+    # a ranged GET: only the bytes needed to detect the type, rather than the whole object
+    body = uploaded_object(name).get(Range='bytes=0-%s' % (settings.AUDIO_SNIFF_SIZE - 1))['Body']
+    return body.read()
@@ -1,4 +1,7 @@
+import mimetypes
+
 from django import forms
+from django.conf import settings
 from django.forms import ModelForm
 
 from .models import SatelliteAudio
@@ -10,3 +13,21 @@ class SatelliteAudioForm(ModelForm):
     class Meta:
         model = SatelliteAudio
         exclude = ['satellite', 'user', 'reviewed', ]
+
+
+class DirectAudioUploadForm(forms.Form):
+    # what the browser declares before uploading straight to S3; the upload itself is checked on completion
+    attribution = forms.CharField(max_length=100, required=False)
+    type = forms.TypedChoiceField(choices=SatelliteAudio.TYPES, coerce=int)
+    filename = forms.CharField(max_length=255)
+    size = forms.IntegerField(min_value=1, max_value=settings.MAX_AUDIOFILE_SIZE)
+    content_type = forms.CharField(max_length=100, required=False)
+
+    def clean(self):
+        cleaned_data = super(DirectAudioUploadForm, self).clean()
+        # browsers don't know the type of every audio file; the bucket only takes audio/ ones (see presigned_post)
+        content_type = cleaned_data.get('content_type') or mimetypes.guess_type(cleaned_data.get('filename', ''))[0]
+        if not (content_type or '').startswith('audio/'):
+            self.add_error('content_type', 'Not an audio file.')
+        cleaned_data['content_type'] = content_type
+        return cleaned_data
@@ -0,0 +1,36 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+@contextmanager
+def scratch_database(verbosity=0):
+    """Runs the block against a new, migrated database like the test runner's (e.g. test_<NAME>), destroyed
+    afterwards, so that a benchmark seeding its own data never touches real rows"""
+    name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=verbosity)
+
+
+def timed(func, runs):
+    """Calls func runs times; returns the seconds each call took, fastest first"""
+    times = []
+    for i in range(runs):
+        started = time.time()
+        func()
+        times.append(time.time() - started)
+    return sorted(times)
+
+
+def percentile(times, p):
+    # of times sorted fastest first, nearest rank
+    return times[min(len(times) - 1, int(len(times) * p / 100.0))]
+
+
+def summary(times):
+    return 'p50 %.2f ms, p99 %.2f ms, min %.2f ms' % (
+        percentile(times, 50) * 1000, percentile(times, 99) * 1000, times[0] * 1000)
@@ -0,0 +1,64 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from satsound.management.commands.fake_spacetrack import Catalog
+from satsound.resources.satelliteinfo import SatCatJSONRenderer
+from satsound.satcat import typed_satcat
+
+
+def is_float(s):
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+
+class InferredSatCatSerializer(serializers.Serializer):
+    """SatCatSerializer as it was before satcat.TYPES: field types guessed from the first row, rows serialized field
+    by field"""
+
+    def __init__(self, *args, **kwargs):
+        if 'instance' in kwargs and len(kwargs['instance']) > 0:
+            for field in kwargs['instance'][0]:
+                self.fields[field] = serializers.CharField()
+                if kwargs['instance'][0][field] is not None:
+                    if kwargs['instance'][0][field].isnumeric():
+                        self.fields[field] = serializers.IntegerField()
+                    elif is_float(kwargs['instance'][0][field]):
+                        self.fields[field] = serializers.FloatField()
+
+        super(InferredSatCatSerializer, self).__init__(*args, **kwargs)
+
+
+class Command(BaseCommand):
+    help = ('Times converting and rendering a synthetic satcat dump (see fake_spacetrack) as /api/satelliteinfo '
+            'did with the inferred serializer and does with satcat.typed_satcat')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--objects', type=int, default=60000, help='Number of catalog objects')
+        parser.add_argument('-r', '--runs', type=int, default=3, help='Times each is run; the best is reported')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic catalog')
+
+    def handle(self, *args, **kwargs):
+        # as space-track sends it: every value a string
+        dump = json.dumps(Catalog(kwargs['objects'], kwargs['seed']).rows['satcat'])
+        self.stdout.write('%s rows, best of %s runs:' % (kwargs['objects'], kwargs['runs']))
+        for label, convert, renderer in (
+            ('inferred serializer', lambda rows: InferredSatCatSerializer(instance=rows, many=True).data,
+             JSONRenderer),
+            ('typed_satcat, DRF JSONRenderer', typed_satcat, JSONRenderer),
+            ('typed_satcat, SatCatJSONRenderer', typed_satcat, SatCatJSONRenderer),
+        ):
+            times = []
+            for i in range(kwargs['runs']):
+                # converted in place: a fresh copy each run, parsed before timing
+                rows = json.loads(dump)
+                started = time.time()
+                body = renderer().render(convert(rows))
+                times.append(time.time() - started)
+            self.stdout.write('%s: %.2f s, %s bytes' % (label, min(times), len(body)))
@@ -0,0 +1,41 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from satsound.management.benchmark import summary, timed
+from satsound.management.commands.fake_spacetrack import Catalog
+from satsound.search import NameIndex
+
+
+def typed(name, rnd, typos):
+    # what someone has typed so far of name: a prefix of it, with two neighbouring letters swapped at the rate typos
+    prefix = name[:rnd.randint(2, len(name))]
+    if len(prefix) > 2 and rnd.random() < typos:
+        i = rnd.randint(0, len(prefix) - 2)
+        prefix = prefix[:i] + prefix[i + 1] + prefix[i] + prefix[i + 2:]
+    return prefix
+
+
+class Command(BaseCommand):
+    help = ('Times building the satellite name index over the names of a synthetic catalog (see fake_spacetrack) '
+            'and the typeahead queries of /api/satellitesearch/ against it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--objects', type=int, default=50000, help='Number of catalog objects')
+        parser.add_argument('-q', '--queries', type=int, default=3000, help='Number of typed queries')
+        parser.add_argument('--typos', type=float, default=0.3, help='Share of queries with a transposition')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the catalog and the queries')
+
+    def handle(self, *args, **kwargs):
+        entries = [(int(row['NORAD_CAT_ID']), row['SATNAME'])
+                   for row in Catalog(kwargs['objects'], kwargs['seed']).rows['satcat']]
+        started = time.time()
+        index = NameIndex(entries)
+        self.stdout.write('built the index of %s names in %.2f s' % (len(entries), time.time() - started))
+
+        rnd = random.Random(kwargs['seed'])
+        queries = iter([typed(rnd.choice(entries)[1], rnd, kwargs['typos']) for i in range(kwargs['queries'])])
+        times = timed(lambda: index.search(next(queries), settings.SEARCH_DEFAULT_LIMIT), kwargs['queries'])
+        self.stdout.write('%s queries: %s' % (kwargs['queries'], summary(times)))
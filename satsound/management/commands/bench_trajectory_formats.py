@@ -0,0 +1,96 @@
+import csv
+import gzip
+import io
+import json
+import re
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from satsound.management.benchmark import scratch_database, timed
+from satsound.models import *
+from satsound.resources.satellitetrajectories import msgpack
+
+PARSERS = {
+    'json': json.loads,
+    'columns': json.loads,
+    'csv': lambda body: list(csv.reader(io.BytesIO(body))),
+    'msgpack': lambda body: msgpack.unpackb(body, raw=False),
+}
+
+
+def gzipped_size(body):
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(body)
+    return len(out.getvalue())
+
+
+class Command(BaseCommand):
+    help = ('Compares the size of the trajectory feed and the time to serve and parse it in each of its formats, '
+            'on a scratch database seeded with one observer\'s synthetic passes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--trajectories', type=int, default=1500, help='Number of trajectories to seed')
+        parser.add_argument('--days', type=int, default=7, help='Days ahead the passes are spread over')
+        parser.add_argument('-r', '--runs', type=int, default=5, help='Times each is run; the best is reported')
+
+    def seed(self, trajectories, days):
+        user = User.objects.create_user('bench')
+        # without save(), which would queue computing the observer's passes
+        Observer.objects.bulk_create([Observer(user=user, lat='51.5', lon='-0.1', timezone='Europe/London')])
+        observer = Observer.objects.get()
+        satellites = Satellite.objects.bulk_create(Satellite(norad_id=i, name='SAT %s' % i) for i in range(1, 201))
+        SatelliteAudio.objects.bulk_create(
+            SatelliteAudio(satellite=satellite, user=user, type=1, audio='%s/a.wav' % satellite.pk, reviewed=True)
+            for satellite in satellites[::2]
+        )
+        audios = dict(SatelliteAudio.objects.values_list('satellite', 'pk'))
+        now = timezone.now()
+        interval = days * 86400.0 / trajectories
+        SatelliteTrajectory.objects.bulk_create(
+            SatelliteTrajectory(
+                satellite_id=i % 200 + 1, observer=observer, audio_id=audios.get(i % 200 + 1),
+                rise_time=now + timedelta(seconds=60 + i * interval), rise_azimuth='%.6f' % (i * 7.3 % 360),
+                maxalt_time=now + timedelta(seconds=360 + i * interval), maxalt_altitude='%.6f' % (i * 1.7 % 90),
+                set_time=now + timedelta(seconds=660 + i * interval), set_azimuth='%.6f' % (i * 11.1 % 360),
+            )
+            for i in range(trajectories)
+        )
+        return observer
+
+    def pages(self, client, url):
+        """Fetches every page of the feed at url, following the Link header; returns their bodies"""
+        bodies = []
+        while url:
+            response = client.get(url)
+            assert response.status_code == 200, response.content
+            bodies.append(response.content)
+            url = dict((rel, link) for link, rel in re.findall(r'<([^>]+)>; rel="(\w+)"', response.get('Link', '')))
+            url = url.get('next')
+        return bodies
+
+    def handle(self, *args, **kwargs):
+        formats = ['json', 'columns', 'csv'] + (['msgpack'] if msgpack is not None else [])
+        setup_test_environment()
+        try:
+            # every request computed rather than served from the cache, which stays untouched
+            with scratch_database(), override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+                observer = self.seed(kwargs['trajectories'], kwargs['days'])
+                client = Client()
+                url = '/api/satellitetrajectories/?observer=%s&rise_time_window=%s' % (observer.pk,
+                                                                                     kwargs['days'] * 86400)
+                self.stdout.write('%s trajectories, best of %s runs' % (kwargs['trajectories'], kwargs['runs']))
+                self.stdout.write('%-8s %5s %10s %10s %10s %12s' % ('format', 'pages', 'bytes', 'gzip', 'server',
+                                                                    'client parse'))
+                for fmt in formats:
+                    bodies = self.pages(client, '%s&format=%s' % (url, fmt))
+                    server = timed(lambda: self.pages(client, '%s&format=%s' % (url, fmt)), kwargs['runs'])[0]
+                    parse = timed(lambda: [PARSERS[fmt](body) for body in bodies], kwargs['runs'])[0]
+                    self.stdout.write('%-8s %5s %10s %10s %7.0f ms %9.1f ms' % (
+                        fmt, len(bodies), sum(len(body) for body in bodies),
+                        sum(gzipped_size(body) for body in bodies), server * 1000, parse * 1000))
+        finally:
+            teardown_test_environment()
@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from satsound.management.benchmark import scratch_database, summary, timed
+from satsound.models import *
+
+
+class Command(BaseCommand):
+    help = ('Times the first page of the trajectory feed query on a scratch database seeded with synthetic '
+            'trajectories, with the SatelliteTrajectory indexes and again without them')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--trajectories', type=int, default=1000000, help='Number of trajectories to seed')
+        parser.add_argument('--satellites', type=int, default=500, help='Number of satellites to seed')
+        parser.add_argument('--observers', type=int, default=40, help='Number of observers to seed')
+        parser.add_argument('--days', type=int, default=10,
+                            help='Days the passes are spread over, from three days ago')
+        parser.add_argument('-r', '--runs', type=int, default=20, help='Times each query is run')
+
+    def seed(self, trajectories, satellites, observers, days):
+        users = User.objects.bulk_create(User(username='bench%s' % i) for i in range(observers))
+        users = User.objects.filter(username__in=[user.username for user in users])
+        Observer.objects.bulk_create(Observer(user=user, lat='51.5', lon='-0.1') for user in users)
+        Satellite.objects.bulk_create(Satellite(norad_id=i, name='SAT %s' % i) for i in range(1, satellites + 1))
+        observer_ids = list(Observer.objects.values_list('pk', flat=True))
+
+        # each satellite passes over each observer at regular intervals, out of step with the others
+        pairs = [(satellite, observer) for satellite in range(1, satellites + 1) for observer in observer_ids]
+        passes = max(1, trajectories // len(pairs))
+        interval = days * 86400.0 / passes
+        start = timezone.now() - timedelta(days=3)
+
+        def rows():
+            for k, (satellite, observer) in enumerate(pairs):
+                offset = interval * k / len(pairs)
+                for i in range(passes):
+                    rise = start + timedelta(seconds=offset + i * interval)
+                    yield SatelliteTrajectory(
+                        satellite_id=satellite, observer_id=observer, rise_time=rise, rise_azimuth=10,
+                        maxalt_time=rise + timedelta(minutes=5), maxalt_altitude=45,
+                        set_time=rise + timedelta(minutes=10), set_azimuth=200,
+                    )
+
+        for batch in iter_batches(rows(), 10000):
+            SatelliteTrajectory.objects.bulk_create(batch)
+        return observer_ids
+
+    def measure(self, observer_ids, runs):
+        # the feed's first page: an observer's passes rising within the default window, by rise time
+        now = timezone.now()
+        window = (now, now + timedelta(seconds=settings.TRAJECTORY_DEFAULT_WINDOW))
+        queries = {
+            'observer': lambda observer: SatelliteTrajectory.objects.filter(observer=observer),
+            'observer + satellite': lambda observer: SatelliteTrajectory.objects.filter(observer=observer,
+                                                                                      satellite=1),
+        }
+        results = []
+        for label, query in sorted(queries.items()):
+            observers = iter(observer_ids * runs)
+
+            def page():
+                trajectories = query(next(observers)).filter(rise_time__range=window).order_by('rise_time')
+                return list(trajectories.values_list('pk', flat=True)[:settings.TRAJECTORY_PAGE_SIZE + 1])
+
+            page()  # warm up
+            results.append((label, timed(page, runs)))
+        return results
+
+    def handle(self, *args, **kwargs):
+        with scratch_database():
+            started = time.time()
+            observer_ids = self.seed(kwargs['trajectories'], kwargs['satellites'], kwargs['observers'],
+                                     kwargs['days'])
+            self.stdout.write('seeded %s trajectories in %.0f s' % (SatelliteTrajectory.objects.count(),
+                                                                    time.time() - started))
+            for label, times in self.measure(observer_ids, kwargs['runs']):
+                self.stdout.write('with indexes, %s: %s' % (label, summary(times)))
+
+            with connection.schema_editor() as editor:
+                for index in SatelliteTrajectory._meta.indexes:
+                    editor.remove_index(SatelliteTrajectory, index)
+            for label, times in self.measure(observer_ids, kwargs['runs']):
+                self.stdout.write('without indexes, %s: %s' % (label, summary(times)))
@@ -0,0 +1,76 @@
+import pytz
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+
+from satsound.management.benchmark import timed
+from satsound.models import *
+from satsound.resources.satellitetrajectories import FlatSatelliteTrajectorySerializer
+
+
+def field_local_time(obj, time):
+    # a time field as each of them was formatted before local_times: its observer's timezone looked up every time
+    return time.astimezone(pytz.timezone(obj.observer.timezone)).strftime(settings.TRAJECTORY_TIME_FORMAT)
+
+
+class FieldTimesSerializer(FlatSatelliteTrajectorySerializer):
+    """FlatSatelliteTrajectorySerializer as it was before local_times: times converted and formatted field by field"""
+
+    def get_rise_time(self, obj):
+        return field_local_time(obj, obj.rise_time)
+
+    def get_maxalt_time(self, obj):
+        return field_local_time(obj, obj.maxalt_time)
+
+    def get_set_time(self, obj):
+        return field_local_time(obj, obj.set_time)
+
+    class Meta(FlatSatelliteTrajectorySerializer.Meta):
+        list_serializer_class = serializers.ListSerializer
+
+
+class Command(BaseCommand):
+    help = ('Times converting a page of trajectories to local time and serializing it, field by field as the feed '
+            'did and a page at a time as it does now (in memory, no database)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-n', '--trajectories', type=int, default=settings.TRAJECTORY_PAGE_SIZE,
+                            help='Trajectories on the page')
+        parser.add_argument('--timezone', default='America/New_York', help='Timezone of the observer')
+        parser.add_argument('-r', '--runs', type=int, default=5, help='Times each is run; the best is reported')
+
+    def handle(self, *args, **kwargs):
+        user = User(pk=1, username='bench')
+        observer = Observer(pk=1, user=user, lat='40.7', lon='-74', timezone=kwargs['timezone'])
+        now = timezone.now()
+        trajectories = []
+        for i in range(kwargs['trajectories']):
+            satellite = Satellite(norad_id=i + 1, name='SAT %s' % i)
+            # every other one with audio, as in the feed tests
+            audio = SatelliteAudio(pk=i + 1, satellite=satellite, user=user, type=1, reviewed=True,
+                                   audio='%s/a.wav' % satellite.pk) if i % 2 else None
+            rise = now + timedelta(minutes=10 * i)
+            trajectories.append(SatelliteTrajectory(
+                pk=i + 1, satellite=satellite, observer=observer, audio=audio, rise_time=rise, rise_azimuth=10,
+                maxalt_time=rise + timedelta(minutes=5), maxalt_altitude=45, set_time=rise + timedelta(minutes=10),
+                set_azimuth=200,
+            ))
+
+        def field_times():
+            return [(field_local_time(obj, obj.rise_time), field_local_time(obj, obj.maxalt_time),
+                     field_local_time(obj, obj.set_time)) for obj in trajectories]
+
+        def page_times():
+            return FlatSatelliteTrajectorySerializer(context={}).local_times(trajectories)
+
+        runs = kwargs['runs']
+        per_row = 1e6 / len(trajectories)
+        self.stdout.write('%s trajectories in %s, best of %s runs, per row:' % (len(trajectories), kwargs['timezone'],
+                                                                             runs))
+        self.stdout.write('rise/maxalt/set times: %.1f us -> %.1f us' % (timed(field_times, runs)[0] * per_row,
+                                                                        timed(page_times, runs)[0] * per_row))
+        before = timed(lambda: FieldTimesSerializer(trajectories, many=True).data, runs)[0]
+        after = timed(lambda: FlatSatelliteTrajectorySerializer(trajectories, many=True).data, runs)[0]
+        self.stdout.write('whole row: %.1f us -> %.1f us' % (before * per_row, after * per_row))
+        same = (FieldTimesSerializer(trajectories, many=True).data ==
+                FlatSatelliteTrajectorySerializer(trajectories, many=True).data)
+        self.stdout.write('same rows: %s' % same)
@@ -0,0 +1,269 @@
+import datetime
+import json
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.six.moves import BaseHTTPServer, socketserver
+from django.utils.six.moves.urllib.parse import unquote
+
+SESSION_COOKIE = 'chocolatechip=fake'
+# request class: fields (Space-Track modeldef order, all served as strings like the real api)
+CLASSES = {
+    'satcat': ('INTLDES', 'NORAD_CAT_ID', 'OBJECT_TYPE', 'SATNAME', 'COUNTRY', 'LAUNCH', 'SITE', 'DECAY', 'PERIOD',
+               'INCLINATION', 'APOGEE', 'PERIGEE', 'COMMENT', 'COMMENTCODE', 'RCSVALUE', 'RCS_SIZE', 'FILE',
+               'LAUNCH_YEAR', 'LAUNCH_NUM', 'LAUNCH_PIECE', 'CURRENT', 'OBJECT_NAME', 'OBJECT_ID', 'OBJECT_NUMBER'),
+    'tle_latest': ('ORDINAL', 'NORAD_CAT_ID', 'OBJECT_NAME', 'EPOCH', 'TLE_LINE0', 'TLE_LINE1', 'TLE_LINE2'),
+    'satcat_change': ('NORAD_CAT_ID', 'OBJECT_NUMBER', 'CURRENT_NAME', 'PREVIOUS_NAME', 'CURRENT_DECAY',
+                      'PREVIOUS_DECAY', 'CHANGE_MADE'),
+}
+CLASSES['satcat_debut'] = CLASSES['satcat'] + ('DEBUT',)
+INT_FIELDS = ('NORAD_CAT_ID', 'ORDINAL', 'OBJECT_NUMBER', 'LAUNCH_YEAR', 'LAUNCH_NUM', 'COMMENTCODE', 'RCSVALUE',
+              'FILE')
+COUNTRIES = ('US', 'CIS', 'PRC', 'FR', 'JPN', 'ESA', 'IND', 'UK')
+
+
+def tle_checksum(line):
+    return sum(int(c) if c.isdigit() else 1 if c == '-' else 0 for c in line) % 10
+
+
+def fake_tle(norad_id, intldes, epoch, rnd):
+    day = epoch.timetuple().tm_yday + (epoch.hour * 3600 + epoch.minute * 60 + epoch.second) / 86400.0
+    line1 = '1 %05dU %-8s %02d%012.8f  .00001234  00000-0  12345-3 0  999' % (
+        norad_id, intldes.replace('-', '')[2:], epoch.year % 100, day)
+    geo = norad_id % 50 == 0
+    line2 = '2 %05d %8.4f %8.4f %07d %8.4f %8.4f %11.8f%5d' % (
+        norad_id, 0.05 if geo else rnd.uniform(0, 99), rnd.uniform(0, 360), rnd.randint(1, 20000),
+        rnd.uniform(0, 360), rnd.uniform(0, 360), 1.00273791 if geo else rnd.uniform(13.5, 16), rnd.randint(0, 99999))
+    return '%s%s' % (line1, tle_checksum(line1)), '%s%s' % (line2, tle_checksum(line2))
+
+
+class Catalog(object):
+    """Deterministic synthetic catalog: satcat rows, their latest TLEs and recent satcat changes and debuts"""
+
+    def __init__(self, size, seed):
+        now = datetime.datetime.utcnow()
+        self.rows = dict((class_, []) for class_ in CLASSES)
+        for norad_id in range(1, size + 1):
+            rnd = random.Random(seed + norad_id)
+            year = 1957 + norad_id * 60 // (size + 1)
+            intldes = '%d-%03d%s' % (year, norad_id % 999 + 1, 'ABC'[norad_id % 3])
+            decayed = rnd.random() < 0.3
+            name = '%s %s' % (rnd.choice(('COSMOS', 'STARLINK', 'NOAA', 'IRIDIUM', 'GPS', 'SL-16 R/B', 'DEB')),
+                              norad_id)
+            self.rows['satcat'].append({
+                'INTLDES': intldes, 'NORAD_CAT_ID': str(norad_id), 'OBJECT_TYPE': 'PAYLOAD', 'SATNAME': name,
+                'COUNTRY': rnd.choice(COUNTRIES), 'LAUNCH': '%d-01-01' % year, 'SITE': 'AFETR',
+                'DECAY': '%d-06-01' % min(year + 5, now.year) if decayed else None, 'PERIOD': '95.50',
+                'INCLINATION': '51.60', 'APOGEE': '420', 'PERIGEE': '410', 'COMMENT': None, 'COMMENTCODE': None,
+                'RCSVALUE': '0', 'RCS_SIZE': 'LARGE', 'FILE': '1', 'LAUNCH_YEAR': str(year),
+                'LAUNCH_NUM': str(norad_id % 999 + 1), 'LAUNCH_PIECE': 'ABC'[norad_id % 3],
+                'CURRENT': 'Y', 'OBJECT_NAME': name, 'OBJECT_ID': intldes,
+                'OBJECT_NUMBER': str(norad_id),
+            })
+            row = self.rows['satcat'][-1]
+            if norad_id % 101 == 0:
+                # renamed or decayed within the last ten days
+                self.rows['satcat_change'].append({
+                    'NORAD_CAT_ID': row['NORAD_CAT_ID'], 'OBJECT_NUMBER': row['OBJECT_NUMBER'],
+                    'CURRENT_NAME': name, 'PREVIOUS_NAME': 'OBJECT %s' % norad_id, 'CURRENT_DECAY': row['DECAY'],
+                    'PREVIOUS_DECAY': None,
+                    'CHANGE_MADE': (now - datetime.timedelta(hours=norad_id % 240)).strftime('%Y-%m-%d %H:%M:%S'),
+                })
+            if norad_id > size * 0.99:
+                # the newest objects debuted within the last few days
+                debut = now - datetime.timedelta(hours=(size - norad_id) % 240)
+                self.rows['satcat_debut'].append(dict(row, DEBUT=debut.strftime('%Y-%m-%d %H:%M:%S')))
+            if not decayed:
+                epoch = now - datetime.timedelta(hours=rnd.uniform(0, 48))
+                line1, line2 = fake_tle(norad_id, intldes, epoch, rnd)
+                self.rows['tle_latest'].append({
+                    'ORDINAL': '1', 'NORAD_CAT_ID': str(norad_id), 'OBJECT_NAME': name,
+                    'EPOCH': epoch.strftime('%Y-%m-%d %H:%M:%S'), 'TLE_LINE0': '0 %s' % name, 'TLE_LINE1': line1,
+                    'TLE_LINE2': line2,
+                })
+
+    def query(self, class_, predicates):
+        rows = [row for row in self.rows[class_] if all(matches(row.get(k.upper()), v) for k, v in predicates)]
+        return rows
+
+
+def compare_value(field_value, value):
+    try:
+        return float(field_value), float(value)
+    except (TypeError, ValueError):
+        return field_value, value
+
+
+def resolve_now(value):
+    # now[-+]days, e.g. epoch/>now-30
+    if not value.startswith('now'):
+        return value
+    now = datetime.datetime.utcnow() + datetime.timedelta(days=float(value[3:] or 0))
+    return now.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def matches(field_value, value):
+    # https://www.space-track.org/documentation#/api: REST operators
+    if value == 'null-val':
+        return field_value is None
+    if value.startswith('<>'):
+        return field_value != value[2:]
+    if value.startswith('>') or value.startswith('<'):
+        if field_value is None:
+            return False
+        a, b = compare_value(field_value, resolve_now(value[1:]))
+        return a > b if value[0] == '>' else a < b
+    if field_value is None:
+        return False
+    if value.startswith('~~'):
+        return value[2:].lower() in field_value.lower()
+    if value.startswith('^'):
+        return field_value.lower().startswith(value[1:].lower())
+    if '--' in value:
+        lo, hi = value.split('--', 1)
+        a, b = compare_value(field_value, lo)
+        c, d = compare_value(field_value, hi)
+        return b <= a <= d
+    return any(compare_value(field_value, v)[0] == compare_value(field_value, v)[1] for v in value.split(','))
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    server_version = 'FakeSpaceTrack/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send(self, status, body, content_type='application/json', headers=()):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.count('login')
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path.rstrip('/') != '/ajaxauth/login':
+            return self.send(404, '""')
+        self.send(200, '""', headers=(('Set-Cookie', '%s; path=/' % SESSION_COOKIE),))
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if SESSION_COOKIE not in (self.headers.get('Cookie') or ''):
+            self.server.count('unauthorized')
+            return self.send(401, '{"error": "You must be logged in to complete this action"}')
+        if not self.server.allow():
+            self.server.count('throttled')
+            return self.send(500, '{"error": "You\'ve violated your query rate limit."}')
+
+        parts = [unquote(part) for part in self.path.strip('/').split('/')]
+        # /<controller>/modeldef/class/<class> or /<controller>/query/class/<class>/<predicate>/<value>/...
+        if len(parts) < 4 or parts[1] not in ('modeldef', 'query') or parts[3] not in CLASSES:
+            self.server.count('not found')
+            return self.send(404, '{"error": "unknown request"}')
+        class_ = parts[3]
+        self.server.count('%s %s' % (parts[1], class_))
+
+        if parts[1] == 'modeldef':
+            fields = [{
+                'Field': field,
+                'Type': 'int(10) unsigned' if field in INT_FIELDS else 'varchar(255)',
+                'Null': 'YES',
+                'Default': '',
+            } for field in CLASSES[class_]]
+            return self.send(200, json.dumps({'controller': parts[0], 'data': fields}))
+
+        predicates = list(zip(parts[4::2], parts[5::2]))
+        options = dict((k.lower(), v) for k, v in predicates)
+        rows = self.server.catalog.query(class_, [(k, v) for k, v in predicates if k.lower() not in (
+            'format', 'orderby', 'limit', 'metadata', 'emptyresult', 'predicates', 'distinct')])
+
+        if 'orderby' in options:
+            field, _, direction = options['orderby'].partition(' ')
+            rows.sort(key=lambda row: compare_value(row.get(field.upper()), '0')[0],
+                      reverse=direction.lower() == 'desc')
+        if 'limit' in options:
+            limit, _, offset = options['limit'].partition(',')
+            rows = rows[int(offset or 0):int(offset or 0) + int(limit)]
+
+        fmt = options.get('format', 'json')
+        if fmt in ('tle', '3le'):
+            lines = []
+            for row in rows:
+                if fmt == '3le':
+                    lines.append(row['TLE_LINE0'])
+                lines.extend((row['TLE_LINE1'], row['TLE_LINE2']))
+            return self.send(200, ''.join('%s\r\n' % line for line in lines), 'text/plain')
+        if fmt == 'csv':
+            fields = CLASSES[class_]
+            lines = [','.join('"%s"' % field for field in fields)]
+            lines.extend(','.join('"%s"' % (row[field] or '') for field in fields) for row in rows)
+            return self.send(200, ''.join('%s\r\n' % line for line in lines), 'text/csv')
+        return self.send(200, json.dumps(rows))
+
+
+class FakeSpaceTrackServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, catalog, latency=0, rate_limit=0, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.catalog = catalog
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.verbose = verbose
+        self.counts = {}
+        self.recent = []
+        self.lock = threading.Lock()
+
+    def count(self, what):
+        with self.lock:
+            self.counts[what] = self.counts.get(what, 0) + 1
+
+    def allow(self):
+        # enforce rate_limit requests per rolling minute, like Space-Track
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = time.time()
+            self.recent = [t for t in self.recent if t > now - 60]
+            if len(self.recent) >= self.rate_limit:
+                return False
+            self.recent.append(now)
+            return True
+
+
+class Command(BaseCommand):
+    help = ('Runs a local fake Space-Track api over a synthetic catalog, for tests and benchmarks '
+            '(set APMAN_SPACETRACK_URL=http://<addr>:<port>/)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-a', '--addr', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('-p', '--port', type=int, default=8001, help='Port to listen on')
+        parser.add_argument('-n', '--objects', type=int, default=20000, help='Number of catalog objects')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic catalog')
+        parser.add_argument('--latency', type=float, default=0, help='Seconds to delay each query')
+        parser.add_argument('--rate-limit', type=int, default=0,
+                            help='Reject queries beyond this many per minute (default: no limit)')
+        parser.add_argument('--log-requests', action='store_true', help='Log every request')
+
+    def handle(self, *args, **kwargs):
+        catalog = Catalog(kwargs['objects'], kwargs['seed'])
+        server = FakeSpaceTrackServer((kwargs['addr'], kwargs['port']), catalog, kwargs['latency'],
+                                      kwargs['rate_limit'], kwargs['log_requests'])
+        self.stdout.write('Fake Space-Track with %s objects at http://%s:%s/' % (
+            kwargs['objects'], kwargs['addr'], kwargs['port']))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            for what in sorted(server.counts):
+                self.stdout.write('%s: %s' % (what, server.counts[what]))
@@ -1,27 +1,23 @@
 from django.core.management.base import BaseCommand
 
-# import json
 from satsound.models import *
 
+logger = logging.getLogger('commands')  # __name__
+
 
 class Command(BaseCommand):
-    help = 'Populates db cache of satcat info from space-track for getting info before satellite is created'
+    help = ('Updates db cache of satcat info from space-track for getting info before satellite is created '
+            '(only what changed since the last run, unless --full)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('-f', '--full', action='store_true',
+                            help='Stream the whole on-orbit catalog rather than the changes since the last run')
+        parser.add_argument('-b', '--bin', type=int, default=400,
+                            help='Specify number of changed satellite IDs to request per query')
 
     def handle(self, *args, **kwargs):
-        SatCatCache.objects.all().delete()
-        st = SpaceTrackClient(identity=settings.SPACETRACK_IDENTITY, password=settings.SPACETRACK_PASSWORD)
-        params = {
-            'metadata': False,
-            'orderby': 'NORAD_CAT_ID%20asc',
-            'decay': 'null-val',
-            'current': 'Y'
-            # 'norad_cat_id': 25544,
-            # 'iter_lines': True
-        }
-        # basicspacedata/query/class/satcat/orderby/NORAD_CAT_ID%20asc/format/null/metadata/false
-        response = st.satcat(**params)
-        # for line in response:
-        #     sat = json.loads(line)[0]
-        #     SatCatCache.objects.create(norad_id=sat['NORAD_CAT_ID'], name=sat['OBJECT_NAME'])
-        satcache = [SatCatCache(norad_id=sat['NORAD_CAT_ID'], name=sat['OBJECT_NAME']) for sat in response]
-        SatCatCache.objects.bulk_create(satcache)
+        logger.info('pop_satcache triggered')
+        upserted, deleted = SatCatCache.objects.sync(full=kwargs['full'], bin_size=kwargs['bin'])
+        msg = 'pop_satcache upserted %s, deleted %s' % (upserted, deleted)
+        logger.info(msg)
+        self.stdout.write(msg)
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from satsound.models import *
+
+logger = logging.getLogger('commands')  # __name__
+
+
+class Command(BaseCommand):
+    help = ('Renders the delivery renditions (loudness normalized, compact) of audio not yet processed, so uploads '
+            'never wait on ffmpeg')
+
+    def add_arguments(self, parser):
+        parser.add_argument('ids', nargs='*', type=int, help='Process only this audio (by id), processed or not')
+        parser.add_argument('-a', '--all', action='store_true',
+                            help='Process all audio again, e.g. after changing the rendition settings')
+
+    def handle(self, *args, **kwargs):
+        logger.info('process_audio triggered')
+        audios = SatelliteAudio.objects.select_related('satellite').order_by('pk')
+        if kwargs['ids']:
+            audios = audios.filter(pk__in=kwargs['ids'])
+        elif not kwargs['all']:
+            audios = audios.filter(processed__isnull=True)
+
+        processed = failed = 0
+        for audio in audios:
+            try:
+                audio.process()
+                processed += 1
+            except RenditionError as e:
+                failed += 1
+                logger.error('process_audio could not render audio %s (%s): %s' % (audio.pk, audio.audio.name, e))
+            except Exception:
+                # e.g. storage errors: left unprocessed to be tried again next run
+                failed += 1
+                logger.exception('process_audio failed on audio %s (%s)' % (audio.pk, audio.audio.name))
+
+        msg = 'process_audio rendered %s, failed %s' % (processed, failed)
+        logger.info(msg)
+        self.stdout.write(msg)
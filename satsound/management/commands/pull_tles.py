@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from satsound.models import *
+
+logger = logging.getLogger('commands')  # __name__
+
+
+class Command(BaseCommand):
+    help = 'Pulls the latest TLEs from space-track into the local store (refresh_trajectories also does this)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--bin', type=int, default=400,
+                            help='Specify number of satellite IDs to request per query (with --tracked-only)')
+        parser.add_argument('-t', '--tracked-only', action='store_true',
+                            help='Pull the TLEs of satellites only, rather than of the whole catalog')
+
+    def handle(self, *args, **kwargs):
+        norad_ids = Satellite.objects.values_list('pk', flat=True) if kwargs['tracked_only'] else None
+        stored = TwoLineElement.objects.pull(norad_ids, kwargs['bin'])
+        logger.info('pull_tles stored %s new element sets' % stored)
+        self.stdout.write('%s new element sets' % stored)
@@ -1,4 +1,9 @@
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+
 from django.core.management.base import BaseCommand
+from django.db import connections
 
 from satsound.models import *
 
@@ -6,46 +11,98 @@ logger = logging.getLogger('commands')  # __name__
 
 
 class Command(BaseCommand):
-    help = 'Updates satellite TLEs and replaces all trajectories'
+    help = 'Updates satellite TLEs and replaces all trajectories (with --incremental, only those that changed)'
 
     def add_arguments(self, parser):
         parser.add_argument('-b', '--bin', type=int, default=400,
-                            help='Specify number of satellite IDs to request per query')
+                            help='Specify number of satellite IDs to request per query (with --tracked-only)')
+        parser.add_argument('-t', '--tracked-only', action='store_true',
+                            help='Pull the TLEs of satellites only, rather than of the whole catalog')
+        parser.add_argument('--no-pull', action='store_true',
+                            help='Use the TLEs already in the local store')
+        parser.add_argument('-w', '--workers', type=int, default=0,
+                            help='Predict passes in a pool of this many processes (default: in this process)')
+        parser.add_argument('--batch-size', type=int, default=settings.TRAJECTORY_BATCH_SIZE,
+                            help='Specify number of trajectories to insert per query')
+        parser.add_argument('-i', '--incremental', action='store_true',
+                            help='Keep upcoming trajectories of satellites whose TLE epoch has not changed and only '
+                                 'compute the newly exposed end of each observer\'s window')
+
+    def _predict(self, satellites, workers, batch_size):
+        # one task per (satellite, observer), or per satellite if the backend batches all observers at once;
+        # workers only compute, all db writes stay in this process
+        observers = [observer_params(observer) for observer in Observer.objects.all()]
+        groups = [observers] if get_backend().batch_observers else [[observer] for observer in observers]
+        incremental = dict((s.pk, i) for s, i in satellites)
+        satellites = [s for s, i in satellites if s.tle != '']
+        starts = dict((s.pk, s.trajectory_starts() if incremental[s.pk] else {}) for s in satellites)
+        tasks = [(s.pk, s.name, s.tle, group, starts[s.pk]) for s in satellites for group in groups]
+        pending = dict((s.pk, len(groups)) for s in satellites)
+        passes = defaultdict(dict)
+        stats = defaultdict(lambda: [0, 0, 0.0])  # pid: [tasks, passes, seconds]
+        satellites = dict((s.pk, s) for s in satellites)
+
+        # forked children must not share the parent's db connections
+        connections.close_all()
+        pool = Pool(processes=workers)
+        started = time.time()
+        try:
+            for norad_id, group_passes, pid, seconds in pool.imap_unordered(predict_passes, tasks):
+                passes[norad_id].update(group_passes)
+                stats[pid][0] += 1
+                stats[pid][1] += sum(len(observer_passes) for observer_passes in group_passes.values())
+                stats[pid][2] += seconds
+
+                pending[norad_id] -= 1
+                if pending[norad_id] == 0:
+                    satellites[norad_id].update_trajectories(
+                        passes=passes.pop(norad_id), batch_size=batch_size, incremental=incremental[norad_id]
+                    )
+        finally:
+            pool.close()
+            pool.join()
 
-    def _get_bincount(self, ids, binsize):
-        n, r = divmod(len(ids), binsize)
-        if r > 0:
-            n += 1
-        return n
+        elapsed = time.time() - started
+        for pid in sorted(stats):
+            count, npasses, seconds = stats[pid]
+            msg = 'worker %s: %s tasks, %s passes in %.1fs (%.1f tasks/s)' % (
+                pid, count, npasses, seconds, count / seconds if seconds else 0)
+            logger.info(msg)
+            self.stdout.write(msg)
+        msg = '%s tasks on %s workers in %.1fs (%.1f tasks/s)' % (
+            len(tasks), workers, elapsed, len(tasks) / elapsed if elapsed else 0)
+        logger.info(msg)
+        self.stdout.write(msg)
 
     def handle(self, *args, **kwargs):
-        st = SpaceTrackClient(identity=settings.SPACETRACK_IDENTITY, password=settings.SPACETRACK_PASSWORD)
-        ids = [s.pk for s in Satellite.objects.all()]
-        bincount = self._get_bincount(ids, kwargs['bin'])
+        satellites = list(Satellite.objects.all())
+        workers = kwargs['workers']
+        refreshed = []
         logger.info('refresh_trajectories triggered')
 
-        for i in range(0, bincount):
-            query_ids = ids[i * kwargs['bin']: (i + 1) * kwargs['bin']]
-            # logger.info('bin %s ids: %s' % (i, str(query_ids)))
-            # self.stdout.write(str(query_ids))
-            tles = st.tle_latest(iter_lines=True, ordinal=1, norad_cat_id=query_ids, format='tle')
-
-            tle = None
-            for line in tles:
-                if tle is None:
-                    tle = line
-                else:
-                    tle = '\n'.join([tle, line])
-                    norad_id = int(tle[2:7])
-                    try:
-                        s = Satellite.objects.get(pk=norad_id)
-                        s.tle = tle
-                        s.save()
-                        s.update_trajectories()
-                    except Satellite.DoesNotExist:
-                        logger.error('%s does not exist' % norad_id)
-                        # self.stdout.write('%s does not exist' % norad_id)
-
-                    tle = None
+        if not kwargs['no_pull']:
+            norad_ids = [s.pk for s in satellites] if kwargs['tracked_only'] else None
+            stored = TwoLineElement.objects.pull(norad_ids, kwargs['bin'])
+            logger.info('stored %s new element sets' % stored)
+
+        tles = TwoLineElement.objects.latest_tles([s.pk for s in satellites])
+        for s in satellites:
+            tle = tles.get(s.pk)
+            if tle is None:
+                logger.error('%s has no element set' % s.pk)
+                continue
+
+            # passes predicted from an element set with the same epoch are still valid
+            incremental = kwargs['incremental'] and tle_epoch(s.tle) == tle_epoch(tle)
+            if s.tle != tle:
+                s.tle = tle
+                s.save(update_fields=['tle', 'updated'])
+            if workers > 0:
+                refreshed.append((s, incremental))
+            else:
+                s.update_trajectories(batch_size=kwargs['batch_size'], incremental=incremental)
+
+        if workers > 0:
+            self._predict(refreshed, workers, kwargs['batch_size'])
 
         logger.info('refresh_trajectories finished')
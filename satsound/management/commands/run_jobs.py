@@ -0,0 +1,54 @@
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from satsound.models import *
+
+logger = logging.getLogger('commands')  # __name__
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (satellite setup, audio renditions, emails), polling for new ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no job is due, e.g. when run from cron, rather than keep polling')
+        parser.add_argument('-s', '--sleep', type=float, default=settings.JOB_POLL_INTERVAL,
+                            help='Seconds to wait before polling again when no job is due')
+
+    def handle(self, *args, **kwargs):
+        worker = '%s:%s' % (socket.gethostname(), os.getpid())
+        logger.info('run_jobs %s started' % worker)
+        ran = failed = 0
+        last_maintenance = 0
+        try:
+            while True:
+                # like a request: don't reuse a connection the server may have closed while we slept
+                close_old_connections()
+                if time.time() - last_maintenance > settings.JOB_TIMEOUT / 10:
+                    requeued, timed_out = Job.objects.requeue_stale()
+                    if requeued:
+                        logger.warning('run_jobs requeued %s stale jobs' % requeued)
+                    if timed_out:
+                        logger.error('run_jobs failed %s stale jobs out of attempts' % timed_out)
+                    Job.objects.prune()
+                    last_maintenance = time.time()
+
+                job = Job.objects.claim(worker)
+                if job is None:
+                    if kwargs['once']:
+                        break
+                    time.sleep(kwargs['sleep'])
+                    continue
+                ran += 1
+                if not job.run():
+                    failed += 1
+        except KeyboardInterrupt:
+            pass
+
+        msg = 'run_jobs %s ran %s, failed %s' % (worker, ran, failed)
+        logger.info(msg)
+        self.stdout.write(msg)
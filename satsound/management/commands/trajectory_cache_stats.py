@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from satsound.caching import *
+
+
+class Command(BaseCommand):
+    help = 'Reports hits and misses of the /api/satellitetrajectories/ response cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-r', '--reset', action='store_true', help='Reset the counters after reporting')
+
+    def handle(self, *args, **kwargs):
+        hits, misses = trajectory_cache_stats()
+        total = hits + misses
+        rate = 100.0 * hits / total if total else 0
+        self.stdout.write('hits: %s, misses: %s, hit rate: %.1f%%' % (hits, misses, rate))
+        if kwargs['reset']:
+            reset_trajectory_cache_stats()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 03:42
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from random import randint
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def choose_audio(audios, rise_time):
+    # copy of satsound.models.choose_audio as of this migration
+    if len(audios) == 0:
+        return None
+    if abs((audios[0].updated - rise_time).total_seconds() / 3600) < settings.MAX_IMMINENCE:
+        return audios[0]
+    return audios[randint(0, len(audios) - 1)]
+
+
+def assign_audio(apps, schema_editor):
+    # same as Satellite.assign_audio, which historical models don't have
+    SatelliteAudio = apps.get_model('satsound', 'SatelliteAudio')
+    SatelliteTrajectory = apps.get_model('satsound', 'SatelliteTrajectory')
+    upcoming = SatelliteTrajectory.objects.filter(set_time__gte=timezone.now())
+
+    for satellite_id in upcoming.values_list('satellite', flat=True).distinct():
+        audios = list(SatelliteAudio.objects.filter(satellite=satellite_id, reviewed=True).order_by('-updated'))
+        chosen = defaultdict(list)
+        for pk, rise_time in upcoming.filter(satellite=satellite_id).values_list('pk', 'rise_time'):
+            audio = choose_audio(audios, rise_time)
+            chosen[audio.pk if audio is not None else None].append(pk)
+        for audio_id, pks in chosen.items():
+            SatelliteTrajectory.objects.filter(pk__in=pks).update(audio=audio_id)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('satsound', '0010_satcatcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satellitetrajectory',
+            name='audio',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                    to='satsound.SatelliteAudio'),
+        ),
+        migrations.RunPython(assign_audio, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 03:43
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('satsound', '0011_satellitetrajectory_audio'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='satelliteaudio',
+            index=models.Index(fields=['reviewed', 'satellite', 'updated'], name='satsound_sa_reviewe_680b37_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='satellitetrajectory',
+            index=models.Index(fields=['observer', 'rise_time'], name='satsound_sa_observe_104f33_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='satellitetrajectory',
+            index=models.Index(fields=['satellite', 'observer', 'rise_time'], name='satsound_sa_satelli_a1ff79_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='satellitetrajectory',
+            index=models.Index(fields=['satellite', 'set_time'], name='satsound_sa_satelli_e516d3_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 04:05
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('satsound', '0012_trajectory_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TwoLineElement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('norad_id', models.IntegerField(verbose_name='NORAD catalog number')),
+                ('epoch', models.DateTimeField()),
+                ('line1', models.CharField(max_length=69)),
+                ('line2', models.CharField(max_length=69)),
+            ],
+            options={
+                'verbose_name': 'two-line element',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='twolineelement',
+            index=models.Index(fields=['epoch'], name='satsound_tw_epoch_2c7b0a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='twolineelement',
+            unique_together=set([('norad_id', 'epoch')]),
+        ),
+    ]
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 04:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def reset_watermark(apps, schema_editor):
+    # rows cached so far only have names: make the next pop_satcache fill in every column
+    SyncWatermark = apps.get_model('satsound', 'SyncWatermark')
+    SyncWatermark.objects.filter(pk='satcat').delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('satsound', '0014_syncwatermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satcatcache',
+            name='apogee',
+            field=models.IntegerField(blank=True, null=True, verbose_name='apogee in km'),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='comment',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='commentcode',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='country',
+            field=models.CharField(blank=True, max_length=6),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='current',
+            field=models.CharField(default='Y', max_length=1),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='decay',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='file',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='inclination',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='intldes',
+            field=models.CharField(blank=True, max_length=12, verbose_name='international designator'),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='launch',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='launch_num',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='launch_piece',
+            field=models.CharField(blank=True, max_length=3),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='launch_year',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='object_type',
+            field=models.CharField(blank=True, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='perigee',
+            field=models.IntegerField(blank=True, null=True, verbose_name='perigee in km'),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='period',
+            field=models.FloatField(blank=True, null=True, verbose_name='period in minutes'),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='rcs_size',
+            field=models.CharField(blank=True, max_length=6),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='rcsvalue',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='satcatcache',
+            name='site',
+            field=models.CharField(blank=True, max_length=5),
+        ),
+        migrations.AddIndex(
+            model_name='satcatcache',
+            index=models.Index(fields=['name'], name='satsound_sa_name_73995b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='satcatcache',
+            index=models.Index(fields=['country', 'name'], name='satsound_sa_country_fb2ce4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='satcatcache',
+            index=models.Index(fields=['decay', 'name'], name='satsound_sa_decay_80bd5c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='satcatcache',
+            index=models.Index(fields=['intldes'], name='satsound_sa_intldes_ee9310_idx'),
+        ),
+        migrations.RunPython(reset_watermark, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 04:29
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import satsound.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('satsound', '0015_satcatcache_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satelliteaudio',
+            name='duration',
+            field=models.FloatField(blank=True, editable=False, help_text='seconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='satelliteaudio',
+            name='peak',
+            field=models.FloatField(blank=True, editable=False, help_text='true peak of the rendition, dBTP', null=True),
+        ),
+        migrations.AddField(
+            model_name='satelliteaudio',
+            name='processed',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='satelliteaudio',
+            name='rendition',
+            field=models.FileField(blank=True, editable=False, upload_to=satsound.models.audio_rendition),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.16 on 2026-10-17 04:33
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('satsound', '0016_satelliteaudio_rendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='satelliteaudio',
+            name='sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='satelliteaudio',
+            name='size',
+            field=models.BigIntegerField(blank=True, editable=False, help_text='bytes', null=True),
+        ),
+    ]
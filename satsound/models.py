@@ -1,32 +1,32 @@
 from __future__ import unicode_literals
 
+import json
 import logging
-import math
-import unicodedata
+import shutil
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
 from os import path
+from random import randint
+from tempfile import NamedTemporaryFile
 
-import ephem
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.files import File
+from django.db import models, transaction
 from django.utils import timezone
-from spacetrack import SpaceTrackClient
-from timezonefinder import TimezoneFinder
+from django.utils.module_loading import import_string
 
+from .caching import bump_satcat_version, bump_trajectory_versions
+from .propagation import *
+from .renditions import RenditionError, digest, transcode
+from .stclient import iter_csv, spacetrack_client
+from .timezones import timezone_at
 from .validators import *
 
 logger = logging.getLogger('commands')
 
 
-def decdeg2dms(dd):
-    is_positive = dd >= 0
-    dd = abs(dd)
-    minutes, seconds = divmod(dd * 3600, 60)
-    degrees, minutes = divmod(minutes, 60)
-    degrees = degrees if is_positive else -degrees
-    returnstr = '%s:%s:%s'
-    return returnstr % (int(degrees), int(minutes), seconds)
-
-
 def satellite_upload(instance, filename):
     now = timezone.now()
     satdir = str(instance.satellite.pk)
@@ -35,6 +35,46 @@ def satellite_upload(instance, filename):
     return path.join(satdir, fn)
 
 
+def audio_rendition(instance, filename):
+    # alongside the original's name: renditions/25544/20170321-184728.m4a
+    base, ext = path.splitext(filename)
+    return path.join('renditions', '%s%s' % (path.splitext(instance.audio.name)[0], ext))
+
+
+def choose_audio(audios, rise_time):
+    """Picks the audio for a pass rising at rise_time from a satellite's reviewed audio, most recent first"""
+    if len(audios) == 0:
+        return None
+
+    # if most recent audio is within one hour of this trajectory's rise time, use it
+    imminence = abs((audios[0].updated - rise_time).total_seconds() / 3600)
+    if imminence < settings.MAX_IMMINENCE:
+        return audios[0]
+    # otherwise, pick randomly
+    return audios[randint(0, len(audios) - 1)]
+
+
+def iter_batches(iterable, size):
+    """Yields lists of up to size items of iterable, e.g. rows of a streamed response to write in bulk"""
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def build_trajectories(satellite, observer, passes, audios):
+    """Returns unsaved trajectories of satellite over observer from passes (see compute_passes), with their audio
+    chosen from audios (the satellite's reviewed_audio)"""
+    trajectories = []
+    for np in passes:
+        st = SatelliteTrajectory(satellite=satellite, observer=observer)
+        st.rise_time, st.rise_azimuth, st.maxalt_time, st.maxalt_altitude, st.set_time, st.set_azimuth = np
+        st.audio = choose_audio(audios, st.rise_time)
+        trajectories.append(st)
+    return trajectories
+
+
 class BaseModel(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
@@ -51,106 +91,324 @@ class Satellite(BaseModel):
     tle = models.CharField(max_length=164, blank=True, verbose_name=u'two-line element')
 
     def update_tle(self):
-        st = SpaceTrackClient(identity=settings.SPACETRACK_IDENTITY, password=settings.SPACETRACK_PASSWORD)
-        tle = st.tle_latest(iter_lines=True, ordinal=1, norad_cat_id=self.pk, format='tle')
-        self.tle = '\n'.join(tle)
-
-    def update_trajectories(self):
-        logger.info('update_trajectories: %s' % self.norad_id)
+        # from the local store, so adding a satellite doesn't query space-track; stays blank if the store doesn't
+        # have the object yet, until the next refresh_trajectories
+        self.tle = TwoLineElement.objects.latest_tles([self.pk]).get(self.pk, '')
+
+    def setup(self):
+        """Gets a new satellite its TLE and trajectories; queued by save() (see tasks.setup_satellite)"""
+        self.update_tle()
+        if self.tle == '':
+            # not in the local store yet, e.g. launched since the last refresh_trajectories
+            TwoLineElement.objects.pull([self.pk])
+            self.update_tle()
+        self.save(update_fields=['tle', 'updated'])
+        self.update_trajectories()
+
+    def trajectory_starts(self, now=None):
+        """Latest set time of this satellite's upcoming trajectories per observer pk, i.e. where an incremental
+        refresh picks up computing the tail of each observer's window"""
+        upcoming = self.satellitetrajectory_set.filter(set_time__gte=now or timezone.now())
+        return dict(upcoming.values_list('observer').annotate(models.Max('set_time')))
+
+    def update_trajectories(self, passes=None, batch_size=None, incremental=False):
+        """Replaces this satellite's trajectories. passes maps observer pk to the pass tuples returned by
+        compute_passes, e.g. when they were predicted by refresh_trajectories --workers; computed here if None.
+        If incremental, the TLE is assumed unchanged: upcoming trajectories are kept, past ones dropped and only
+        passes after trajectory_starts() added."""
+        logger.info('update_trajectories: %s%s' % (self.norad_id, ' (incremental)' if incremental else ''))
         if self.tle != '':
-            self.satellitetrajectory_set.all().delete()
-
-            line1 = unicodedata.normalize('NFKD', self.name).encode('ascii', 'ignore')  # not strictly necessary
-            line2, line3 = self.tle.split('\n')
-            s = ephem.readtle(line1, line2, line3)
-
-            for observer in Observer.objects.all():
-                # http://rhodesmill.org/pyephem/quick
-                o = ephem.Observer()
-                o.lat = decdeg2dms(observer.lat)
-                o.lon = decdeg2dms(observer.lon)
-                o.elevation = observer.elevation
-                # From documentation: Rising and setting are sensitive to atmospheric refraction at the horizon, and
-                # therefore to the observer's temp and pressure; set the pressure to zero to turn off refraction.
-                o.pressure = 0  # (defaults to 1010mBar)
-                # o.temp (defaults to 25C)
-                # o.horizon: defaults to 0, but may want to set to 34 or make observer-dependent. From documentation:
-                # The United States Naval Observatory, rather than computing refraction dynamically,
-                # uses a constant estimate of 34' of refraction at the horizon. To determine when a body will rise
-                # "high enough" above haze or obstacles, set horizon to a positive number of degrees.
-                # A negative value of horizon can be used when an observer is high off of the ground.
-
-                o.date = o.epoch = ephem.now()
-                date_limit = ephem.Date(o.date + observer.trajectory_window * ephem.hour)
-                traj = []
-                while o.date < date_limit:
-                    try:
-                        np = o.next_pass(s)
-                        # logger.info('%s next pass: %s' % (self.pk, np))
-                        try:
-                            assert np[0] < np[2] < np[4]
-
-                            try:
-                                assert traj != np
-
-                                st = SatelliteTrajectory()
-                                st.satellite = self
-                                st.observer = observer
-                                st.rise_time = timezone.make_aware(np[0].datetime(), timezone.utc)
-                                st.rise_azimuth = math.degrees(np[1])
-                                st.maxalt_time = timezone.make_aware(np[2].datetime(), timezone.utc)
-                                st.maxalt_altitude = math.degrees(np[3])
-                                st.set_time = timezone.make_aware(np[4].datetime(), timezone.utc)
-                                st.set_azimuth = math.degrees(np[5])
-
-                                st.save()
-                                o.date = o.epoch = np[4]
-                                traj = np
-
-                            except AssertionError:  # If we get trapped in a loop, bail
-                                logger.error('Repeated trajectory. Discarding %s and bailing.' % (np,))
-                                o.date = o.epoch = date_limit
-                                break
-
-                        except AssertionError:
-                            # uncomment next line if we want to dig into why we're getting None for events
-                            # logger.error('%s Pass times out of order. Discarding %s' % (self.pk, np))
-                            # If the traj times are out of order, use the latest datetime to move forward.
-                            # What appears to cause this is max_alt_time and/or set_time being None,
-                            # so that previous np[2] and np[4] aren't overwritten.
-                            # http://rhodesmill.org/pyephem/quick.html under transit, rising, setting:
-                            # "Any of the tuple values can be None if that event was not found."
-                            o.date = o.epoch = max(np[0], np[2], np[4])
-                            break
-
-                    except ValueError:
-                        o.date = o.epoch = date_limit
-                        # TODO: handle geosynchronous satellites (no trajectories calculated)
-                        break
+            now = timezone.now()
+            observers = Observer.objects.all()
+            if passes is None:
+                starts = self.trajectory_starts(now) if incremental else {}
+                passes = get_backend().compute(
+                    self.name, self.tle, [observer_params(observer) for observer in observers], starts
+                )
+
+            audios = self.reviewed_audio()
+            trajectories = []
+            for observer in observers:
+                trajectories.extend(build_trajectories(self, observer, passes.get(observer.pk, []), audios))
+
+            # swap old for new in one transaction so readers never see this satellite without trajectories
+            with transaction.atomic():
+                if incremental:
+                    self.satellitetrajectory_set.filter(set_time__lt=now).delete()
+                else:
+                    self.satellitetrajectory_set.all().delete()
+                SatelliteTrajectory.objects.bulk_create(
+                    trajectories, batch_size=batch_size or settings.TRAJECTORY_BATCH_SIZE
+                )
+            bump_trajectory_versions(observer.pk for observer in observers)
+
+    def reviewed_audio(self):
+        return list(self.satelliteaudio_set.filter(reviewed=True).order_by('-updated'))
+
+    def assign_audio(self):
+        """Chooses the audio of this satellite's upcoming trajectories again, e.g. after its audio was reviewed"""
+        audios = self.reviewed_audio()
+        upcoming = self.satellitetrajectory_set.filter(set_time__gte=timezone.now())
+        chosen = defaultdict(list)
+        for pk, rise_time in upcoming.values_list('pk', 'rise_time'):
+            audio = choose_audio(audios, rise_time)
+            chosen[audio.pk if audio is not None else None].append(pk)
+
+        # one UPDATE per audio rather than per trajectory
+        with transaction.atomic():
+            for audio_id, pks in chosen.items():
+                SatelliteTrajectory.objects.filter(pk__in=pks).update(audio=audio_id)
+        bump_trajectory_versions(upcoming.values_list('observer', flat=True).distinct())
 
     def save(self, *args, **kwargs):
-        newsat = False
-        if self._state.adding:
-            newsat = True
-            self.update_tle()
+        newsat = self._state.adding
 
         super(Satellite, self).save(*args, **kwargs)
 
         if newsat:
-            self.update_trajectories()
+            # trajectories over every observer take too long to wait for, e.g. in the upload of a satellite's first
+            # audio: run_jobs gets the TLE and trajectories instead
+            Job.objects.enqueue('satsound.tasks.setup_satellite', norad_id=int(self.pk))
 
     def __unicode__(self):
         return '%s %s' % (self.norad_id, self.name)
 
 
+class SatCatCacheManager(models.Manager):
+    def sync(self, full=False, bin_size=400, batch_size=None):
+        """Brings the mirror of space-track's satcat up to date, streaming responses and upserting them in batches.
+        Unless full (or on the first sync), only objects changed or launched since the last sync are fetched.
+        Returns (upserted, deleted)."""
+        st = spacetrack_client()
+        started = timezone.now()
+        watermark = None if full else SyncWatermark.objects.filter(pk='satcat').first()
+        batch_size = batch_size or settings.SATCAT_BATCH_SIZE
+        upserted = deleted = 0
+
+        if watermark is None:
+            rows = iter_csv(st.satcat(iter_lines=True, format='csv', orderby='norad_cat_id asc', current='Y'))
+            seen = set()
+            for batch in iter_batches(rows, batch_size):
+                seen.update(int(row['NORAD_CAT_ID']) for row in batch)
+                upserted += self._upsert(batch)
+            # objects dropped from the catalog
+            deleted = self._delete(set(self.values_list('pk', flat=True)) - seen)
+        else:
+            # https://www.space-track.org/documentation#/api: satcat_change and satcat_debut list what changed
+            since = '>%s' % watermark.synced.strftime('%Y-%m-%d %H:%M:%S')
+            changed = iter_csv(st.satcat_change(iter_lines=True, format='csv', change_made=since))
+            debuted = iter_csv(st.satcat_debut(iter_lines=True, format='csv', debut=since))
+            ids = sorted(set(int(row['NORAD_CAT_ID']) for row in changed) |
+                         set(int(row['NORAD_CAT_ID']) for row in debuted))
+            for i in range(0, len(ids), bin_size):
+                rows = iter_csv(st.satcat(iter_lines=True, format='csv', norad_cat_id=ids[i:i + bin_size],
+                                          current='Y'))
+                for batch in iter_batches(rows, batch_size):
+                    upserted += self._upsert(batch)
+
+        SyncWatermark.objects.update_or_create(pk='satcat', defaults={'synced': started})
+        if upserted or deleted:
+            bump_satcat_version()
+        return upserted, deleted
+
+    def _upsert(self, rows):
+        # one query for the rows already mirrored; insert new ones, update only those that changed
+        fields = [field.attname for field in SatCatCache._meta.concrete_fields if field.attname in SatCatCache.FIELDS]
+        objects = dict((obj.pk, obj) for obj in (SatCatCache.from_satcat(row) for row in rows))
+        mirrored = dict((values[0], values) for values in self.filter(pk__in=objects.keys()).values_list(*fields))
+        changed = [obj for pk, obj in objects.items()
+                   if pk in mirrored and mirrored[pk] != tuple(getattr(obj, field) for field in fields)]
+        new = [obj for pk, obj in objects.items() if pk not in mirrored]
+        with transaction.atomic():
+            self.bulk_create(new)
+            for obj in changed:
+                obj.save(update_fields=fields[1:] + ['updated'])
+        return len(new) + len(changed)
+
+    def _delete(self, ids):
+        deleted = 0
+        for batch in iter_batches(ids, settings.SATCAT_BATCH_SIZE):
+            deleted += self.filter(pk__in=batch).delete()[0]
+        return deleted
+
+
 class SatCatCache(BaseModel):
+    """Local mirror of space-track's satcat (current records, decayed objects included), synced by pop_satcache"""
+    # https://www.space-track.org/basicspacedata/modeldef/class/satcat: column, field, in space-track's order;
+    # SATNAME/OBJECT_NAME, INTLDES/OBJECT_ID and NORAD_CAT_ID/OBJECT_NUMBER are the same values
+    COLUMNS = (
+        ('INTLDES', 'intldes'),
+        ('NORAD_CAT_ID', 'norad_id'),
+        ('OBJECT_TYPE', 'object_type'),
+        ('SATNAME', 'name'),
+        ('COUNTRY', 'country'),
+        ('LAUNCH', 'launch'),
+        ('SITE', 'site'),
+        ('DECAY', 'decay'),
+        ('PERIOD', 'period'),
+        ('INCLINATION', 'inclination'),
+        ('APOGEE', 'apogee'),
+        ('PERIGEE', 'perigee'),
+        ('COMMENT', 'comment'),
+        ('COMMENTCODE', 'commentcode'),
+        ('RCSVALUE', 'rcsvalue'),
+        ('RCS_SIZE', 'rcs_size'),
+        ('FILE', 'file'),
+        ('LAUNCH_YEAR', 'launch_year'),
+        ('LAUNCH_NUM', 'launch_num'),
+        ('LAUNCH_PIECE', 'launch_piece'),
+        ('CURRENT', 'current'),
+        ('OBJECT_NAME', 'name'),
+        ('OBJECT_ID', 'intldes'),
+        ('OBJECT_NUMBER', 'norad_id'),
+    )
+    FIELDS = set(field for column, field in COLUMNS)
+
     norad_id = models.IntegerField(primary_key=True, verbose_name=u'NORAD catalog number')
     name = models.CharField(max_length=100)
+    intldes = models.CharField(max_length=12, blank=True, verbose_name=u'international designator')
+    object_type = models.CharField(max_length=12, blank=True)
+    country = models.CharField(max_length=6, blank=True)
+    launch = models.DateField(null=True, blank=True)
+    site = models.CharField(max_length=5, blank=True)
+    decay = models.DateField(null=True, blank=True)
+    period = models.FloatField(null=True, blank=True, verbose_name=u'period in minutes')
+    inclination = models.FloatField(null=True, blank=True)
+    apogee = models.IntegerField(null=True, blank=True, verbose_name=u'apogee in km')
+    perigee = models.IntegerField(null=True, blank=True, verbose_name=u'perigee in km')
+    comment = models.CharField(max_length=32, blank=True)
+    commentcode = models.IntegerField(null=True, blank=True)
+    rcsvalue = models.IntegerField(null=True, blank=True)
+    rcs_size = models.CharField(max_length=6, blank=True)
+    file = models.IntegerField(null=True, blank=True)
+    launch_year = models.IntegerField(null=True, blank=True)
+    launch_num = models.IntegerField(null=True, blank=True)
+    launch_piece = models.CharField(max_length=3, blank=True)
+    current = models.CharField(max_length=1, default='Y')
+
+    objects = SatCatCacheManager()
+
+    @classmethod
+    def from_satcat(cls, row):
+        """Returns an unsaved instance from a satcat row (e.g. of stclient.iter_csv, where null is '')"""
+        obj = cls()
+        for column, name in cls.COLUMNS:
+            if column in row:
+                field = cls._meta.get_field(name)
+                value = row[column]
+                setattr(obj, name, None if value in ('', None) and field.null else field.to_python(value or ''))
+        return obj
+
+    class Meta:
+        # the columns /api/satelliteinfo filters on locally (see satsound.satcat)
+        indexes = [
+            models.Index(fields=['name']),
+            models.Index(fields=['country', 'name']),
+            models.Index(fields=['decay', 'name']),
+            models.Index(fields=['intldes']),
+        ]
 
     def __unicode__(self):
         return '%s %s' % (self.norad_id, self.name)
 
 
+class TwoLineElementManager(models.Manager):
+    def _latest(self):
+        # the pk of the most recent element set of the outer query's norad_id
+        return models.Subquery(self.filter(norad_id=models.OuterRef('norad_id')).order_by('-epoch').values('pk')[:1])
+
+    def latest_tles(self, norad_ids=None):
+        """Returns {norad_id: tle} of the most recent element set stored for each of norad_ids (default: all)"""
+        elements = self.filter(pk=self._latest())
+        if norad_ids is not None:
+            elements = elements.filter(norad_id__in=norad_ids)
+        return dict(
+            (norad_id, '\n'.join((line1, line2)))
+            for norad_id, line1, line2 in elements.values_list('norad_id', 'line1', 'line2')
+        )
+
+    def pull(self, norad_ids=None, bin_size=400, batch_size=None):
+        """Stores the element sets of space-track's tle_latest that aren't stored yet, streaming the response: the
+        whole catalog in one bulk query, or norad_ids in queries of bin_size ids. Drops element sets older than
+        settings.TLE_HISTORY_DAYS. Returns the number of element sets stored."""
+        st = spacetrack_client()
+        if norad_ids is None:
+            # https://www.space-track.org/documentation#/howto: current elements of every object on orbit
+            queries = [{'epoch': '>now-30'}]
+        else:
+            norad_ids = list(norad_ids)
+            queries = [{'norad_cat_id': norad_ids[i:i + bin_size]} for i in range(0, len(norad_ids), bin_size)]
+
+        stored = 0
+        for query in queries:
+            tles = iter_tles(st.tle_latest(iter_lines=True, ordinal=1, format='tle', **query))
+            for batch in iter_batches(tles, batch_size or settings.TLE_BATCH_SIZE):
+                stored += self._store([
+                    TwoLineElement(norad_id=int(line1[2:7]), epoch=tle_epoch(line1), line1=line1, line2=line2)
+                    for line1, line2 in batch
+                ])
+
+        self.prune()
+        return stored
+
+    def prune(self, batch_size=None):
+        """Drops element sets older than settings.TLE_HISTORY_DAYS, except each object's most recent one: a satellite
+        whose elements haven't been updated for longer still has a TLE. Returns the number dropped."""
+        # selected first and deleted by pk: MySQL can't delete from a table a subquery of the DELETE reads
+        stale = list(self.filter(
+            epoch__lt=timezone.now() - timedelta(days=settings.TLE_HISTORY_DAYS)
+        ).exclude(pk=self._latest()).values_list('pk', flat=True))
+        for batch in iter_batches(stale, batch_size or settings.TLE_BATCH_SIZE):
+            self.filter(pk__in=batch).delete()
+        return len(stale)
+
+    def _store(self, batch):
+        # one query for the batch's element sets already stored, one insert for the rest
+        seen = set(self.filter(
+            norad_id__in=set(element.norad_id for element in batch),
+            epoch__gte=min(element.epoch for element in batch)
+        ).values_list('norad_id', 'epoch'))
+        new = []
+        for element in batch:
+            if (element.norad_id, element.epoch) not in seen:
+                seen.add((element.norad_id, element.epoch))
+                new.append(element)
+        self.bulk_create(new)
+        return len(new)
+
+
+class TwoLineElement(BaseModel):
+    """Element set history of the whole catalog, filled by bulk pulls from space-track (see
+    TwoLineElementManager.pull); satellites take their current TLE from here"""
+    # not a foreign key: the store covers every object on orbit, not just satellites with audio
+    norad_id = models.IntegerField(verbose_name=u'NORAD catalog number')
+    epoch = models.DateTimeField()
+    line1 = models.CharField(max_length=69)
+    line2 = models.CharField(max_length=69)
+
+    objects = TwoLineElementManager()
+
+    class Meta:
+        verbose_name = 'two-line element'
+        unique_together = ('norad_id', 'epoch')
+        indexes = [
+            models.Index(fields=['epoch']),
+        ]
+
+    def __unicode__(self):
+        return '%s %s' % (self.norad_id, self.epoch.strftime(settings.TRAJECTORY_TIME_FORMAT))
+
+
+class SyncWatermark(BaseModel):
+    """When a dataset mirrored from space-track (e.g. 'satcat') was last synced, so the next sync only fetches what
+    changed since"""
+    name = models.CharField(max_length=50, primary_key=True)
+    synced = models.DateTimeField()
+
+    def __unicode__(self):
+        return '%s %s' % (self.name, self.synced.strftime(settings.TRAJECTORY_TIME_FORMAT))
+
+
 class Observer(BaseModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     # if we use postgres, we can use geodjango to store lat/lon as a Point
@@ -162,23 +420,58 @@ class Observer(BaseModel):
     trajectory_window = models.PositiveSmallIntegerField(verbose_name='hours of trajectories', default=24)
     active = models.BooleanField(default=True)
 
-    def save(self, *args, **kwargs):
-        try:
-            # https://github.com/MrMinimal64/timezonefinder
-            tf = TimezoneFinder()
-            timezone_name = tf.timezone_at(lng=self.lon, lat=self.lat)
-            if timezone_name is None:
-                timezone_name = tf.closest_timezone_at(lng=self.lon, lat=self.lat)
-                # maybe even increase the search radius (delta_degree=x) when it is still None
+    # fields pass prediction depends on (see observer_params)
+    PASS_FIELDS = ('lat', 'lon', 'elevation', 'trajectory_window')
+
+    def changed_fields(self):
+        """Names of PASS_FIELDS that differ from what is saved, all of them if this observer is new"""
+        if self._state.adding:
+            return set(self.PASS_FIELDS)
+        saved = Observer.objects.filter(pk=self.pk).values_list(*self.PASS_FIELDS).first()
+        if saved is None:
+            return set(self.PASS_FIELDS)
+        return set(
+            name for name, value in zip(self.PASS_FIELDS, saved)
+            if self._meta.get_field(name).to_python(getattr(self, name)) != value
+        )
 
-            self.timezone = timezone_name
+    def update_trajectories(self, batch_size=None):
+        """Replaces this observer's trajectories of every satellite, e.g. after it was added or moved: what
+        refresh_trajectories does, for this observer only"""
+        logger.info('update_trajectories: observer %s' % self.pk)
+        backend = get_backend()
+        params = [observer_params(self)]
+        # reviewed audio of every satellite in one query, most recent first as in Satellite.reviewed_audio
+        audios = defaultdict(list)
+        for audio in SatelliteAudio.objects.filter(reviewed=True).order_by('-updated'):
+            audios[audio.satellite_id].append(audio)
+
+        trajectories = []
+        for satellite in Satellite.objects.exclude(tle='').only('norad_id', 'name', 'tle'):
+            passes = backend.compute(satellite.name, satellite.tle, params)
+            trajectories.extend(build_trajectories(satellite, self, passes.get(self.pk, []), audios[satellite.pk]))
+
+        # swap old for new in one transaction so readers never see this observer without trajectories
+        with transaction.atomic():
+            self.satellitetrajectory_set.all().delete()
+            SatelliteTrajectory.objects.bulk_create(
+                trajectories, batch_size=batch_size or settings.TRAJECTORY_BATCH_SIZE
+            )
+        bump_trajectory_versions([self.pk])
 
-        except ValueError:
-            # the coordinates were out of bounds - just use default
-            pass
+    def save(self, *args, **kwargs):
+        changed = self.changed_fields()
+        if changed & {'lat', 'lon'}:
+            # the default stays if there is no timezone near or the coordinates are out of bounds
+            self.timezone = timezone_at(self.lat, self.lon) or self.timezone
 
         super(Observer, self).save(*args, **kwargs)
 
+        if changed:
+            # only this observer's passes, by run_jobs: a new installation gets its feed without waiting for the next
+            # refresh_trajectories, and no other observer is recomputed
+            Job.objects.enqueue('satsound.tasks.refresh_observer', observer_id=self.pk)
+
     def __unicode__(self):
         return self.user.username
 
@@ -192,8 +485,8 @@ class SatelliteTrajectory(BaseModel):
     maxalt_altitude = models.DecimalField(decimal_places=6, max_digits=9, verbose_name=u'maximum altitude')
     set_time = models.DateTimeField(verbose_name=u'set time')
     set_azimuth = models.DecimalField(decimal_places=6, max_digits=9, verbose_name=u'set azimuth')
-
-    _audio = None
+    # chosen when the trajectory is generated or the satellite's audio is reviewed, so every poll gets the same audio
+    audio = models.ForeignKey('SatelliteAudio', null=True, blank=True, on_delete=models.SET_NULL)
 
     # def post(self):
     #     url = self.observer.ip
@@ -230,6 +523,13 @@ class SatelliteTrajectory(BaseModel):
 
     class Meta:
         verbose_name_plural = 'satellite trajectories'
+        # the feed filters by observer (and optionally satellite) and a rise_time range, ordered by rise_time;
+        # refreshes and audio assignment look up a satellite's trajectories by set_time
+        indexes = [
+            models.Index(fields=['observer', 'rise_time']),
+            models.Index(fields=['satellite', 'observer', 'rise_time']),
+            models.Index(fields=['satellite', 'set_time']),
+        ]
 
 
 class SatelliteAudio(BaseModel):
@@ -246,6 +546,181 @@ class SatelliteAudio(BaseModel):
     audio = models.FileField(upload_to=satellite_upload, validators=[validate_audio_size, validate_audio_type])
     reviewed = models.BooleanField(default=False)
     type = models.PositiveSmallIntegerField(choices=TYPES)
+    # the compact, loudness normalized version delivered to clients, made by process_audio
+    rendition = models.FileField(upload_to=audio_rendition, blank=True, editable=False)
+    duration = models.FloatField(null=True, blank=True, editable=False, help_text='seconds')
+    peak = models.FloatField(null=True, blank=True, editable=False, help_text='true peak of the rendition, dBTP')
+    # of the delivered file, for clients caching it by content (see client/sync_audio.py)
+    sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    size = models.BigIntegerField(null=True, blank=True, editable=False, help_text='bytes')
+    processed = models.DateTimeField(null=True, blank=True, editable=False)
+
+    def delivered(self):
+        # the file clients download: the rendition, until there is one the original
+        return self.rendition or self.audio
+
+    def process(self):
+        """Renders this audio's delivery rendition (see renditions.transcode) from a local copy of the original and
+        stores it with its duration, peak, hash and size. Audio ffmpeg can't render is marked processed all the same,
+        so process_audio doesn't retry it every run, and RenditionError raised."""
+        with NamedTemporaryFile(suffix=path.splitext(self.audio.name)[1]) as source, \
+                NamedTemporaryFile(suffix=settings.AUDIO_RENDITION_EXTENSION) as dest:
+            original = self.audio.storage.open(self.audio.name, 'rb')
+            try:
+                shutil.copyfileobj(original, source, 1024 * 1024)
+            finally:
+                original.close()
+            source.flush()
+
+            try:
+                self.duration, self.peak = transcode(source.name, dest.name)
+            except RenditionError:
+                processed = {'processed': timezone.now()}
+                if not self.rendition:
+                    # the original is delivered instead
+                    processed['sha256'], processed['size'] = digest(source)
+                SatelliteAudio.objects.filter(pk=self.pk).update(**processed)
+                raise
+
+            self.sha256, self.size = digest(dest)
+            if self.rendition:
+                self.rendition.delete(save=False)
+            self.rendition.save('rendition%s' % settings.AUDIO_RENDITION_EXTENSION, File(dest), save=False)
+
+        self.processed = timezone.now()
+        # not updated: choose_audio goes by when audio was uploaded or reviewed. Trajectories deliver the rendition,
+        # so saving invalidates their cached responses (and manifests).
+        self.save(update_fields=['rendition', 'duration', 'peak', 'sha256', 'size', 'processed'])
+
+    def invalidate_trajectories(self):
+        """Invalidates the cached feeds of the observers with upcoming passes playing this audio"""
+        upcoming = self.satellitetrajectory_set.filter(set_time__gte=timezone.now())
+        bump_trajectory_versions(upcoming.values_list('observer', flat=True).distinct())
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        was_reviewed = not adding and SatelliteAudio.objects.filter(pk=self.pk, reviewed=True).exists()
+
+        super(SatelliteAudio, self).save(*args, **kwargs)
+
+        if adding:
+            # renditions are made by run_jobs (or process_audio)
+            Job.objects.enqueue('satsound.tasks.process_audio', audio_id=self.pk)
+
+        # reviewed audio is assigned to trajectories, so (un)reviewing it changes which passes play what; otherwise
+        # the same passes play it, e.g. with a new rendition or attribution
+        if self.reviewed != was_reviewed:
+            self.satellite.assign_audio()
+        elif not adding:
+            self.invalidate_trajectories()
+
+    def delete(self, *args, **kwargs):
+        reviewed = self.reviewed
+        ret = super(SatelliteAudio, self).delete(*args, **kwargs)
+        if reviewed:
+            self.satellite.assign_audio()
+        return ret
+
+    class Meta:
+        # reviewed audio of a satellite, most recently updated first
+        indexes = [
+            models.Index(fields=['reviewed', 'satellite', 'updated']),
+        ]
 
     def __unicode__(self):
         return '%s %s' % (self.satellite.pk, self.attribution)
+
+
+class JobManager(models.Manager):
+    def enqueue(self, task, run_at=None, **kwargs):
+        """Queues a call of task (the dotted path of a function in satsound.tasks) with kwargs, which must be JSON
+        serializable, for run_jobs to make as soon as it can (or at run_at)"""
+        return self.create(task=task, kwargs=json.dumps(kwargs, sort_keys=True), run_at=run_at or timezone.now())
+
+    def claim(self, worker):
+        """Marks the next due pending job as running by worker and returns it, or None if no job is due. A job
+        is only claimed by the worker whose conditional UPDATE changes it, so concurrent workers never share one."""
+        now = timezone.now()
+        due = self.filter(status=Job.PENDING, run_at__lte=now).order_by('run_at', 'pk')
+        for pk in due.values_list('pk', flat=True)[:settings.JOB_CLAIM_CANDIDATES]:
+            if self.filter(pk=pk, status=Job.PENDING).update(status=Job.RUNNING, worker=worker, started=now,
+                                                             attempts=models.F('attempts') + 1):
+                return self.get(pk=pk)
+        return None
+
+    def requeue_stale(self):
+        """Queues again the jobs left running longer than settings.JOB_TIMEOUT, e.g. by a worker that died, as a
+        failed attempt (counted when claimed): a job out of attempts fails instead, so one that kills its worker isn't
+        run forever. Returns (requeued, failed)."""
+        now = timezone.now()
+        stale = self.filter(status=Job.RUNNING, started__lt=now - timedelta(seconds=settings.JOB_TIMEOUT))
+        error = 'timed out: still running after %s seconds' % settings.JOB_TIMEOUT
+        failed = stale.filter(attempts__gte=settings.JOB_MAX_ATTEMPTS).update(
+            status=Job.FAILED, worker='', finished=now, error=error
+        )
+        return stale.update(status=Job.PENDING, worker='', error=error), failed
+
+    def prune(self):
+        """Deletes jobs done more than settings.JOB_HISTORY_DAYS ago"""
+        done = timezone.now() - timedelta(days=settings.JOB_HISTORY_DAYS)
+        return self.filter(status=Job.DONE, finished__lt=done).delete()[0]
+
+
+class Job(BaseModel):
+    """A task run in the background by run_jobs rather than in a request, retried with exponential backoff up to
+    settings.JOB_MAX_ATTEMPTS times"""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, u'pending'),
+        (RUNNING, u'running'),
+        (DONE, u'done'),
+        (FAILED, u'failed'),
+    )
+
+    task = models.CharField(max_length=100)
+    kwargs = models.TextField(default='{}')  # JSON
+    status = models.CharField(max_length=10, choices=STATUSES, default=PENDING)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    worker = models.CharField(max_length=100, blank=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    objects = JobManager()
+
+    def run(self):
+        """Calls the task of this (claimed) job and records the outcome: done, pending again after a delay, or
+        failed once out of attempts. Returns whether the task succeeded."""
+        try:
+            import_string(self.task)(**json.loads(self.kwargs))
+        except Exception:
+            self.error = traceback.format_exc()
+            if self.attempts < settings.JOB_MAX_ATTEMPTS:
+                self.status = Job.PENDING
+                self.run_at = timezone.now() + timedelta(seconds=settings.JOB_RETRY_DELAY * 2 ** (self.attempts - 1))
+            else:
+                self.status = Job.FAILED
+                self.finished = timezone.now()
+            logger.exception('job %s (%s) failed, attempt %s' % (self.pk, self.task, self.attempts))
+            succeeded = False
+        else:
+            self.status = Job.DONE
+            self.finished = timezone.now()
+            # from an earlier attempt
+            self.error = ''
+            succeeded = True
+        self.save(update_fields=['status', 'run_at', 'finished', 'error', 'updated'])
+        return succeeded
+
+    class Meta:
+        # claim() looks for the next due pending job
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+        ]
+
+    def __unicode__(self):
+        return '%s %s %s' % (self.pk, self.task, self.status)
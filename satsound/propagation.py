@@ -0,0 +1,162 @@
+import logging
+import math
+import os
+import time
+import datetime
+import unicodedata
+
+import ephem
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('commands')
+
+
+def decdeg2dms(dd):
+    is_positive = dd >= 0
+    dd = abs(dd)
+    minutes, seconds = divmod(dd * 3600, 60)
+    degrees, minutes = divmod(minutes, 60)
+    degrees = degrees if is_positive else -degrees
+    returnstr = '%s:%s:%s'
+    return returnstr % (int(degrees), int(minutes), seconds)
+
+
+def observer_params(observer):
+    # plain, picklable copy of the fields pass prediction needs, so it can run outside the ORM (e.g. in a worker)
+    return observer.pk, float(observer.lat), float(observer.lon), observer.elevation, observer.trajectory_window
+
+
+def tle_epoch(tle):
+    # https://www.space-track.org/documentation#/tle: columns 19-32 of line 1 are the epoch as YYDDD.DDDDDDDD
+    if not tle:
+        return None
+    epoch = tle.split('\n')[0][18:32]
+    year = int(epoch[:2])
+    year += 2000 if year < 57 else 1900
+    start = timezone.make_aware(datetime.datetime(year, 1, 1), timezone.utc)
+    return start + datetime.timedelta(days=float(epoch[2:]) - 1)
+
+
+def iter_tles(lines):
+    """Yields (line1, line2) pairs from the lines of a format=tle response, e.g. streamed with iter_lines"""
+    line1 = None
+    for line in lines:
+        line = line.strip()
+        if line.startswith('1 '):
+            line1 = line
+        elif line.startswith('2 ') and line1 is not None:
+            yield line1, line
+            line1 = None
+
+
+def read_tle(name, tle):
+    line1 = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore')  # not strictly necessary
+    line2, line3 = tle.split('\n')
+    return ephem.readtle(line1, line2, line3)
+
+
+def compute_passes(s, observer, start=None):
+    """Returns the passes of pyephem body s over observer (see observer_params) for its trajectory window, as
+    (rise_time, rise_azimuth, maxalt_time, maxalt_altitude, set_time, set_azimuth) tuples in UTC and degrees.
+    If start (UTC datetime) is given, only passes after it are searched for, i.e. the tail of the window."""
+    observer_id, lat, lon, elevation, trajectory_window = observer
+
+    # http://rhodesmill.org/pyephem/quick
+    o = ephem.Observer()
+    o.lat = decdeg2dms(lat)
+    o.lon = decdeg2dms(lon)
+    o.elevation = elevation
+    # From documentation: Rising and setting are sensitive to atmospheric refraction at the horizon, and
+    # therefore to the observer's temp and pressure; set the pressure to zero to turn off refraction.
+    o.pressure = 0  # (defaults to 1010mBar)
+    # o.temp (defaults to 25C)
+    # o.horizon: defaults to 0, but may want to set to 34 or make observer-dependent. From documentation:
+    # The United States Naval Observatory, rather than computing refraction dynamically,
+    # uses a constant estimate of 34' of refraction at the horizon. To determine when a body will rise
+    # "high enough" above haze or obstacles, set horizon to a positive number of degrees.
+    # A negative value of horizon can be used when an observer is high off of the ground.
+
+    o.date = o.epoch = ephem.now()
+    date_limit = ephem.Date(o.date + trajectory_window * ephem.hour)
+    if start is not None:
+        o.date = o.epoch = max(o.date, ephem.Date(start.replace(tzinfo=None)))
+    passes = []
+    traj = []
+    while o.date < date_limit:
+        try:
+            np = o.next_pass(s)
+            # logger.info('%s next pass: %s' % (self.pk, np))
+            try:
+                assert np[0] < np[2] < np[4]
+
+                try:
+                    assert traj != np
+
+                    passes.append((
+                        timezone.make_aware(np[0].datetime(), timezone.utc),
+                        math.degrees(np[1]),
+                        timezone.make_aware(np[2].datetime(), timezone.utc),
+                        math.degrees(np[3]),
+                        timezone.make_aware(np[4].datetime(), timezone.utc),
+                        math.degrees(np[5]),
+                    ))
+                    o.date = o.epoch = np[4]
+                    traj = np
+
+                except AssertionError:  # If we get trapped in a loop, bail
+                    logger.error('Repeated trajectory. Discarding %s and bailing.' % (np,))
+                    o.date = o.epoch = date_limit
+                    break
+
+            except AssertionError:
+                # uncomment next line if we want to dig into why we're getting None for events
+                # logger.error('%s Pass times out of order. Discarding %s' % (self.pk, np))
+                # If the traj times are out of order, use the latest datetime to move forward.
+                # What appears to cause this is max_alt_time and/or set_time being None,
+                # so that previous np[2] and np[4] aren't overwritten.
+                # http://rhodesmill.org/pyephem/quick.html under transit, rising, setting:
+                # "Any of the tuple values can be None if that event was not found."
+                o.date = o.epoch = max(np[0], np[2], np[4])
+                break
+
+        except ValueError:
+            o.date = o.epoch = date_limit
+            # TODO: handle geosynchronous satellites (no trajectories calculated)
+            break
+
+    return passes
+
+
+class PyEphemBackend(object):
+    """Reference backend: pyephem next_pass, one observer and one pass at a time"""
+    # passes are searched per observer, so refresh_trajectories --workers can spread single observers across the pool
+    batch_observers = False
+
+    def compute(self, name, tle, observers, starts=None):
+        """Returns {observer pk: compute_passes(...)} for observers (observer_params tuples), resuming each
+        observer at starts[pk] if given"""
+        starts = starts or {}
+        s = read_tle(name, tle)
+        return dict((observer[0], compute_passes(s, observer, starts.get(observer[0]))) for observer in observers)
+
+
+_backend = None
+
+
+def get_backend():
+    # the propagation backend is chosen by settings.TRAJECTORY_BACKEND and shared by the process
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.TRAJECTORY_BACKEND)()
+    return _backend
+
+
+def predict_passes(task):
+    """Process pool entry point: task is (norad_id, name, tle, [observer_params], starts). Returns
+    (norad_id, {observer pk: passes}, worker pid, seconds spent) so the parent can do the db writes."""
+    norad_id, name, tle, observers, starts = task
+    started = time.time()
+    passes = get_backend().compute(name, tle, observers, starts)
+    return norad_id, passes, os.getpid(), time.time() - started
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import math
+import re
+import subprocess
+
+from django.conf import settings
+
+# loudnorm prints its measurements as a json object of strings after the rest of ffmpeg's output
+LOUDNORM_STATS = re.compile(r'^\{\s*$.*?^\}', re.M | re.S)
+
+
+class RenditionError(Exception):
+    pass
+
+
+def ffmpeg(args):
+    """Runs ffmpeg with args, returning (stdout, stderr), or raises RenditionError with ffmpeg's last message"""
+    try:
+        process = subprocess.Popen([settings.FFMPEG, '-hide_banner', '-nostdin', '-y'] + args,
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise RenditionError('could not run %s: %s' % (settings.FFMPEG, e))
+    out, err = process.communicate()
+    if process.returncode != 0:
+        lines = err.strip().splitlines()
+        raise RenditionError(lines[-1] if lines else 'ffmpeg exited with %s' % process.returncode)
+    return out, err
+
+
+def loudnorm_stats(err):
+    stats = LOUDNORM_STATS.findall(err)
+    if not stats:
+        raise RenditionError('no loudness measurements in ffmpeg output')
+    return json.loads(stats[-1])
+
+
+def loudnorm(measured=None):
+    target = 'loudnorm=I=%s:TP=%s:LRA=%s:print_format=json' % (
+        settings.AUDIO_RENDITION_LOUDNESS, settings.AUDIO_RENDITION_TRUE_PEAK, settings.AUDIO_RENDITION_LOUDNESS_RANGE
+    )
+    # silence measures -inf, which loudnorm can't be given: it is left to normalize dynamically
+    if measured is None or any(math.isinf(float(measured[key])) for key in ('input_i', 'input_tp')):
+        return target
+    return '%s:measured_I=%s:measured_TP=%s:measured_LRA=%s:measured_thresh=%s:offset=%s:linear=true' % (
+        target, measured['input_i'], measured['input_tp'], measured['input_lra'], measured['input_thresh'],
+        measured['target_offset']
+    )
+
+
+def transcode(source, dest):
+    """Transcodes the audio file at path source into a delivery rendition at path dest, normalized to the target
+    loudness in two passes (measure, then adjust linearly), and returns its (duration in seconds, true peak in dBTP)"""
+    # first pass: measure the source
+    out, err = ffmpeg(['-i', source, '-vn', '-af', loudnorm(), '-f', 'null', '-'])
+    measured = loudnorm_stats(err)
+
+    # second pass: normalize and encode; -progress reports how much audio was written, i.e. the duration
+    out, err = ffmpeg([
+        '-i', source, '-vn', '-map_metadata', '-1', '-af', loudnorm(measured),
+        '-ar', str(settings.AUDIO_RENDITION_SAMPLE_RATE), '-ac', str(settings.AUDIO_RENDITION_CHANNELS),
+        '-c:a', settings.AUDIO_RENDITION_CODEC, '-b:a', settings.AUDIO_RENDITION_BITRATE,
+        '-movflags', '+faststart', '-progress', 'pipe:1', dest,
+    ])
+    # out_time_ms is in microseconds too, in older ffmpeg the only one
+    progress = dict(line.split('=', 1) for line in out.splitlines() if '=' in line)
+    duration = int(progress.get('out_time_us', progress.get('out_time_ms', 0))) / 1000000.0
+    peak = float(loudnorm_stats(err)['output_tp'])
+    return duration, peak if not math.isinf(peak) else None
+
+
+def digest(f):
+    """Returns the (sha256 hex digest, size) of the open file f, read from the start"""
+    sha256 = hashlib.sha256()
+    size = 0
+    f.seek(0)
+    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+        sha256.update(chunk)
+        size += len(chunk)
+    f.seek(0)
+    return sha256.hexdigest(), size
@@ -1,4 +1,6 @@
+from audiomanifest import AudioManifestViewSet
 from satelliteaudio import SatelliteAudioViewset
 from satelliteinfo import SatCatViewSet
+from satellitesearch import SatelliteSearchViewSet
 from satellitetrajectories import FlatSatelliteTrajectoryViewset
 
@@ -0,0 +1,80 @@
+import datetime
+import math
+
+import pytz
+from django.db.models import Min
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework import exceptions, serializers, viewsets
+from rest_framework.response import Response
+
+from ..models import *
+from .satellitetrajectories import trajectories_etag, trajectories_last_modified
+
+
+class AudioManifestSerializer(serializers.ModelSerializer):
+    audiofile = serializers.SerializerMethodField()
+    url = serializers.SerializerMethodField()
+    rise_time = serializers.SerializerMethodField()
+
+    def get_audiofile(self, obj):
+        # as in /api/satellitetrajectories/, which installations match it against
+        return obj.delivered().name
+
+    def get_url(self, obj):
+        return self.context['request'].build_absolute_uri(obj.delivered().url)
+
+    def get_rise_time(self, obj):
+        rise_time = self.context['rise_times'][obj.pk].astimezone(pytz.timezone(self.context['observer'].timezone))
+        return rise_time.strftime(settings.TRAJECTORY_TIME_FORMAT)
+
+    class Meta:
+        model = SatelliteAudio
+        fields = (
+            'id',
+            'audiofile',
+            'url',
+            'sha256',
+            'size',
+            'rise_time',
+        )
+
+
+class AudioManifestViewSet(viewsets.ViewSet):
+    """Audio an installation needs for an observer's passes over the next hours, so it can fetch it ahead of time:
+    ?observer=<id>&hours=<n> (defaults to AUDIO_MANIFEST_DEFAULT_HOURS), ordered by the first pass playing each,
+    with the sha256 and size of each file (null until process_audio has seen it)"""
+    serializer_class = AudioManifestSerializer
+    queryset = SatelliteAudio.objects.all()
+
+    # same versions as the observer's trajectory feed, which processing and reviewing audio bump
+    @method_decorator(condition(etag_func=trajectories_etag, last_modified_func=trajectories_last_modified))
+    def list(self, request):
+        observer = request.query_params.get('observer', '')
+        if not observer.isdigit():
+            raise exceptions.ValidationError({'observer': 'This field is required.'})
+        observer = get_object_or_404(Observer, pk=observer)
+        try:
+            hours = float(request.query_params.get('hours', settings.AUDIO_MANIFEST_DEFAULT_HOURS))
+        except ValueError:
+            raise exceptions.ValidationError({'hours': 'A number is required.'})
+        if math.isnan(hours) or math.isinf(hours):
+            raise exceptions.ValidationError({'hours': 'A finite number is required.'})
+        hours = min(max(hours, 0), settings.AUDIO_MANIFEST_MAX_HOURS)
+
+        # passes under way or rising within hours
+        now = timezone.now()
+        rise_times = dict(
+            SatelliteTrajectory.objects.filter(
+                observer=observer, audio__isnull=False, set_time__gte=now,
+                rise_time__lte=now + datetime.timedelta(hours=hours)
+            ).values_list('audio').annotate(rise_time=Min('rise_time'))
+        )
+        audios = sorted(self.queryset.filter(pk__in=list(rise_times)), key=lambda a: rise_times[a.pk])
+        context = {'request': request, 'observer': observer, 'rise_times': rise_times}
+        return Response({
+            'observer': observer.pk,
+            'hours': hours,
+            'audio': AudioManifestSerializer(audios, many=True, context=context).data,
+        })
@@ -1,3 +1,8 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from rest_framework import serializers, viewsets, mixins, permissions
 
 from ..models import SatelliteAudio
@@ -19,6 +24,30 @@ class SatelliteAudioPermission(permissions.IsAuthenticatedOrReadOnly):
             return False
 
 
+def audio_list_etag(request, *args, **kwargs):
+    # count catches deletions, which don't move max(updated); processing audio doesn't move it either
+    stats = SatelliteAudio.objects.aggregate(count=Count('pk'), updated=Max('updated'), processed=Max('processed'))
+    etag = '%s:%s:%s:%s:%s' % (stats['count'], stats['updated'], stats['processed'], request.get_full_path(),
+                               request.META.get('HTTP_ACCEPT', ''))
+    return hashlib.md5(etag.encode('utf-8')).hexdigest()
+
+
+def _latest(*times):
+    # processed is null until process_audio has run, and None doesn't compare with datetimes
+    times = [t for t in times if t is not None]
+    return max(times) if times else None
+
+
+def audio_list_last_modified(request, *args, **kwargs):
+    stats = SatelliteAudio.objects.aggregate(updated=Max('updated'), processed=Max('processed'))
+    return _latest(stats['updated'], stats['processed'])
+
+
+def audio_last_modified(request, pk=None, *args, **kwargs):
+    changed = SatelliteAudio.objects.filter(pk=pk).values_list('updated', 'processed')
+    return _latest(*changed[0]) if changed else None
+
+
 # subclass from viewsets.ModelViewSet if we support all/most methods
 class SatelliteAudioViewset(mixins.RetrieveModelMixin,
                             mixins.DestroyModelMixin,
@@ -31,3 +60,12 @@ class SatelliteAudioViewset(mixins.RetrieveModelMixin,
     # TODO: filter by user, sort for server-based datatable rendering
     queryset = SatelliteAudio.objects.all()
     permission_classes = (SatelliteAudioPermission,)
+
+    # answer polls with 304 Not Modified before serializing anything when the client's copy is current
+    @method_decorator(condition(etag_func=audio_list_etag, last_modified_func=audio_list_last_modified))
+    def list(self, request, *args, **kwargs):
+        return super(SatelliteAudioViewset, self).list(request, *args, **kwargs)
+
+    @method_decorator(condition(last_modified_func=audio_last_modified))
+    def retrieve(self, request, *args, **kwargs):
+        return super(SatelliteAudioViewset, self).retrieve(request, *args, **kwargs)
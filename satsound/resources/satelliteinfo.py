@@ -1,9 +1,18 @@
+import logging
+from collections import OrderedDict
+
 from django.conf import settings
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 from rest_framework import serializers, viewsets
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.response import Response
-from spacetrack import SpaceTrackClient
+
+from ..models import SatCatCache
+from ..satcat import TYPES, UnsupportedQuery, query_satcat, typed_satcat
+from ..stclient import spacetrack_client
+
+logger = logging.getLogger('commands')
 
 
 # Not used now, but would be necessary if we wanted to support create/update methods
@@ -13,32 +22,27 @@ from spacetrack import SpaceTrackClient
 #             setattr(self, field, kwargs.get(field, None))
 
 
-def is_float(s):
-    try:
-        float(s)
-        return True
-    except ValueError:
-        return False
+class SatCatSerializer(serializers.Serializer):
+    """Fixed schema of /api/satelliteinfo rows (see satcat.TYPES). Converting to it is done for a whole response at
+    once by satcat.typed_satcat, not field by field."""
+    FIELDS = {int: serializers.IntegerField, float: serializers.FloatField}
 
+    def get_fields(self):
+        return OrderedDict(
+            (column, self.FIELDS.get(TYPES[column], serializers.CharField)(read_only=True, allow_null=True))
+            for column, name in SatCatCache.COLUMNS
+        )
 
-class SatCatSerializer(serializers.Serializer):
-    def __init__(self, *args, **kwargs):
-        # dynamically set fields based on whatever is passed back by the spacetrack api
-        if 'instance' in kwargs and len(kwargs['instance']) > 0:
-            for field in kwargs['instance'][0]:
-                self.fields[field] = serializers.CharField()
-                if kwargs['instance'][0][field] is not None:
-                    if kwargs['instance'][0][field].isnumeric():
-                        self.fields[field] = serializers.IntegerField()
-                    elif is_float(kwargs['instance'][0][field]):
-                        self.fields[field] = serializers.FloatField()
 
-        super(SatCatSerializer, self).__init__(*args, **kwargs)
+class SatCatJSONRenderer(JSONRenderer):
+    # escaping non-ascii lets json use its C encoder, several times faster on a full catalog than ensure_ascii=False
+    ensure_ascii = True
 
 
 class SatCatViewSet(viewsets.ViewSet):
     serializer_class = SatCatSerializer
     permission_classes = []
+    renderer_classes = [SatCatJSONRenderer, BrowsableAPIRenderer]
 
     # Cache sattrack result for 24 hours
     @method_decorator(cache_page(60 * 60 * 24))
@@ -52,11 +56,14 @@ class SatCatViewSet(viewsets.ViewSet):
                 params.pop('format')
             if '_' in params:
                 params.pop('_')
-            st = SpaceTrackClient(identity=settings.SPACETRACK_IDENTITY, password=settings.SPACETRACK_PASSWORD)
-            response = st.satcat(**params)
+            try:
+                response = query_satcat(params)
+            except UnsupportedQuery as e:
+                logger.info('satelliteinfo from space-track: %s' % e)
+                st = spacetrack_client()
+                response = typed_satcat(st.satcat(**params))
 
             # ?favorites=Weather&orderby=SATNAME%20asc&metadata=false
             # response = json.loads('[{"NORAD_CAT_ID": "35817", "OBJECT_NUMBER": "35817", "OBJECT_NAME": "HTV-1", "INTLDES": "2009-048A", "OBJECT_ID": "2009-048A", "RCS": "0", "RCS_SIZE": "LARGE", "COUNTRY": "JPN", "MSG_EPOCH": null, "DECAY_EPOCH": "2009-11-01 0:00:00", "SOURCE": "satcat", "MSG_TYPE": "Historical", "PRECEDENCE": "1"}, {"NORAD_CAT_ID": "37351", "OBJECT_NUMBER": "37351", "OBJECT_NAME": "HTV 2", "INTLDES": "2011-003A", "OBJECT_ID": "2011-003A", "RCS": "0", "RCS_SIZE": "LARGE", "COUNTRY": "JPN", "MSG_EPOCH": "2011-03-30 04:13:00", "DECAY_EPOCH": "2011-03-30 0:00:00", "SOURCE": "decay_msg", "MSG_TYPE": "Historical", "PRECEDENCE": "2"}]')
 
-        serializer = SatCatSerializer(instance=response, many=True)
-        return Response(serializer.data)
+        return Response(response or [])
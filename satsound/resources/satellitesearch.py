@@ -0,0 +1,24 @@
+from rest_framework import serializers, viewsets
+from rest_framework.response import Response
+
+from ..search import search_names
+
+
+class SatelliteSearchSerializer(serializers.Serializer):
+    norad_id = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class SatelliteSearchViewSet(viewsets.ViewSet):
+    """Typeahead over satcat names: ?q=<partly typed name or NORAD id>&limit=<n>"""
+    serializer_class = SatelliteSearchSerializer
+    permission_classes = []
+
+    def list(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = int(request.query_params.get('limit', 0))
+        except ValueError:
+            limit = 0
+        results = [{'norad_id': norad_id, 'name': name} for norad_id, name in search_names(query, limit)]
+        return Response(SatelliteSearchSerializer(results, many=True).data)
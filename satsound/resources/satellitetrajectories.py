@@ -1,13 +1,38 @@
+import calendar
+import csv
 import datetime
-from random import randint
+import hashlib
+import io
+import json
+from collections import OrderedDict
 
 import django_filters
 import pytz
-from rest_framework import serializers, viewsets
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework import pagination, renderers, serializers, viewsets
+from rest_framework.response import Response
+from rest_framework.utils.serializer_helpers import ReturnDict
 
+try:
+    import msgpack
+except ImportError:
+    # optional: the msgpack format is only offered where it is installed
+    msgpack = None
+
+from ..caching import count_trajectory_hit, trajectory_bucket, trajectory_response_key, trajectory_version
 from ..models import *
 
 
+class FlatSatelliteTrajectoryListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        trajectories = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.local_times(trajectories)
+        return super(FlatSatelliteTrajectoryListSerializer, self).to_representation(trajectories)
+
+
 class FlatSatelliteTrajectorySerializer(serializers.ModelSerializer):
     norad_id = serializers.SerializerMethodField()
     name = serializers.SerializerMethodField()
@@ -15,33 +40,17 @@ class FlatSatelliteTrajectorySerializer(serializers.ModelSerializer):
     maxalt_time = serializers.SerializerMethodField()
     set_time = serializers.SerializerMethodField()
     audiofile = serializers.SerializerMethodField()
+    duration = serializers.SerializerMethodField()
+    peak = serializers.SerializerMethodField()
     username = serializers.SerializerMethodField()
     attribution = serializers.SerializerMethodField()
     type = serializers.SerializerMethodField()
     reviewed = serializers.SerializerMethodField()
 
-    def _choose_audio(self, obj):
-        if obj._audio is None:
-            audios = obj.satellite.satelliteaudio_set.filter(reviewed=True).order_by('-updated')
-            if audios.count() > 0:
-                # observer_window = datetime.timedelta(hours=int(obj.observer.trajectory_window))
-                # recent_window = timezone.now() - observer_window
-
-                # if most recent audio is within one hour of this trajectory's rise time, use it
-                imminence = abs((audios[0].updated - obj.rise_time).total_seconds() / 3600)
-                if imminence < settings.MAX_IMMINENCE:
-                    obj._audio = audios[0]
-                # otherwise, pick randomly
-                else:
-                    random_index = randint(0, audios.count() - 1)
-                    obj._audio = audios[random_index]
-
-        return obj._audio
-
     def _get_type_by_id(self, obj):
         ret = None
         for type in SatelliteAudio.TYPES:
-            if obj._audio.type == type[0]:
+            if obj.audio.type == type[0]:
                 ret = type[1]
 
         return ret
@@ -52,59 +61,84 @@ class FlatSatelliteTrajectorySerializer(serializers.ModelSerializer):
     def get_name(self, obj):
         return obj.satellite.name
 
-    def _get_localtime(self, obj, time):
-        tz = pytz.timezone(obj.observer.timezone)
-        return time.astimezone(tz)
+    def local_times(self, trajectories):
+        """Converts the rise, maximum altitude and set times of trajectories to their observer's timezone and formats
+        them in one pass, resolving each timezone once per response; returns {trajectory id: (rise, maxalt, set)}"""
+        timezones = self.context.setdefault('timezones', {})
+        times = self.context.setdefault('local_times', {})
+        time_format = settings.TRAJECTORY_TIME_FORMAT
+        for obj in trajectories:
+            tz = timezones.get(obj.observer_id)
+            if tz is None:
+                tz = timezones[obj.observer_id] = pytz.timezone(obj.observer.timezone)
+            times[obj.pk] = (
+                obj.rise_time.astimezone(tz).strftime(time_format),
+                obj.maxalt_time.astimezone(tz).strftime(time_format),
+                obj.set_time.astimezone(tz).strftime(time_format),
+            )
+        return times
+
+    def _get_localtimes(self, obj):
+        # a page's times are formatted by FlatSatelliteTrajectoryListSerializer; a single trajectory's on demand
+        times = self.context.get('local_times', {})
+        if obj.pk not in times:
+            times = self.local_times([obj])
+        return times[obj.pk]
 
     def get_rise_time(self, obj):
-        observer_rise_time = self._get_localtime(obj, obj.rise_time)
-        return observer_rise_time.strftime(settings.TRAJECTORY_TIME_FORMAT)
+        return self._get_localtimes(obj)[0]
 
     def get_maxalt_time(self, obj):
-        observer_maxalt_time = self._get_localtime(obj, obj.maxalt_time)
-        return observer_maxalt_time.strftime(settings.TRAJECTORY_TIME_FORMAT)
+        return self._get_localtimes(obj)[1]
 
     def get_set_time(self, obj):
-        observer_set_time = self._get_localtime(obj, obj.set_time)
-        return observer_set_time.strftime(settings.TRAJECTORY_TIME_FORMAT)
+        return self._get_localtimes(obj)[2]
 
     def get_audiofile(self, obj):
         ret = None
-        self._choose_audio(obj)
-        if obj._audio is not None:
-            ret = obj._audio.audio.name
+        if obj.audio is not None:
+            ret = obj.audio.delivered().name
+        return ret
+
+    def get_duration(self, obj):
+        ret = None
+        if obj.audio is not None:
+            ret = obj.audio.duration
+        return ret
+
+    def get_peak(self, obj):
+        ret = None
+        if obj.audio is not None:
+            ret = obj.audio.peak
         return ret
 
     def get_username(self, obj):
         ret = None
-        self._choose_audio(obj)
-        if obj._audio is not None:
-            ret = obj._audio.user.username
+        if obj.audio is not None:
+            ret = obj.audio.user.username
         return ret
 
     def get_attribution(self, obj):
         ret = None
-        self._choose_audio(obj)
-        if obj._audio is not None:
-            ret = obj._audio.attribution
+        if obj.audio is not None:
+            ret = obj.audio.attribution
         return ret
 
     def get_type(self, obj):
         ret = None
-        self._choose_audio(obj)
-        if obj._audio is not None:
+        if obj.audio is not None:
             ret = self._get_type_by_id(obj)
         return ret
 
     def get_reviewed(self, obj):
         ret = None
-        self._choose_audio(obj)
-        if obj._audio is not None:
-            ret = obj._audio.reviewed
+        if obj.audio is not None:
+            ret = obj.audio.reviewed
         return ret
 
     class Meta:
         model = SatelliteTrajectory
+        list_serializer_class = FlatSatelliteTrajectoryListSerializer
         fields = (
             'norad_id',
             'name',
@@ -115,6 +149,8 @@ class FlatSatelliteTrajectorySerializer(serializers.ModelSerializer):
             'set_time',
             'set_azimuth',
             'audiofile',
+            'duration',
+            'peak',
             'username',
             'attribution',
             'type',
@@ -122,33 +158,220 @@ class FlatSatelliteTrajectorySerializer(serializers.ModelSerializer):
         )
 
 
+class CompactSatelliteTrajectoryListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        rows = [self.child.row(obj) for obj in (data.all() if isinstance(data, models.Manager) else data)]
+        columns = zip(*rows) if rows else [()] * len(self.child.FIELDS)
+        return OrderedDict((name, list(column)) for name, column in zip(self.child.FIELDS, columns))
+
+    @property
+    def data(self):
+        # a page is a dict of columns rather than a list of rows
+        return ReturnDict(super(serializers.ListSerializer, self).data, serializer=self)
+
+
+class CompactSatelliteTrajectorySerializer(serializers.BaseSerializer):
+    """The fields of FlatSatelliteTrajectorySerializer for the compact formats: times in epoch seconds (UTC), angles
+    as floats, and a page as one list per field (see CompactSatelliteTrajectoryListSerializer), converted in one
+    pass without field-by-field serialization"""
+    # text, not the byte strings of Meta.fields, or msgpack sends the column names as binary
+    FIELDS = tuple(unicode(name) for name in FlatSatelliteTrajectorySerializer.Meta.fields)
+    TYPES = dict(SatelliteAudio.TYPES)
+
+    def row(self, obj):
+        audio = obj.audio
+        return (
+            obj.satellite_id,
+            obj.satellite.name,
+            calendar.timegm(obj.rise_time.utctimetuple()),
+            float(obj.rise_azimuth),
+            calendar.timegm(obj.maxalt_time.utctimetuple()),
+            float(obj.maxalt_altitude),
+            calendar.timegm(obj.set_time.utctimetuple()),
+            float(obj.set_azimuth),
+        ) + ((
+            audio.delivered().name,
+            audio.duration,
+            audio.peak,
+            audio.user.username,
+            audio.attribution,
+            self.TYPES.get(audio.type),
+            audio.reviewed,
+        ) if audio is not None else (None,) * 7)
+
+    def to_representation(self, obj):
+        return OrderedDict(zip(self.FIELDS, self.row(obj)))
+
+    class Meta:
+        list_serializer_class = CompactSatelliteTrajectoryListSerializer
+
+
+class TrajectoryColumnsRenderer(renderers.BaseRenderer):
+    """Compact JSON: no indentation or spaces, for the columns of CompactSatelliteTrajectorySerializer"""
+    media_type = 'application/vnd.apman.columns+json'
+    format = 'columns'
+    charset = None
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json.dumps(data, separators=(',', ':'))
+
+
+class TrajectoryCSVRenderer(renderers.BaseRenderer):
+    """A header of field names and a line per trajectory; the next and previous pages are in the Link header"""
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        # a page (or an error) is columns, a single trajectory one row of them
+        columns = [value if isinstance(value, list) else [value] for value in data.values()]
+
+        def cell(value):
+            if isinstance(value, bool):
+                return int(value)
+            return value.encode('utf-8') if isinstance(value, unicode) else value
+
+        out = io.BytesIO()
+        writer = csv.writer(out)
+        writer.writerow([cell(name) for name in data])
+        writer.writerows([cell(value) for value in row] for row in zip(*columns))
+        return out.getvalue()
+
+
+class TrajectoryMessagePackRenderer(renderers.BaseRenderer):
+    """The columns as MessagePack, angles and other floats in single precision"""
+    media_type = 'application/x-msgpack'
+    format = 'msgpack'
+    charset = None
+    columnar = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True, use_single_float=True)
+
+
 class FlatSatelliteTrajectoryFilter(django_filters.FilterSet):
     observer = django_filters.ModelChoiceFilter(required=True, queryset=Observer.objects.all())
     rise_time_window = django_filters.NumberFilter(name='rise_time', method='trajectory_window',
                                                    label='Rise time window')
+    past_window = django_filters.NumberFilter(name='rise_time', method='window_start', label='Past window')
+
+    def __init__(self, data=None, *args, **kwargs):
+        # always limit by x # of seconds from now, so the response never grows with the table
+        if data is not None and not data.get('rise_time_window'):
+            data = data.copy()
+            data['rise_time_window'] = settings.TRAJECTORY_DEFAULT_WINDOW
+        super(FlatSatelliteTrajectoryFilter, self).__init__(data, *args, **kwargs)
 
     def trajectory_window(self, queryset, name, value):
         lookup = '__'.join([name, 'range'])
-        start = timezone.now()
-        end = start + datetime.timedelta(seconds=int(value))
+        now = timezone.now()
+        # past passes are only included if asked for, up to past_window seconds ago
+        start = now - datetime.timedelta(seconds=int(self.form.cleaned_data.get('past_window') or 0))
+        end = now + datetime.timedelta(seconds=int(value))
 
         return queryset.filter(**{lookup: (start, end)})
 
+    def window_start(self, queryset, name, value):
+        # past_window is applied by trajectory_window
+        return queryset
+
     class Meta:
         model = SatelliteTrajectory
-        fields = ['observer', 'satellite', 'rise_time_window', ]
+        fields = ['observer', 'satellite', 'rise_time_window', 'past_window', ]
+
+
+class FlatSatelliteTrajectoryPagination(pagination.CursorPagination):
+    # keyset pagination on rise_time: pages cost the same however far into the window they are
+    ordering = 'rise_time'
+    page_size = settings.TRAJECTORY_PAGE_SIZE
+
+    def get_paginated_response(self, data):
+        # the body stays the page's trajectories, as Max/MSP patches read it; the next and previous pages are in the
+        # Link header
+        links = [(self.get_next_link(), 'next'), (self.get_previous_link(), 'previous')]
+        links = ', '.join('<%s>; rel="%s"' % (url, rel) for url, rel in links if url)
+        return Response(data, headers={'Link': links} if links else None)
+
+
+def trajectories_etag(request, *args, **kwargs):
+    # same observer version, time bucket, query and representation: same response (see list)
+    observer = request.query_params.get('observer', '')
+    if not observer.isdigit():
+        return None
+    etag = '%s:%s:%s:%s' % (trajectory_version(observer), trajectory_bucket(), request.get_full_path(),
+                            request.META.get('HTTP_ACCEPT', ''))
+    return hashlib.md5(etag.encode('utf-8')).hexdigest()
+
+
+def trajectories_last_modified(request, *args, **kwargs):
+    observer = request.query_params.get('observer', '')
+    if not observer.isdigit():
+        return None
+    # the feed changes when the observer's trajectories/audio do, and as its window moves with each time bucket
+    changed = max(trajectory_version(observer) / 1000.0, trajectory_bucket())
+    return datetime.datetime.utcfromtimestamp(changed)
 
 
 class FlatSatelliteTrajectoryViewset(viewsets.ReadOnlyModelViewSet):
-    """Flattened read-only satellite trajectories for consumption by Max/MSP,
-    filtered by: observer (required), satellite, rise time window (in seconds from now)"""
+    """Flattened read-only satellite trajectories for consumption by Max/MSP, paginated by rise time (the next and
+    previous pages are in the Link header) and filtered by: observer (required), satellite, rise time window (in seconds from now, defaults to
+    TRAJECTORY_DEFAULT_WINDOW), past window (in seconds before now, defaults to 0). Besides JSON, the feed comes in
+    compact formats (?format=columns, csv or msgpack, or their media types in Accept): a column per field, with epoch
+    seconds for times and floats for angles (see CompactSatelliteTrajectorySerializer)"""
     serializer_class = FlatSatelliteTrajectorySerializer
     filter_class = FlatSatelliteTrajectoryFilter
+    pagination_class = FlatSatelliteTrajectoryPagination
+    # JSON first: clients that don't ask for a format get what they always did
+    renderer_classes = [renderers.JSONRenderer, renderers.BrowsableAPIRenderer, TrajectoryColumnsRenderer,
+                        TrajectoryCSVRenderer] + ([TrajectoryMessagePackRenderer] if msgpack is not None else [])
+
+    def get_serializer_class(self):
+        # ?format=columns|csv|msgpack or the Accept header of one of them
+        if getattr(self.request.accepted_renderer, 'columnar', False):
+            return CompactSatelliteTrajectorySerializer
+        return self.serializer_class
 
     def get_queryset(self):
-        # always limit by x # of seconds from now
-        # start = timezone.now()
-        # end = start + datetime.timedelta(seconds=30)
-        # trajectories = SatelliteTrajectory.objects.filter(rise_time__range=(start, end)).order_by('rise_time')
-        trajectories = SatelliteTrajectory.objects.all().order_by('rise_time')
+        # satellites, observers and the audio assigned to each trajectory (with its user) come in the same query,
+        # so a page costs a constant number of queries rather than several per trajectory
+        trajectories = SatelliteTrajectory.objects.all().order_by('rise_time').select_related(
+            'satellite', 'observer', 'audio__user'
+        )
         return trajectories
+
+    # answer polls with 304 Not Modified before doing any work when the client's copy is current
+    @method_decorator(condition(etag_func=trajectories_etag, last_modified_func=trajectories_last_modified))
+    def list(self, request, *args, **kwargs):
+        # Max/MSP installations poll continuously, so serve repeated polls from the cache until the time bucket
+        # rolls over or the observer's trajectories/audio change (see caching.bump_trajectory_versions)
+        observer = request.query_params.get('observer', '')
+        if not observer.isdigit():
+            return super(FlatSatelliteTrajectoryViewset, self).list(request, *args, **kwargs)
+
+        key = trajectory_response_key(observer, request)
+        cached = cache.get(key)
+        count_trajectory_hit(cached is not None)
+        if cached is not None:
+            # the page and its Link header
+            data, link = cached
+            response = Response(data, headers={'X-Cache': 'HIT'})
+            if link:
+                response['Link'] = link
+        else:
+            response = super(FlatSatelliteTrajectoryViewset, self).list(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, (response.data, response.get('Link')), settings.TRAJECTORY_CACHE_BUCKET)
+            response['X-Cache'] = 'MISS'
+        # the format may come from Accept
+        patch_vary_headers(response, ['Accept'])
+        return response
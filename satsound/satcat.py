@@ -0,0 +1,118 @@
+from __future__ import unicode_literals
+
+from django.core.exceptions import ValidationError
+
+from .models import SatCatCache, SyncWatermark
+
+COLUMNS = dict(SatCatCache.COLUMNS)
+# type of each satcat column in /api/satelliteinfo responses, from the mirror's fields: int, float or None (string)
+TYPES = dict(
+    (column, {'IntegerField': int, 'FloatField': float}.get(SatCatCache._meta.get_field(name).get_internal_type()))
+    for column, name in SatCatCache.COLUMNS
+)
+NUMERIC = [(column, type_) for column, type_ in TYPES.items() if type_ is not None]
+# satcat predicates answered from the mirror; other predicates are sent upstream
+PREDICATES = ('NORAD_CAT_ID', 'OBJECT_NUMBER', 'OBJECT_NAME', 'SATNAME', 'COUNTRY', 'DECAY')
+IGNORED = ('METADATA',)
+
+
+class UnsupportedQuery(Exception):
+    pass
+
+
+def parse(field, value):
+    try:
+        return field.to_python(value)
+    except ValidationError:
+        raise UnsupportedQuery('%s is not a valid %s' % (value, field.name))
+
+
+def lookup(field, value):
+    """Returns (lookups, negated) for one space-track predicate value on field, e.g. ^ISS on name"""
+    name = field.name
+    char = field.get_internal_type() == 'CharField'
+    if value == 'null-val':
+        return {'%s__isnull' % name: True}, False
+    if value == '<>null-val':
+        return {'%s__isnull' % name: False}, False
+    if value.startswith('<>'):
+        return {'%s__iexact' % name if char else name: parse(field, value[2:])}, True
+    if value.startswith('>'):
+        return {'%s__gt' % name: parse(field, value[1:])}, False
+    if value.startswith('<'):
+        return {'%s__lt' % name: parse(field, value[1:])}, False
+    if value.startswith('~~') and char:
+        return {'%s__icontains' % name: value[2:]}, False
+    if value.startswith('^') and char:
+        return {'%s__istartswith' % name: value[1:]}, False
+    if '--' in value:
+        lo, hi = value.split('--', 1)
+        return {'%s__range' % name: (parse(field, lo), parse(field, hi))}, False
+    if ',' in value:
+        return {'%s__in' % name: [parse(field, v) for v in value.split(',')]}, False
+    return {'%s__iexact' % name if char else name: parse(field, value)}, False
+
+
+def typed_satcat(rows):
+    """Converts the numeric columns of space-track satcat rows (where every value is a string) to numbers, in place
+    and in one pass; values that don't parse are left as they are. Returns rows."""
+    for row in rows:
+        for column, type_ in NUMERIC:
+            value = row.get(column)
+            if value is not None:
+                try:
+                    row[column] = type_(value)
+                except ValueError:
+                    pass
+    return rows
+
+
+def to_satcat(values):
+    # a satcat row as typed_satcat returns it; blank in the mirror is null in space-track
+    return dict(
+        (column, None if values[name] in (None, '') else values[name] if TYPES[column] else '%s' % values[name])
+        for column, name in SatCatCache.COLUMNS
+    )
+
+
+def query_satcat(params):
+    """Returns the rows matching params (a space-track satcat query as a dict) from the local mirror, in the format of
+    space-track's satcat json as typed_satcat returns it, or raises UnsupportedQuery if the mirror can't answer it
+    exactly"""
+    if not SyncWatermark.objects.filter(pk='satcat').exists():
+        raise UnsupportedQuery('the satcat mirror has not been synced yet')
+
+    objects = SatCatCache.objects.all()
+    order = ['norad_id']
+    limit = offset = None
+    for key, value in params.items():
+        key = key.upper()
+        if key in IGNORED:
+            continue
+        if key == 'CURRENT':
+            if value.upper() != 'Y':
+                raise UnsupportedQuery('the satcat mirror only has current records')
+        elif key == 'ORDERBY':
+            order = []
+            for term in value.split(','):
+                column, _, direction = term.strip().partition(' ')
+                if column.upper() not in COLUMNS or direction.strip().lower() not in ('', 'asc', 'desc'):
+                    raise UnsupportedQuery('unsupported orderby %s' % term)
+                order.append('%s%s' % ('-' if direction.strip().lower() == 'desc' else '', COLUMNS[column.upper()]))
+        elif key == 'LIMIT':
+            try:
+                limit, _, offset = value.partition(',')
+                limit, offset = int(limit), int(offset or 0)
+            except ValueError:
+                raise UnsupportedQuery('unsupported limit %s' % value)
+        elif key in PREDICATES:
+            lookups, negated = lookup(SatCatCache._meta.get_field(COLUMNS[key]), value)
+            objects = objects.exclude(**lookups) if negated else objects.filter(**lookups)
+        else:
+            raise UnsupportedQuery('unsupported predicate %s' % key)
+
+    # ties in norad_id order, like space-track
+    objects = objects.order_by(*(order + ['norad_id']))
+    if limit is not None:
+        objects = objects[offset:offset + limit]
+    return [to_satcat(values) for values in objects.values(*SatCatCache.FIELDS)]
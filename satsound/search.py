@@ -0,0 +1,187 @@
+import bisect
+import heapq
+import itertools
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+from .caching import satcat_version
+from .models import SatCatCache
+
+FUZZY_MIN_LENGTH = 4  # shorter words only match exactly or by prefix: one edit away is most of the word
+FUZZY_PREFIX_TOKENS = 200  # words a last, partly typed query word may stand for when matching fuzzily
+POSTINGS_SET_SIZE = 16  # words of more names than this keep their ids in a set as well
+
+
+def normalize(name):
+    # upper case words of letters and digits: 'Sl-16 r/b' -> 'SL 16 R B'
+    return ' '.join(re.findall(r'[A-Z0-9]+', name.upper()))
+
+
+def deletes(token):
+    # the token and every variant of it with one character deleted: two tokens are within one edit (and most
+    # within two) of each other if their variants intersect
+    return set([token] + [token[:i] + token[i + 1:] for i in range(len(token))])
+
+
+class NameIndex(object):
+    """In-memory index of satellite names for typeahead: ranked by NORAD id, name prefix, word prefixes and
+    finally words within an edit or two"""
+
+    def __init__(self, entries):
+        entries = sorted((normalize(name), norad_id, name) for norad_id, name in entries)
+        self.names = dict((norad_id, name) for key, norad_id, name in entries)
+        self.by_name = [(key, norad_id) for key, norad_id, name in entries]
+        # ids shortest name first, the order names matching by word are ranked in, and each id's place in it
+        self.by_rank = [norad_id for key, norad_id, name in sorted(entries, key=lambda e: (len(e[0]), e[0], e[1]))]
+        self.rank = dict((norad_id, i) for i, norad_id in enumerate(self.by_rank))
+        # word: ids, in name order
+        self.postings = defaultdict(list)
+        for key, norad_id, name in entries:
+            for token in set(key.split()):
+                self.postings[token].append(norad_id)
+        self.tokens = sorted(self.postings)
+        # word: places of its ids, in rank order, to merge rather than collect the ids of common words
+        self.ranked = dict((token, sorted(self.rank[norad_id] for norad_id in ids))
+                           for token, ids in self.postings.items())
+        # word: ids as a set to intersect with, if there are enough of them to be worth one
+        self.sets = dict(
+            (token, frozenset(ids) if len(ids) > POSTINGS_SET_SIZE else ids) for token, ids in self.postings.items()
+        )
+        self.variants = defaultdict(set)
+        for token in self.tokens:
+            if len(token) >= FUZZY_MIN_LENGTH and token.isalpha():
+                for variant in deletes(token):
+                    self.variants[variant].add(token)
+
+    def prefixed(self, prefix):
+        # words starting with prefix, alphabetically
+        i = bisect.bisect_left(self.tokens, prefix)
+        while i < len(self.tokens) and self.tokens[i].startswith(prefix):
+            yield self.tokens[i]
+            i += 1
+
+    def fuzzy(self, token):
+        if len(token) < FUZZY_MIN_LENGTH:
+            return set()
+        matches = set()
+        for variant in deletes(token):
+            matches.update(self.variants.get(variant, ()))
+        return matches
+
+    def completions(self, last, fuzzy):
+        # words last, a partly typed query word, may stand for: those starting with it (fuzzily, only so many of them)
+        # and fuzzily those like it
+        for i, word in enumerate(self.prefixed(last)):
+            if fuzzy and i == FUZZY_PREFIX_TOKENS:
+                break
+            yield word
+        for word in self.fuzzy(last) if fuzzy else ():
+            yield word
+
+    def matching(self, tokens, last, fuzzy, limit):
+        """Ids of names having every word of tokens (fuzzily: or one like it) and a word starting with last,
+        shortest names first: all of them if there are no tokens, else up to limit"""
+        completions = self.completions(last, fuzzy)
+        if not tokens:
+            # lazily, so only as many ids as are taken are visited, however common the words
+            return (self.by_rank[i] for i in heapq.merge(*[self.ranked[word] for word in completions]))
+
+        # the words each query word may be and how many names have one of them, fewest first
+        alternatives = []
+        for token in tokens:
+            words = [word for word in [token] + (list(self.fuzzy(token)) if fuzzy else []) if word in self.sets]
+            if not words:
+                return []
+            alternatives.append((sum(len(self.sets[word]) for word in words), words))
+        alternatives.sort(key=lambda alternative: alternative[0])
+        # the last word goes first if it is rarer still, counted only that far, as it may stand for very many words
+        words, size = [], 0
+        for word in completions:
+            words.append(word)
+            size += len(self.sets[word])
+            if size > alternatives[0][0]:
+                alternatives.append((size, itertools.chain(words, completions)))
+                break
+        else:
+            alternatives.insert(0, (size, words))
+
+        ids = None
+        for size, words in alternatives:
+            matched = set()
+            for word in words:
+                # intersecting set against set iterates the smaller one, so ids of common words are never all visited
+                matched.update(self.sets[word] if ids is None else ids.intersection(self.sets[word]))
+            ids = matched
+            if not ids:
+                return []
+        return heapq.nsmallest(limit, ids, key=self.rank.get)
+
+    def search(self, query, limit=10):
+        """Returns up to limit (norad_id, name) best matching query, a partly typed name or NORAD id"""
+        key = normalize(query)
+        if not key:
+            return []
+        results = []
+        seen = set()
+
+        def add(ids):
+            for norad_id in ids:
+                if norad_id not in seen:
+                    seen.add(norad_id)
+                    results.append((norad_id, self.names[norad_id]))
+                    if len(results) == limit:
+                        return True
+            return False
+
+        if key.isdigit() and add([int(key)] if int(key) in self.names else []):
+            return results
+
+        # names starting with the query, alphabetically
+        i = bisect.bisect_left(self.by_name, (key,))
+        prefixed = []
+        while i < len(self.by_name) and self.by_name[i][0].startswith(key) and len(prefixed) < limit:
+            prefixed.append(self.by_name[i][1])
+            i += 1
+        if add(prefixed):
+            return results
+
+        tokens = key.split()
+        if len(tokens) == 1:
+            # names with a word starting with the query, by word
+            for word in self.prefixed(key):
+                if add(self.postings[word]):
+                    return results
+
+        # every word matches, the last one by prefix (done above for one word), then the same allowing for typos;
+        # shortest names first
+        fuzzy = [True] if any(self.fuzzy(token) for token in tokens) else []
+        for fuzzy in [False] * (len(tokens) > 1) + fuzzy:
+            if add(self.matching(tokens[:-1], tokens[-1], fuzzy, limit)):
+                break
+        return results
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def name_index():
+    """Returns this process's index of SatCatCache names, rebuilding it when pop_satcache changed the cache"""
+    global _index, _index_version
+    version = satcat_version()
+    if _index is None or _index_version != version:
+        with _index_lock:
+            if _index is None or _index_version != version:
+                _index = NameIndex(SatCatCache.objects.values_list('norad_id', 'name').iterator())
+                _index_version = version
+    return _index
+
+
+def search_names(query, limit=None):
+    # at least one: a negative limit would never be reached and nsmallest would be asked for none
+    limit = max(1, min(limit or settings.SEARCH_DEFAULT_LIMIT, settings.SEARCH_MAX_LIMIT))
+    return name_index().search(query, limit)
@@ -0,0 +1,145 @@
+import math
+from datetime import timedelta
+
+import numpy
+from django.conf import settings
+from django.utils import timezone
+from sgp4.api import Satrec, jday
+
+# WGS84 ellipsoid, km
+EARTH_RADIUS = 6378.137
+EARTH_FLATTENING = 1 / 298.257223563
+EARTH_E2 = EARTH_FLATTENING * (2 - EARTH_FLATTENING)
+
+GOLDEN = (math.sqrt(5) - 1) / 2
+ROOT_ITERATIONS = 12  # bisections of a rise/set bracket: SGP4_STEP / 2**12, well under a second
+PEAK_ITERATIONS = 24  # golden section steps over rise..set for culmination: ~15 min * 0.618**24, under a second
+WINDOW_MARGIN = 3  # hours sampled past the longest window so that a pass rising at its end also sets
+
+
+def gmst(jd, fr):
+    # Greenwich mean sidereal time in radians (IAU-82, the rotation between SGP4's TEME frame and earth-fixed)
+    tut1 = (jd - 2451545.0 + fr) / 36525.0
+    seconds = (67310.54841 + (876600.0 * 3600 + 8640184.812866) * tut1 + 0.093104 * tut1 ** 2 -
+               6.2e-6 * tut1 ** 3)
+    return numpy.radians(numpy.mod(seconds, 86400.0) / 240.0)
+
+
+def observer_frames(observers):
+    """Earth-fixed positions (km) and east/north/up rotations of observer_params tuples, as (n, 3) and (n, 3, 3)"""
+    lat = numpy.radians([observer[1] for observer in observers])
+    lon = numpy.radians([observer[2] for observer in observers])
+    height = numpy.array([observer[3] for observer in observers], dtype=float) / 1000
+    n = EARTH_RADIUS / numpy.sqrt(1 - EARTH_E2 * numpy.sin(lat) ** 2)
+
+    positions = numpy.stack([
+        (n + height) * numpy.cos(lat) * numpy.cos(lon),
+        (n + height) * numpy.cos(lat) * numpy.sin(lon),
+        (n * (1 - EARTH_E2) + height) * numpy.sin(lat),
+    ], axis=-1)
+    rotations = numpy.stack([
+        numpy.stack([-numpy.sin(lon), numpy.cos(lon), numpy.zeros_like(lon)], axis=-1),
+        numpy.stack([-numpy.sin(lat) * numpy.cos(lon), -numpy.sin(lat) * numpy.sin(lon), numpy.cos(lat)], axis=-1),
+        numpy.stack([numpy.cos(lat) * numpy.cos(lon), numpy.cos(lat) * numpy.sin(lon), numpy.sin(lat)], axis=-1),
+    ], axis=-2)
+    return positions, rotations
+
+
+class SGP4Backend(object):
+    """Vectorized backend: propagates the TLE over a whole time grid at once with sgp4 and finds rise, culmination
+    and set of every observer's passes by root finding on the sampled elevation series"""
+    # all observers of a satellite share one propagation, so refresh_trajectories --workers hands them out together
+    batch_observers = True
+
+    def look_angles(self, sat, jd, fr, offsets, positions, rotations):
+        """Elevation and azimuth (radians) of sat at offsets (seconds from jd + fr) seen from positions/rotations,
+        which broadcast against offsets. Propagation errors (e.g. decayed orbits) count as below the horizon."""
+        days = fr + offsets / 86400.0
+        error, r, v = sat.sgp4_array(numpy.full(offsets.shape, jd), days)
+        theta = gmst(jd, days)
+        earth_fixed = numpy.stack([
+            numpy.cos(theta) * r[..., 0] + numpy.sin(theta) * r[..., 1],
+            -numpy.sin(theta) * r[..., 0] + numpy.cos(theta) * r[..., 1],
+            r[..., 2],
+        ], axis=-1)
+        east, north, up = numpy.rollaxis(numpy.einsum('...ij,...j->...i', rotations, earth_fixed - positions), -1)
+        elevation = numpy.where(error != 0, -math.pi / 2, numpy.arctan2(up, numpy.hypot(east, north)))
+        azimuth = numpy.mod(numpy.arctan2(east, north), 2 * math.pi)
+        return elevation, azimuth
+
+    def compute(self, name, tle, observers, starts=None):
+        """Returns {observer pk: passes} in the format of propagation.compute_passes for observers
+        (observer_params tuples), only keeping passes that rise after starts[pk] if given"""
+        starts = starts or {}
+        line1, line2 = tle.split('\n')
+        sat = Satrec.twoline2rv(str(line1), str(line2))
+        now = timezone.now()
+        jd, fr = jday(now.year, now.month, now.day, now.hour, now.minute, now.second + now.microsecond / 1e6)
+        positions, rotations = observer_frames(observers)
+
+        step = settings.SGP4_STEP
+        span = (max(observer[4] for observer in observers) + WINDOW_MARGIN) * 3600
+        offsets = numpy.arange(0, span + step, step, dtype=float)
+        elevation, azimuth = self.look_angles(sat, jd, fr, offsets, positions[:, None], rotations[:, None])
+
+        # horizon crossings between consecutive samples, ordered by observer then time, so rises and sets alternate
+        up = elevation > 0
+        obs, index = numpy.nonzero(up[:, 1:] != up[:, :-1])
+        rising = up[obs, index + 1]
+        passes = dict((observer[0], []) for observer in observers)
+        if not len(obs):
+            # never crosses the horizon, e.g. geostationary
+            return passes
+
+        def crossing_elevation(t):
+            return self.look_angles(sat, jd, fr, t, positions[obs], rotations[obs])[0]
+
+        lo, hi = offsets[index], offsets[index + 1]
+        for i in range(ROOT_ITERATIONS):
+            mid = (lo + hi) / 2
+            before = (crossing_elevation(mid) > 0) != rising
+            lo, hi = numpy.where(before, mid, lo), numpy.where(before, hi, mid)
+        crossings = (lo + hi) / 2
+
+        # a pass is a rise followed by a set for the same observer; leading sets and trailing rises are partial
+        rises = numpy.nonzero(rising[:-1] & (obs[1:] == obs[:-1]))[0]
+        obs, rise, set_ = obs[rises], crossings[rises], crossings[rises + 1]
+        if not len(obs):
+            return passes
+
+        def pass_elevation(t):
+            return self.look_angles(sat, jd, fr, t, positions[obs], rotations[obs])[0]
+
+        # culmination by golden section search between rise and set
+        a, b = rise, set_
+        c, d = b - GOLDEN * (b - a), a + GOLDEN * (b - a)
+        fc, fd = pass_elevation(c), pass_elevation(d)
+        for i in range(PEAK_ITERATIONS):
+            left = fc > fd
+            a, b = numpy.where(left, a, c), numpy.where(left, d, b)
+            t = numpy.where(left, b - GOLDEN * (b - a), a + GOLDEN * (b - a))
+            ft = pass_elevation(t)
+            c, fc, d, fd = (numpy.where(left, t, d), numpy.where(left, ft, fd),
+                            numpy.where(left, c, t), numpy.where(left, fc, ft))
+        peak = numpy.where(fc > fd, c, d)
+        peak_elevation = numpy.maximum(fc, fd)
+
+        rise_azimuth = self.look_angles(sat, jd, fr, rise, positions[obs], rotations[obs])[1]
+        set_azimuth = self.look_angles(sat, jd, fr, set_, positions[obs], rotations[obs])[1]
+
+        for k in range(len(obs)):
+            observer = observers[obs[k]]
+            start = starts.get(observer[0])
+            if start is not None and rise[k] < (start - now).total_seconds():
+                continue
+            if rise[k] >= observer[4] * 3600:
+                continue
+            passes[observer[0]].append((
+                now + timedelta(seconds=float(rise[k])),
+                math.degrees(rise_azimuth[k]),
+                now + timedelta(seconds=float(peak[k])),
+                math.degrees(peak_elevation[k]),
+                now + timedelta(seconds=float(set_[k])),
+                math.degrees(set_azimuth[k]),
+            ))
+        return passes
@@ -63,6 +63,7 @@
 
         reset: function(){
             this.$modal_title = this.$modal_title.text('Uploading');
+            this.$modal_message.empty();
             this.$modal_footer.hide();
             this.$modal_bar.addClass('progress-bar-success');
             this.$modal_bar.removeClass('progress-bar-danger');
@@ -79,6 +80,12 @@
                 keyboard: false
             });
 
+            var file = this.$form.find(':file').get(0);
+            this.direct = !!(this.options.upload_url && file && file.files.length);
+            if(this.direct){
+                return this.direct_submit(file.files[0]);
+            }
+
             // We need the native XMLHttpRequest for the progress event
             var xhr = new XMLHttpRequest();
             this.xhr = xhr;
@@ -98,6 +105,65 @@
             xhr.send(data);
         },
 
+        // upload the file straight to S3 with a presigned POST from upload_url (its fields include the Content-Type),
+        // then tell complete_url about it
+        direct_submit: function(file) {
+            var self = this;
+            var fields = this.$form.find(':input').not(':file').serializeArray();
+            fields.push({name: 'filename', value: file.name}, {name: 'size', value: file.size},
+                        {name: 'content_type', value: file.type});
+            var csrf = this.$form.find('[name=csrfmiddlewaretoken]').val();
+
+            $.post(this.options.upload_url, $.param(fields)).done(function(response){
+                var data = new FormData();
+                $.each(response.upload.fields, function(name, value){
+                    data.append(name, value);
+                });
+                data.append('file', file);  // must be the last field
+
+                var xhr = new XMLHttpRequest();
+                self.xhr = xhr;
+                xhr.upload.addEventListener('progress', $.proxy(self.progress, self));
+                xhr.addEventListener('error', $.proxy(self.direct_error, self, xhr));
+                xhr.addEventListener('load', function(){
+                    if(xhr.status == 0 || xhr.status >= 300){
+                        return self.direct_error(xhr);
+                    }
+                    $.post(self.options.complete_url, {csrfmiddlewaretoken: csrf, token: response.token})
+                        .done(function(completed){
+                            self.set_progress(100);
+                            window.location.href = completed.redirect_url;
+                        })
+                        .fail($.proxy(self.direct_error, self));
+                });
+                xhr.open('POST', response.upload.url);
+                xhr.send(data);
+            }).fail($.proxy(this.direct_error, this));
+        },
+
+        // show the errors of a direct upload (JSON from our views, XML from S3) in the modal
+        direct_error: function(xhr){
+            this.$modal_title.text('Upload failed');
+            this.$modal_bar.removeClass('progress-bar-success');
+            this.$modal_bar.addClass('progress-bar-danger');
+            this.$modal_footer.show();
+
+            var response = xhr.responseJSON || {};
+            var messages = [];
+            if(response.error){
+                messages.push(response.error);
+            }
+            $.each(response.errors || {}, function(field, errors){
+                messages = messages.concat(errors);
+            });
+            if(!messages.length){
+                messages.push('The file could not be uploaded (' + (xhr.status || 'network error') + ').');
+            }
+            this.$modal_message.html($.map(messages, function(message){
+                return $('<p>').text(message);
+            }));
+        },
+
         success: function(xhr) {
             if(xhr.status == 0 || xhr.status >= 400){
                 // HTTP 500 ends up here!?!
@@ -156,10 +222,12 @@
 
         progress: function(/*ProgressEvent*/e){
             var percent = (e.loaded / e.total) * 100;
-            this.set_progress(Math.round(percent * (this.options.finished_percent / 100)));
+            // direct uploads go to S3 already
+            var finished_percent = this.direct ? 100 : this.options.finished_percent;
+            this.set_progress(Math.round(percent * (finished_percent / 100)));
 
             // fake progress representing upload from server to S3
-            if (this.options.finished_percent < 100 && percent >= 100) {
+            if (finished_percent < 100 && percent >= 100) {
                 var increment = Math.round((100 - this.options.finished_percent) / this.options.additional_seconds);
                 var fake_progress = this.options.finished_percent;
                 var last_progress = setInterval(function() {
@@ -206,6 +274,7 @@
         finished_percent: 80,
         additional_seconds: 5
         //redirect_url: ...
+        //upload_url, complete_url: to upload straight to S3 (see sataudio_upload)
 
         // need to customize stuff? Add here, and change code accordingly.
     };
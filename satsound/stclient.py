@@ -0,0 +1,119 @@
+import csv
+import logging
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from spacetrack import SpaceTrackClient
+
+logger = logging.getLogger('commands')
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket(object):
+    """Allows at most calls requests in any period seconds: bursts of up to burst requests, refilled at
+    (calls - burst) / period tokens per second"""
+
+    def __init__(self, calls, period, burst):
+        self.capacity = burst
+        self.rate = float(calls - burst) / period
+        self.tokens = float(burst)
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            # negative tokens are requests queued ahead of the refill
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            logger.info('Space-Track rate limit reached. Sleeping for %.1f seconds.' % wait)
+            time.sleep(wait)
+
+
+class SpaceTrackLimiter(object):
+    """Context manager in place of SpaceTrackClient's RateLimiter, enforcing every (calls, period, burst) in
+    settings.SPACETRACK_RATE_LIMITS, e.g. Space-Track's per-minute and per-hour quotas"""
+
+    def __init__(self, limits):
+        self.buckets = [TokenBucket(*limit) for limit in limits]
+        # SpaceTrackClient sleeps this long after a rate limit violation before retrying
+        self.period = min(limit[1] for limit in limits)
+
+    def __enter__(self):
+        for bucket in self.buckets:
+            bucket.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class SharedSpaceTrackClient(SpaceTrackClient):
+    """SpaceTrackClient meant to be shared by the whole process (see spacetrack_client): it logs in once and keeps
+    its session, connection pool and downloaded predicates, throttles to settings.SPACETRACK_RATE_LIMITS, and
+    retries failed requests with exponential backoff, logging in again if the session expired"""
+
+    def __init__(self, identity, password):
+        super(SharedSpaceTrackClient, self).__init__(identity, password)
+        self.base_url = settings.SPACETRACK_URL
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.SPACETRACK_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._ratelimiter = SpaceTrackLimiter(settings.SPACETRACK_RATE_LIMITS)
+        self._login_lock = threading.Lock()
+
+    def authenticate(self):
+        with self._login_lock:
+            super(SharedSpaceTrackClient, self).authenticate()
+
+    def _ratelimited_get(self, *args, **kwargs):
+        retries = settings.SPACETRACK_RETRIES
+        for attempt in range(retries + 1):
+            try:
+                resp = super(SharedSpaceTrackClient, self)._ratelimited_get(*args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == retries:
+                    raise
+                logger.warning('Space-Track request failed (%s), retrying' % e)
+            else:
+                if resp.status_code == 401 and attempt < retries:
+                    # session expired: log in again on the same session
+                    self._authenticated = False
+                    self.authenticate()
+                    continue
+                if resp.status_code not in RETRY_STATUSES or attempt == retries:
+                    return resp
+                logger.warning('Space-Track responded %s, retrying' % resp.status_code)
+
+            time.sleep(settings.SPACETRACK_BACKOFF * 2 ** attempt)
+
+
+def iter_csv(lines):
+    """Yields the rows of a format=csv response, e.g. streamed with iter_lines, as dicts; null is ''"""
+    reader = csv.reader(line.encode('utf-8') for line in lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    for values in reader:
+        yield dict(zip(header, (value.decode('utf-8') for value in values)))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def spacetrack_client():
+    """Returns the process-wide Space-Track client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SharedSpaceTrackClient(settings.SPACETRACK_IDENTITY, settings.SPACETRACK_PASSWORD)
+    return _client
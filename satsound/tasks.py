@@ -0,0 +1,39 @@
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+
+from .models import *
+
+# run by run_jobs, queued with Job.objects.enqueue('satsound.tasks.<function>', **kwargs); a task raising is
+# retried (see Job.run), so tasks must be safe to run again
+
+
+def setup_satellite(norad_id):
+    Satellite.objects.get(pk=norad_id).setup()
+
+
+def refresh_observer(observer_id):
+    observer = Observer.objects.filter(pk=observer_id).first()
+    if observer is not None:
+        observer.update_trajectories()
+
+
+def process_audio(audio_id):
+    audio = SatelliteAudio.objects.filter(pk=audio_id, processed__isnull=True).first()
+    if audio is None:
+        # deleted, or processed by process_audio already
+        return
+    try:
+        audio.process()
+    except RenditionError as e:
+        # won't render next time either
+        logger.error('process_audio could not render audio %s (%s): %s' % (audio.pk, audio.audio.name, e))
+
+
+def prune_upload(name):
+    # a direct upload (see views.sataudio_upload) that was never completed, or whose file was rejected
+    if not SatelliteAudio.objects.filter(audio=name).exists():
+        default_storage.delete(name)
+
+
+def email_admin(subject, message):
+    send_mail(subject, message, settings.ADMINS[0][1], [settings.ADMINS[0][1]])
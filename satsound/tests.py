@@ -1 +1,811 @@
-# Create your tests here.
+import base64
+import datetime
+import io
+import json
+import re
+import shutil
+import struct
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import skipUnless
+
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from . import directupload, stclient, tasks, views
+from .admin import ObserverAdmin
+from .caching import bump_satcat_version, trajectory_version
+from .management.commands.fake_spacetrack import Catalog, FakeSpaceTrackServer, tle_checksum
+from .models import *
+from .propagation import PyEphemBackend
+from .resources.satellitetrajectories import (FlatSatelliteTrajectoryPagination, FlatSatelliteTrajectorySerializer,
+                                              msgpack)
+from .satcat import UnsupportedQuery, query_satcat, typed_satcat
+from .search import NameIndex
+from .sgp4backend import SGP4Backend
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+DUMMY_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+class MediaTestCase(TestCase):
+    """Keeps uploaded files in a temporary MEDIA_ROOT"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super(MediaTestCase, cls).setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(MediaTestCase, cls).tearDownClass()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def make_audio(self, satellite, user, **kwargs):
+        return SatelliteAudio.objects.create(
+            satellite=satellite, user=user, type=1, audio=SimpleUploadedFile('a.wav', b'RIFF0000WAVE'), **kwargs
+        )
+
+
+class SatelliteAudioApiTest(MediaTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('o0', password='x')
+        self.satellite = Satellite.objects.create(norad_id=25544, name='ISS')
+        self.audio = self.make_audio(self.satellite, self.user)
+
+    def test_unprocessed_audio_list(self):
+        self.assertIsNone(self.audio.processed)
+        response = self.client.get('/api/satelliteaudio/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+
+    def test_unprocessed_audio_detail(self):
+        response = self.client.get('/api/satelliteaudio/%s/' % self.audio.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+
+    def test_processed_audio_moves_last_modified(self):
+        before = self.client.get('/api/satelliteaudio/%s/' % self.audio.pk)['Last-Modified']
+        SatelliteAudio.objects.filter(pk=self.audio.pk).update(processed=self.audio.updated + timedelta(days=1))
+        after = self.client.get('/api/satelliteaudio/%s/' % self.audio.pk)['Last-Modified']
+        self.assertNotEqual(before, after)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AudioAssignmentTest(MediaTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('o0', password='x')
+        self.observer = Observer.objects.create(user=self.user, lat='51.5', lon='-0.1')
+        self.satellite = Satellite.objects.create(norad_id=25544, name='ISS')
+        self.audios = [self.make_audio(self.satellite, self.user, reviewed=True) for i in range(2)]
+        # far enough ahead that each pass gets a random one of the audio
+        now = timezone.now()
+        SatelliteTrajectory.objects.bulk_create(
+            SatelliteTrajectory(
+                satellite=self.satellite, observer=self.observer, rise_time=now + timedelta(hours=10 + i),
+                rise_azimuth=10, maxalt_time=now + timedelta(hours=10 + i, minutes=5), maxalt_altitude=45,
+                set_time=now + timedelta(hours=10 + i, minutes=10), set_azimuth=200,
+            )
+            for i in range(30)
+        )
+        self.satellite.assign_audio()
+
+    def assigned(self):
+        return list(self.satellite.satellitetrajectory_set.order_by('rise_time').values_list('audio', flat=True))
+
+    def test_saving_keeps_assignment(self):
+        assigned = self.assigned()
+        version = trajectory_version(self.observer.pk)
+        self.audios[0].attribution = 'me'
+        self.audios[0].save()
+        self.assertEqual(self.assigned(), assigned)
+        # the passes show the new attribution
+        self.assertGreater(trajectory_version(self.observer.pk), version)
+
+    def test_reviewing_reassigns(self):
+        self.audios[0].reviewed = False
+        self.audios[0].save()
+        self.assertEqual(set(self.assigned()), {self.audios[1].pk})
+        self.audios[0].reviewed = True
+        self.audios[0].save()
+        self.assertEqual(set(self.assigned()), {audio.pk for audio in self.audios})
+
+
+class TrajectoryFeedTestCase(MediaTestCase):
+    def setUp(self):
+        # pages and versions another test cached for an observer of the same pk
+        cache.clear()
+        self.user = User.objects.create_user('o0', password='x')
+        self.observer = Observer.objects.create(user=self.user, lat='51.5', lon='-0.1')
+        self.satellites = []
+
+    def make_trajectories(self, count):
+        # count trajectories over the next hours, each of its own satellite, every other one with audio
+        now = timezone.now()
+        for i in range(len(self.satellites), len(self.satellites) + count):
+            satellite = Satellite.objects.create(norad_id=10000 + i, name='SAT %s' % i)
+            self.satellites.append(satellite)
+            audio = self.make_audio(satellite, self.user, reviewed=True) if i % 2 else None
+            rise = now + timedelta(minutes=10 + i)
+            SatelliteTrajectory.objects.create(
+                satellite=satellite, observer=self.observer, audio=audio, rise_time=rise, rise_azimuth=10,
+                maxalt_time=rise + timedelta(minutes=5), maxalt_altitude=45, set_time=rise + timedelta(minutes=10),
+                set_azimuth=200,
+            )
+
+    def feed(self, **params):
+        params.setdefault('observer', self.observer.pk)
+        return self.client.get('/api/satellitetrajectories/', params)
+
+
+@skipUnless(msgpack, 'msgpack is not installed')
+class TrajectoryMessagePackTest(TrajectoryFeedTestCase):
+    def test_text_keys(self):
+        self.make_trajectories(3)
+        page_size = FlatSatelliteTrajectoryPagination.page_size
+        FlatSatelliteTrajectoryPagination.page_size = 2
+        self.addCleanup(setattr, FlatSatelliteTrajectoryPagination, 'page_size', page_size)
+
+        response = self.feed(format='msgpack')
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        # as a client following the spec (msgpack-js, Python 3) decodes it: binary stays bytes
+        data = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual(sorted(data), sorted(FlatSatelliteTrajectorySerializer.Meta.fields))
+        for name, column in data.items():
+            self.assertIsInstance(name, unicode)
+            self.assertEqual(len(column), 2)
+        self.assertIsInstance(data['audiofile'][1], unicode)
+        self.assertIn('rel="next"', response['Link'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TrajectoryPaginationTest(TrajectoryFeedTestCase):
+    def setUp(self):
+        super(TrajectoryPaginationTest, self).setUp()
+        page_size = FlatSatelliteTrajectoryPagination.page_size
+        FlatSatelliteTrajectoryPagination.page_size = 2
+        self.addCleanup(setattr, FlatSatelliteTrajectoryPagination, 'page_size', page_size)
+        self.make_trajectories(3)
+
+    def links(self, response):
+        return dict((rel, url) for url, rel in re.findall(r'<([^>]+)>; rel="(\w+)"', response.get('Link', '')))
+
+    def test_link_header(self):
+        # the body is the list of trajectories Max/MSP patches always got
+        response = self.feed()
+        self.assertEqual([row['name'] for row in response.data], ['SAT 0', 'SAT 1'])
+        self.assertEqual(list(self.links(response)), ['next'])
+
+        response = self.client.get(self.links(response)['next'])
+        self.assertEqual([row['name'] for row in response.data], ['SAT 2'])
+        self.assertEqual(list(self.links(response)), ['previous'])
+
+    def test_cached_link_header(self):
+        link = self.feed()['Link']
+        response = self.feed()
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response['Link'], link)
+
+
+class TrajectoryFeedQueriesTest(TrajectoryFeedTestCase):
+    def page_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.feed()
+        self.assertEqual(response.status_code, 200)
+        return len(queries), len(response.data)
+
+    def test_queries_independent_of_page_size(self):
+        self.make_trajectories(2)
+        queries, count = self.page_queries()
+        self.assertEqual(count, 2)
+
+        self.make_trajectories(18)
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.feed()
+        self.assertEqual(len(response.data), 20)
+        # satellite, audio and its user come with the trajectories
+        self.assertTrue(all(row['name'] for row in response.data))
+        self.assertEqual(len([row for row in response.data if row['username'] == 'o0']), 10)
+
+
+class AudioManifestTest(TrajectoryFeedTestCase):
+    def manifest(self, **params):
+        params.setdefault('observer', self.observer.pk)
+        return self.client.get('/api/audiomanifest/', params)
+
+    def test_hours(self):
+        self.make_trajectories(2)
+        response = self.manifest(hours=1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([audio['id'] for audio in response.data['audio']],
+                         list(SatelliteAudio.objects.values_list('pk', flat=True)))
+        for hours in ('x', 'nan', 'inf', '-inf'):
+            self.assertEqual(self.manifest(hours=hours).status_code, 400)
+
+
+@override_settings(CACHES=DUMMY_CACHES)
+class TrajectoryFeedWithoutCacheTest(TrajectoryFeedTestCase):
+    # as when memcached is down: nothing cached, no versions remembered
+    def test_feed(self):
+        self.make_trajectories(2)
+        response = self.feed()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+    def test_audio_manifest(self):
+        self.make_trajectories(2)
+        response = self.client.get('/api/audiomanifest/', {'observer': self.observer.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['audio']), 1)
+
+
+def wav(size=1024):
+    data = b'\x00' * size
+    return (b'RIFF' + struct.pack('<I', 36 + len(data)) + b'WAVEfmt ' +
+            struct.pack('<IHHIIHH', 16, 1, 1, 8000, 8000, 1, 8) + b'data' + struct.pack('<I', len(data)) + data)
+
+
+@override_settings(USE_S3=True)
+class DirectUploadTest(TestCase):
+    """Direct uploads against S3 storage whose client is stubbed: every request it makes to S3 must be one queued
+    with expect"""
+
+    def setUp(self):
+        self.storage = S3Boto3Storage(location='media', access_key='test', secret_key='test', bucket_name='apman',
+                                      region_name='us-east-1')
+        self.s3 = Stubber(self.storage.connection.meta.client)
+        self.s3.activate()
+        self.addCleanup(self.s3.deactivate)
+        for module in (directupload, tasks, views):
+            self.addCleanup(setattr, module, 'default_storage', module.default_storage)
+            module.default_storage = self.storage
+
+        self.user = User.objects.create_user('o0', password='x')
+        self.client.force_login(self.user)
+        Satellite.objects.create(norad_id=25544, name='ISS')
+
+    def expect(self, method, key, response=None, status=None):
+        params = {'Bucket': 'apman', 'Key': 'media/' + key}
+        if status:
+            self.s3.add_client_error(method, service_error_code=str(status), http_status_code=status,
+                                     expected_params=params)
+        else:
+            self.s3.add_response(method, response or {}, dict(params, Range=ANY) if method == 'get_object' else params)
+
+    def expect_object(self, key, body, size=None):
+        self.expect('head_object', key, {'ContentLength': len(body) if size is None else size})
+        self.expect('get_object', key, {'Body': StreamingBody(io.BytesIO(body[:settings.AUDIO_SNIFF_SIZE]),
+                                                              min(len(body), settings.AUDIO_SNIFF_SIZE))})
+
+    def expect_public(self, key):
+        self.s3.add_response('put_object_acl', {}, {'Bucket': 'apman', 'Key': 'media/' + key,
+                                                    'ACL': self.storage.default_acl})
+
+    def upload(self, filename='a.wav', content_type='audio/wav'):
+        # the name it picks is free (see available_name)
+        self.s3.add_client_error('head_object', service_error_code='404', http_status_code=404)
+        response = self.client.post('/sat/25544/upload/', {'attribution': 'me', 'type': 1, 'filename': filename,
+                                                          'size': 2048, 'content_type': content_type})
+        self.assertEqual(response.status_code, 200)
+        upload = json.loads(response.content)
+        return upload, signing.loads(upload['token'], salt=views.DIRECT_UPLOAD_SALT)['name']
+
+    def complete(self, token):
+        return self.client.post('/sat/25544/upload/complete/', {'token': token})
+
+    def test_presigned_post(self):
+        post = directupload.presigned_post('25544/a.wav', 'audio/wav')
+        self.assertEqual(post['fields']['key'], 'media/25544/a.wav')
+        # private until completing the upload has checked it
+        self.assertEqual((post['fields']['acl'], post['fields']['Content-Type']), ('private', 'audio/wav'))
+        policy = json.loads(base64.b64decode(post['fields']['policy']))
+        self.assertIn({'acl': 'private'}, policy['conditions'])
+        self.assertIn(['content-length-range', 1, settings.MAX_AUDIOFILE_SIZE], policy['conditions'])
+        self.assertIn(['starts-with', '$Content-Type', 'audio/'], policy['conditions'])
+        expires = datetime.datetime.strptime(policy['expiration'], '%Y-%m-%dT%H:%M:%SZ')
+        self.assertAlmostEqual((expires - datetime.datetime.utcnow()).total_seconds(), settings.AUDIO_UPLOAD_EXPIRY, delta=60)
+
+    def test_upload_and_complete(self):
+        upload, name = self.upload()
+        self.assertTrue(name.startswith('25544/') and name.endswith('.wav'))
+        self.assertEqual(upload['upload']['fields']['key'], 'media/' + name)
+
+        self.expect_object(name, wav())
+        self.expect_public(name)
+        response = self.complete(upload['token'])
+        self.assertEqual(response.status_code, 200)
+        audio = SatelliteAudio.objects.get()
+        self.assertEqual((audio.audio.name, audio.user, audio.attribution, audio.type), (name, self.user, 'me', 1))
+        self.s3.assert_no_pending_responses()
+
+        # completing again (a retried request) neither looks at the object again nor adds the audio twice
+        response = self.complete(upload['token'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(SatelliteAudio.objects.count(), 1)
+
+    def test_content_type(self):
+        upload, name = self.upload(content_type='')
+        # guessed from the name when the browser doesn't know it
+        self.assertTrue(upload['upload']['fields']['Content-Type'].startswith('audio/'))
+
+        for filename, content_type in (('a.txt', ''), ('a.wav', 'text/html')):
+            response = self.client.post('/sat/25544/upload/', {'type': 1, 'filename': filename, 'size': 2048,
+                                                              'content_type': content_type})
+            self.assertEqual(response.status_code, 422)
+            self.assertIn('content_type', json.loads(response.content)['errors'])
+
+    def test_prune_uncompleted_upload(self):
+        upload, name = self.upload()
+        job = Job.objects.get(task='satsound.tasks.prune_upload')
+        self.assertEqual(json.loads(job.kwargs), {'name': name})
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=settings.AUDIO_UPLOAD_EXPIRY))
+
+        self.expect('delete_object', name)
+        tasks.prune_upload(name)
+        self.s3.assert_no_pending_responses()
+
+    def test_prune_completed_upload(self):
+        upload, name = self.upload()
+        self.expect_object(name, wav())
+        self.expect_public(name)
+        self.assertEqual(self.complete(upload['token']).status_code, 200)
+        # kept: any request to S3 would be unexpected
+        tasks.prune_upload(name)
+
+    def test_tampered_token(self):
+        upload, name = self.upload()
+        token = signing.dumps(dict(signing.loads(upload['token'], salt=views.DIRECT_UPLOAD_SALT), user=0),
+                              salt=views.DIRECT_UPLOAD_SALT)
+        for token in (upload['token'][:-1], token, ''):
+            self.assertEqual(self.complete(token).status_code, 400)
+        self.assertFalse(SatelliteAudio.objects.exists())
+
+    def test_expired_token(self):
+        upload, name = self.upload()
+        with override_settings(AUDIO_UPLOAD_EXPIRY=-1):
+            self.assertEqual(self.complete(upload['token']).status_code, 400)
+        self.assertFalse(SatelliteAudio.objects.exists())
+
+    def test_missing_object(self):
+        upload, name = self.upload()
+        self.expect('head_object', name, status=404)
+        self.assertEqual(self.complete(upload['token']).status_code, 400)
+        self.assertFalse(SatelliteAudio.objects.exists())
+
+    def test_wrong_type(self):
+        upload, name = self.upload()
+        self.expect_object(name, b'hello ' * 100)
+        self.expect('delete_object', name)
+        response = self.complete(upload['token'])
+        self.assertEqual(response.status_code, 422)
+        self.assertIn('not supported', json.loads(response.content)['errors']['audio'][0])
+        self.assertFalse(SatelliteAudio.objects.exists())
+        self.s3.assert_no_pending_responses()
+
+    def test_oversize(self):
+        upload, name = self.upload()
+        self.expect('head_object', name, {'ContentLength': settings.MAX_AUDIOFILE_SIZE + 1})
+        self.expect('delete_object', name)
+        self.assertEqual(self.complete(upload['token']).status_code, 422)
+        self.assertFalse(SatelliteAudio.objects.exists())
+        self.s3.assert_no_pending_responses()
+
+
+class TwoLineElementPruneTest(TestCase):
+    def add(self, norad_id, days_ago):
+        return TwoLineElement.objects.create(norad_id=norad_id, epoch=timezone.now() - timedelta(days=days_ago),
+                                             line1='1 %05d' % norad_id, line2='2 %05d %s' % (norad_id, days_ago))
+
+    def test_keeps_latest_element_set(self):
+        history = settings.TLE_HISTORY_DAYS
+        current = [self.add(1, 1), self.add(1, history + 1)]
+        stale = [self.add(2, history + 1), self.add(2, history + 5)]
+        self.assertEqual(TwoLineElement.objects.prune(batch_size=1), 2)
+        # object 1's old set goes; object 2 hasn't been updated within the history but keeps its newest
+        self.assertEqual(set(TwoLineElement.objects.values_list('pk', flat=True)), {current[0].pk, stale[0].pk})
+        self.assertEqual(set(TwoLineElement.objects.latest_tles()), {1, 2})
+
+
+def make_tle(motion, inclination, eccentricity, norad_id=25544):
+    # a TLE of the given mean motion (revolutions a day) with an epoch of now, so no backend extrapolates far
+    epoch = datetime.datetime.utcnow()
+    day = epoch.timetuple().tm_yday + (epoch.hour * 3600 + epoch.minute * 60 + epoch.second) / 86400.0
+    line1 = '1 %05dU 98067A   %02d%012.8f  .00001234  00000-0  12345-3 0  999' % (norad_id, epoch.year % 100, day)
+    line2 = '2 %05d %8.4f 247.4627 %07d 130.5360 325.0288 %11.8f56353' % (norad_id, inclination, eccentricity, motion)
+    return '%s%s\n%s%s' % (line1, tle_checksum(line1), line2, tle_checksum(line2))
+
+
+class PropagationBackendTest(TestCase):
+    # London, Sydney and New York over the next day
+    observers = [(1, 51.5, -0.1, 0, 24), (2, -33.9, 151.2, 100, 24), (3, 40.7, -74.0, 10, 24)]
+
+    def assertPassesAgree(self, reference, passes):
+        # each pass clearing 10 degrees has a counterpart in the other backend. Grazing passes are left out: where
+        # elevation barely clears the horizon, the backends' slightly different orbits move rise and set by tens of
+        # seconds, or decide whether there is a pass at all. pyephem stops at a pass it can't order (one under way,
+        # or some grazing ones), so only the stretch it covers is compared.
+        def agree(a, b):
+            return (all(abs((a[i] - b[i]).total_seconds()) < 10 for i in (0, 2, 4)) and
+                    all(abs((a[i] - b[i] + 180) % 360 - 180) < 2 for i in (1, 3, 5)))
+
+        compared = 0
+        for observer, _, _, _, window in self.observers:
+            end = timezone.now() + timedelta(hours=window)
+            expected = [p for p in reference[observer] if p[0] < end]
+            if not expected:
+                continue
+            found = [p for p in passes[observer] if expected[0][0] - timedelta(minutes=1) < p[0] < expected[-1][4]]
+            for a, others in [(a, found) for a in expected] + [(b, expected) for b in found]:
+                if a[3] > 10:
+                    self.assertTrue(any(agree(a, b) for b in others), a)
+                    compared += 1
+        self.assertTrue(compared)
+
+    def test_low_earth_orbit(self):
+        tle = make_tle(15.5, 51.6416, 6703)
+        self.assertPassesAgree(PyEphemBackend().compute(u'ISS', tle, self.observers),
+                               SGP4Backend().compute('ISS', tle, self.observers))
+
+    def test_geostationary(self):
+        # always up over some observers, never over the others: no horizon crossings at all
+        tle = make_tle(1.00273791, 0.05, 1000)
+        self.assertEqual(PyEphemBackend().compute(u'GEO', tle, self.observers), {1: [], 2: [], 3: []})
+        self.assertEqual(SGP4Backend().compute('GEO', tle, self.observers), {1: [], 2: [], 3: []})
+
+
+class RefreshTrajectoriesTest(TestCase):
+    def setUp(self):
+        self.observers = [
+            Observer.objects.create(user=User.objects.create_user('o0'), lat='51.5', lon='-0.1'),
+            Observer.objects.create(user=User.objects.create_user('o1'), lat='-33.9', lon='151.2', elevation=100),
+            Observer.objects.create(user=User.objects.create_user('o2'), lat='40.7', lon='-74', elevation=10),
+        ]
+        self.satellites = []
+        for norad_id, motion, inclination in ((25544, 15.5, 51.6416), (33591, 14.1, 99.1)):
+            tle = make_tle(motion, inclination, 6703, norad_id)
+            self.satellites.append(Satellite.objects.create(norad_id=norad_id, name=u'SAT %s' % norad_id, tle=tle))
+            line1, line2 = tle.split('\n')
+            TwoLineElement.objects.create(norad_id=norad_id, epoch=tle_epoch(tle), line1=line1, line2=line2)
+
+    def refresh(self, **kwargs):
+        out = StringIO()
+        call_command('refresh_trajectories', no_pull=True, stdout=out, **kwargs)
+        return out.getvalue()
+
+    def passes(self):
+        return list(SatelliteTrajectory.objects.order_by('satellite', 'observer', 'rise_time').values_list(
+            'satellite', 'observer', 'rise_time', 'maxalt_time', 'set_time'))
+
+    def hourly_passes(self, count):
+        # passes as the backend returns them, one an hour over each observer
+        now = timezone.now()
+        return dict((observer.pk, [
+            (now + timedelta(hours=i), 10.0, now + timedelta(hours=i, minutes=5), 45.0,
+             now + timedelta(hours=i, minutes=10), 200.0)
+            for i in range(1, count + 1)
+        ]) for observer in self.observers)
+
+    def assertSamePasses(self, passes, expected):
+        # predicted a moment apart, so the same passes to within pyephem's search precision
+        self.assertEqual(len(passes), len(expected))
+        for a, b in zip(passes, expected):
+            self.assertEqual(a[:2], b[:2])
+            for i in (2, 3, 4):
+                self.assertLess(abs((a[i] - b[i]).total_seconds()), 1, (a, b))
+
+    def test_workers(self):
+        self.refresh()
+        serial = self.passes()
+        self.assertTrue(serial)
+
+        out = self.refresh(workers=2)
+        self.assertSamePasses(self.passes(), serial)
+        self.assertIn('tasks on 2 workers', out)
+
+    def test_incremental(self):
+        satellite = self.satellites[0]
+        satellite.update_trajectories()
+        computed = self.passes()
+        self.assertTrue(computed)
+
+        # as if the windows had moved on since: the end of each observer's not computed yet, and a pass over
+        kept = []
+        for observer in self.observers:
+            passes = satellite.satellitetrajectory_set.filter(observer=observer).order_by('rise_time')
+            pks = list(passes.values_list('pk', flat=True))
+            kept.extend(pks[:len(pks) // 2])
+            passes.filter(pk__in=pks[len(pks) // 2:]).delete()
+        now = timezone.now()
+        past = SatelliteTrajectory.objects.create(
+            satellite=satellite, observer=self.observers[0], rise_time=now - timedelta(hours=1), rise_azimuth=10,
+            maxalt_time=now - timedelta(minutes=55), maxalt_altitude=45, set_time=now - timedelta(minutes=50),
+            set_azimuth=200,
+        )
+
+        satellite.update_trajectories(incremental=True)
+        self.assertFalse(SatelliteTrajectory.objects.filter(pk=past.pk).exists())
+        # the upcoming passes are kept as they were and only the missing end is computed again
+        self.assertEqual(set(kept) - set(satellite.satellitetrajectory_set.values_list('pk', flat=True)), set())
+        self.assertSamePasses(self.passes(), computed)
+
+    def test_batched_insert(self):
+        satellite = self.satellites[0]
+        with CaptureQueriesContext(connection) as queries:
+            satellite.update_trajectories(passes=self.hourly_passes(3), batch_size=2)
+        inserts = [query for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        # 9 trajectories
+        self.assertEqual(len(inserts), 5)
+        self.assertEqual(satellite.satellitetrajectory_set.count(), 9)
+
+    def test_swap_is_atomic(self):
+        satellite = self.satellites[0]
+        satellite.update_trajectories(passes=self.hourly_passes(3))
+        trajectories = list(satellite.satellitetrajectory_set.values_list('pk', flat=True))
+
+        # the insert fails (a pass without times) after the old trajectories were deleted: the delete is undone
+        broken = (None, 10.0, None, 45.0, None, 200.0)
+        with self.assertRaises(IntegrityError):
+            satellite.update_trajectories(passes={self.observers[0].pk: [broken]})
+        self.assertEqual(list(satellite.satellitetrajectory_set.values_list('pk', flat=True)), trajectories)
+
+
+def flaky_task(fails):
+    # a task for JobTest that fails its first fails calls
+    flaky_task.calls += 1
+    if flaky_task.calls <= fails:
+        raise RuntimeError('attempt %s' % flaky_task.calls)
+
+
+@override_settings(JOB_RETRY_DELAY=0)
+class JobTest(TestCase):
+    def setUp(self):
+        flaky_task.calls = 0
+
+    def test_retry_succeeds(self):
+        Job.objects.enqueue('satsound.tests.flaky_task', fails=1)
+        job = Job.objects.claim('test')
+        self.assertFalse(job.run())
+        self.assertEqual(job.status, Job.PENDING)
+        self.assertIn('attempt 1', job.error)
+
+        job = Job.objects.claim('test')
+        self.assertTrue(job.run())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (Job.DONE, 2, ''))
+
+    def test_stale_job_fails_out_of_attempts(self):
+        # left running by a worker that died, e.g. killed by the task itself, every time it is claimed
+        Job.objects.enqueue('satsound.tests.flaky_task', fails=0)
+        stale = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT + 1)
+        for attempt in range(1, settings.JOB_MAX_ATTEMPTS + 1):
+            job = Job.objects.claim('test')
+            self.assertEqual(job.attempts, attempt)
+            Job.objects.filter(pk=job.pk).update(started=stale)
+            self.assertEqual(Job.objects.requeue_stale(), (0, 1) if attempt == settings.JOB_MAX_ATTEMPTS else (1, 0))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, settings.JOB_MAX_ATTEMPTS))
+        self.assertIn('timed out', job.error)
+        self.assertIsNone(Job.objects.claim('test'))
+        self.assertEqual(flaky_task.calls, 0)
+
+
+class ObserverRefreshTest(TestCase):
+    def setUp(self):
+        self.satellite = Satellite.objects.create(norad_id=25544, name=u'ISS', tle=make_tle(15.5, 51.6416, 6703))
+        self.jobs = Job.objects.filter(task='satsound.tasks.refresh_observer')
+
+    def test_changes_queue_one_refresh(self):
+        observer = Observer.objects.create(user=User.objects.create_user('o0'), lat='51.5', lon='-0.1')
+        self.assertEqual(list(self.jobs.values_list('kwargs', flat=True)), [json.dumps({'observer_id': observer.pk})])
+
+        # fields passes don't depend on
+        observer.active = False
+        observer.ip = '10.0.0.1:54321'
+        observer.save()
+        self.assertEqual(self.jobs.count(), 1)
+
+        for count, (field, value) in enumerate((('lat', '48.9'), ('lon', '2.35'), ('elevation', 35),
+                                                ('trajectory_window', 48)), 2):
+            setattr(observer, field, value)
+            observer.save()
+            self.assertEqual(self.jobs.count(), count, field)
+
+    def test_refresh_observer(self):
+        observer, other = [
+            Observer.objects.create(user=User.objects.create_user('o%s' % i), lat='51.5', lon='-0.1') for i in range(2)
+        ]
+        # a stale pass of the observer, from before it moved
+        now = timezone.now()
+        stale, kept = [
+            SatelliteTrajectory.objects.create(
+                satellite=self.satellite, observer=o, rise_time=now + timedelta(hours=1), rise_azimuth=10,
+                maxalt_time=now + timedelta(hours=1, minutes=5), maxalt_altitude=45,
+                set_time=now + timedelta(hours=1, minutes=10), set_azimuth=200,
+            )
+            for o in (observer, other)
+        ]
+
+        tasks.refresh_observer(observer.pk)
+        self.assertFalse(SatelliteTrajectory.objects.filter(pk=stale.pk).exists())
+        # its passes as the backend predicts them
+        passes = PyEphemBackend().compute(self.satellite.name, self.satellite.tle, [observer_params(observer)])
+        rises = list(observer.satellitetrajectory_set.order_by('rise_time').values_list('rise_time', flat=True))
+        self.assertEqual(len(rises), len(passes[observer.pk]))
+        for rise, p in zip(rises, passes[observer.pk]):
+            self.assertLess(abs((rise - p[0]).total_seconds()), 1)
+        # other observers are left alone
+        self.assertEqual(list(other.satellitetrajectory_set.values_list('pk', flat=True)), [kept.pk])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ObserverAdminTest(TestCase):
+    def test_update_timezone_invalidates_feeds(self):
+        moved = Observer.objects.create(user=User.objects.create_user('o0'), lat='40.7', lon='-74')
+        unchanged = Observer.objects.create(user=User.objects.create_user('o1'), lat='51.5', lon='-0.1')
+        Observer.objects.filter(pk=moved.pk).update(timezone='Europe/London')
+        versions = dict((o.pk, trajectory_version(o.pk)) for o in (moved, unchanged))
+
+        ObserverAdmin(Observer, admin.site).update_timezone(None, Observer.objects.all())
+        moved.refresh_from_db()
+        self.assertEqual(moved.timezone, 'America/New_York')
+        self.assertGreater(trajectory_version(moved.pk), versions[moved.pk])
+        self.assertEqual(trajectory_version(unchanged.pk), versions[unchanged.pk])
+
+
+@override_settings(SPACETRACK_IDENTITY='test', SPACETRACK_PASSWORD='test', SPACETRACK_RATE_LIMITS=((1000, 1, 1000),))
+class FakeSpaceTrackTestCase(TestCase):
+    """Points the Space-Track client at a fake_spacetrack server over a small synthetic catalog, fresh for each
+    test"""
+
+    @classmethod
+    def setUpClass(cls):
+        super(FakeSpaceTrackTestCase, cls).setUpClass()
+        cls.server = FakeSpaceTrackServer(('127.0.0.1', 0), None)
+        threading.Thread(target=cls.server.serve_forever).start()
+        cls.spacetrack_settings = override_settings(SPACETRACK_URL='http://127.0.0.1:%s/' % cls.server.server_port)
+        cls.spacetrack_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.spacetrack_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(FakeSpaceTrackTestCase, cls).tearDownClass()
+
+    def setUp(self):
+        self.catalog = self.server.catalog = Catalog(300, 0)
+        # the process-wide client, created for the fake server
+        stclient._client = None
+        self.addCleanup(setattr, stclient, '_client', None)
+
+
+class SatCatSyncTest(FakeSpaceTrackTestCase):
+    def mirrored(self):
+        return dict((obj.pk, (obj.name, obj.decay, obj.updated)) for obj in SatCatCache.objects.all())
+
+    def test_full_sync(self):
+        rows = self.catalog.rows['satcat']
+        self.assertEqual(SatCatCache.objects.sync(), (len(rows), 0))
+        mirrored = self.mirrored()
+        self.assertEqual(set(mirrored), set(int(row['NORAD_CAT_ID']) for row in rows))
+        # decayed objects stay in the catalog, and so in the mirror
+        decayed = [int(row['NORAD_CAT_ID']) for row in rows if row['DECAY']]
+        self.assertTrue(decayed)
+        self.assertEqual(set(SatCatCache.objects.filter(decay__isnull=False).values_list('pk', flat=True)),
+                         set(decayed))
+
+        # idempotent: nothing changed upstream, nothing written
+        self.assertEqual(SatCatCache.objects.sync(full=True), (0, 0))
+        self.assertEqual(self.mirrored(), mirrored)
+
+        # only what changed is written, and only objects dropped from the catalog are deleted
+        dropped = rows.pop()
+        rows[0].update(SATNAME='RENAMED', OBJECT_NAME='RENAMED')
+        self.assertEqual(SatCatCache.objects.sync(full=True), (1, 1))
+        synced = self.mirrored()
+        self.assertNotIn(int(dropped['NORAD_CAT_ID']), synced)
+        self.assertEqual(synced.pop(int(rows[0]['NORAD_CAT_ID']))[0], 'RENAMED')
+        self.assertEqual(synced, dict((pk, values) for pk, values in mirrored.items() if pk in synced))
+
+    def test_incremental_sync(self):
+        SatCatCache.objects.sync()
+        rows = self.catalog.rows['satcat']
+        # changed since the last sync: fetched and upserted, and nothing else
+        changed = (datetime.datetime.utcnow() + timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
+        rows[5].update(SATNAME='RENAMED', OBJECT_NAME='RENAMED', DECAY='2020-01-01')
+        rows[6].update(SATNAME='NOT SYNCED', OBJECT_NAME='NOT SYNCED')
+        self.catalog.rows['satcat_change'].append({
+            'NORAD_CAT_ID': rows[5]['NORAD_CAT_ID'], 'OBJECT_NUMBER': rows[5]['NORAD_CAT_ID'],
+            'CURRENT_NAME': 'RENAMED', 'PREVIOUS_NAME': 'OBJECT', 'CURRENT_DECAY': '2020-01-01',
+            'PREVIOUS_DECAY': None, 'CHANGE_MADE': changed,
+        })
+        self.assertEqual(SatCatCache.objects.sync(), (1, 0))
+        self.assertEqual(SatCatCache.objects.get(pk=rows[5]['NORAD_CAT_ID']).decay, datetime.date(2020, 1, 1))
+        self.assertNotEqual(SatCatCache.objects.get(pk=rows[6]['NORAD_CAT_ID']).name, 'NOT SYNCED')
+
+
+class SatCatQueryTest(FakeSpaceTrackTestCase):
+    # satcat queries the mirror answers, as /api/satelliteinfo passes them on
+    queries = [
+        {'norad_cat_id': '25'},
+        {'norad_cat_id': '5,17,250'},
+        {'norad_cat_id': '10--20', 'orderby': 'NORAD_CAT_ID desc'},
+        {'object_name': '^cosmos', 'limit': '5'},
+        {'satname': '~~link', 'country': 'US'},
+        {'country': 'PRC', 'decay': 'null-val', 'orderby': 'SATNAME asc', 'limit': '10,5'},
+        {'country': '<>US', 'norad_cat_id': '<40'},
+        {'decay': '>1980-01-01', 'orderby': 'DECAY desc'},
+    ]
+
+    def test_matches_upstream(self):
+        SatCatCache.objects.sync()
+        upstream_queries = dict(self.server.counts)
+        local = [query_satcat(dict(params, metadata='false')) for params in self.queries]
+        self.assertEqual(self.server.counts, upstream_queries)
+
+        st = stclient.spacetrack_client()
+        for params, rows in zip(self.queries, local):
+            self.assertTrue(rows, params)
+            self.assertEqual(rows, typed_satcat(st.satcat(metadata='false', **params)), params)
+
+    def test_unsupported(self):
+        SatCatCache.objects.sync()
+        for params in ({'apogee': '>500'}, {'current': 'N'}, {'orderby': 'SATNAME sideways'},
+                       {'norad_cat_id': '>abc'}):
+            with self.assertRaises(UnsupportedQuery):
+                query_satcat(params)
+
+
+class SatelliteSearchTest(TestCase):
+    def setUp(self):
+        SatCatCache.objects.bulk_create(
+            SatCatCache(norad_id=norad_id, name=name)
+            for norad_id, name in [(25544, 'ISS (ZARYA)'), (25545, 'ISS DEB'), (25546, 'ISS DEB 2')]
+        )
+        bump_satcat_version()
+
+    def search(self, **params):
+        response = self.client.get('/api/satellitesearch/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_limit(self):
+        self.assertEqual(len(self.search(q='iss')), 3)
+        self.assertEqual(len(self.search(q='iss', limit=2)), 2)
+        for limit in (-5, -1):
+            self.assertEqual(len(self.search(q='iss', limit=limit)), 1)
+            self.assertEqual(len(self.search(q='iss deb', limit=limit)), 1)
+
+    def test_ranking(self):
+        index = NameIndex([(1, 'IRIDIUM 100'), (2, 'IRIDIUM 10'), (3, 'IRIDIUM 7'), (4, 'COSMOS 1'), (5, 'COSMOS 12'),
+                           (6, 'SL-16 R/B'), (7, 'IRIDIUM 17 DEB')])
+        # a typo: names with words like it, shortest first, as many as asked for
+        self.assertEqual(index.search('iridum', 3), [(3, 'IRIDIUM 7'), (2, 'IRIDIUM 10'), (1, 'IRIDIUM 100')])
+        self.assertEqual(index.search('csomos', 10), [(4, 'COSMOS 1'), (5, 'COSMOS 12')])
+        # every word, the last one by prefix, however rare it is next to the others
+        self.assertEqual(index.search('iridium 1', 10), [(2, 'IRIDIUM 10'), (1, 'IRIDIUM 100'), (7, 'IRIDIUM 17 DEB')])
+        self.assertEqual(index.search('deb iridium 1', 10), [(7, 'IRIDIUM 17 DEB')])
+        self.assertEqual(index.search('iridum 10', 10), [(2, 'IRIDIUM 10'), (1, 'IRIDIUM 100')])
+        self.assertEqual(index.search('cosmos 7', 10), [])
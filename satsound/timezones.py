@@ -0,0 +1,51 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from timezonefinder import TimezoneFinder
+
+_finder = None
+_lock = threading.Lock()
+# (lat, lon): timezone name, least recently used first
+_cache = OrderedDict()
+
+
+def timezone_finder():
+    """Returns the process-wide TimezoneFinder, loading its polygon data on first use"""
+    global _finder
+    if _finder is None:
+        with _lock:
+            if _finder is None:
+                # https://github.com/MrMinimal64/timezonefinder
+                _finder = TimezoneFinder()
+    return _finder
+
+
+def find_timezone(lat, lon):
+    finder = timezone_finder()
+    try:
+        name = finder.timezone_at(lng=lon, lat=lat)
+        if name is None:
+            # at sea: the closest zone within a degree, which is slow, hence the cache
+            name = finder.closest_timezone_at(lng=lon, lat=lat)
+        return name
+    except ValueError:
+        # the coordinates were out of bounds
+        return None
+
+
+def timezone_at(lat, lon):
+    """Returns the name of the timezone at lat, lon, or None if there is none near or they are out of bounds. The last
+    TIMEZONE_CACHE_SIZE answers are remembered, so observers at the same coordinates are only looked up once."""
+    key = (float(lat), float(lon))
+    with _lock:
+        if key in _cache:
+            name = _cache.pop(key)
+            _cache[key] = name
+            return name
+    name = find_timezone(*key)
+    with _lock:
+        _cache[key] = name
+        while len(_cache) > settings.TIMEZONE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return name
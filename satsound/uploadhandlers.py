@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+
+class AudioSizeLimitUploadHandler(FileUploadHandler):
+    """Counts the bytes of each uploaded file as its chunks stream in and skips the rest of a file once it exceeds
+    settings.MAX_AUDIOFILE_SIZE, rather than spooling all of it to find out afterwards. Skipped fields are listed in
+    request.oversized_uploads."""
+
+    def new_file(self, field_name, *args, **kwargs):
+        super(AudioSizeLimitUploadHandler, self).new_file(field_name, *args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.MAX_AUDIOFILE_SIZE:
+            if not hasattr(self.request, 'oversized_uploads'):
+                self.request.oversized_uploads = []
+            self.request.oversized_uploads.append(self.field_name)
+            raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        # the next handler keeps the file
+        return None
@@ -7,7 +7,9 @@ from .views import *
 router = routers.DefaultRouter()
 router.register(r'satellitetrajectories', FlatSatelliteTrajectoryViewset, 'satellitetrajectories')
 router.register(r'satelliteinfo', SatCatViewSet, 'satelliteinfo')
+router.register(r'satellitesearch', SatelliteSearchViewSet, 'satellitesearch')
 router.register(r'satelliteaudio', SatelliteAudioViewset, 'satelliteaudio')
+router.register(r'audiomanifest', AudioManifestViewSet, 'audiomanifest')
 
 api_urls = [
                # non-viewset views
@@ -16,4 +18,6 @@ api_urls = [
 satsound_urls = [
     url(r'^$', index, name='index'),
     url(r'^sat/(?P<norad_id>[\w\-]+)/$', sataudio, name='satellite'),
+    url(r'^sat/(?P<norad_id>[\w\-]+)/upload/$', sataudio_upload, name='satellite_upload'),
+    url(r'^sat/(?P<norad_id>[\w\-]+)/upload/complete/$', sataudio_complete, name='satellite_upload_complete'),
 ]
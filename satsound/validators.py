@@ -5,17 +5,33 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 
 
-def validate_audio_size(upload):
-    size = upload.file.size
+def audio_size_message():
+    return 'Audio file size must be less than %s MB.' % (settings.MAX_AUDIOFILE_SIZE / 1024 / 1024)
+
+
+def check_audio_size(size):
     if size > settings.MAX_AUDIOFILE_SIZE:
-        raise ValidationError('Audio file size must be less than %s MB.' % (settings.MAX_AUDIOFILE_SIZE / 1024 / 1024))
+        raise ValidationError(audio_size_message())
 
 
-def validate_audio_type(upload):
+def check_audio_header(header):
     # header-based type detection
-    file_type = magic.from_buffer(upload.file.read(), mime=True)
+    file_type = magic.from_buffer(header, mime=True)
     if file_type not in settings.AUDIO_TYPES:
         atypelist = ["'%s'" % atype for atype in settings.AUDIO_TYPES]
         raise ValidationError('Audio file type not supported. Valid types: %s' % ', '.join(atypelist))
 
+
+def validate_audio_size(upload):
+    # from the upload's metadata; AudioSizeLimitUploadHandler already stopped anything much bigger while streaming
+    check_audio_size(upload.size)
+
+
+def validate_audio_type(upload):
+    # from the first AUDIO_SNIFF_SIZE bytes only; rewound for whoever reads it next
+    upload.file.seek(0)
+    header = upload.file.read(settings.AUDIO_SNIFF_SIZE)
+    upload.file.seek(0)
+    check_audio_header(header)
+
         # TODO: use audiotools and specific codecs on server to verify
@@ -1,15 +1,20 @@
-from smtplib import SMTPException
-
+from botocore.exceptions import ClientError
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.core.mail import send_mail
-from django.http import HttpResponseRedirect
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.http import HttpResponseRedirect, JsonResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.views.decorators.http import require_POST
 
+from .directupload import available_name, make_public, presigned_post, read_header, uploaded_object
 from .forms import *
 from .models import *
 
+DIRECT_UPLOAD_SALT = 'satsound.views.sataudio_upload'
+
 
 @login_required
 def index(request):
@@ -17,8 +22,9 @@ def index(request):
     return render(request, 'satsound/index.html', {'user_audio': user_audio, 'is_ajax': request.is_ajax()})
 
 
-@login_required
-def sataudio(request, norad_id):
+def _resolve_satellite(norad_id):
+    """Returns (satellite, new): a saved satellite, or an unsaved one from the satcat for a satellite we don't have
+    yet, or (None, True) if there is no such satellite"""
     sat = None
     newsat = False
     try:
@@ -34,7 +40,7 @@ def sataudio(request, norad_id):
                 name=satcat.name
             )
         except SatCatCache.DoesNotExist:
-            st = SpaceTrackClient(identity=settings.SPACETRACK_IDENTITY, password=settings.SPACETRACK_PASSWORD)
+            st = spacetrack_client()
             # https://www.space-track.org/basicspacedata/query/class/satcat/NORAD_CAT_ID/3/orderby/INTLDES asc/metadata/false
             params = {
                 'norad_cat_id': norad_id,
@@ -47,10 +53,39 @@ def sataudio(request, norad_id):
                     norad_id=norad_id,
                     name=response[0].get('OBJECT_NAME', '')
                 )
+    return sat, newsat
+
+
+def _submitted(request, sat, sa):
+    """Queues an email to the administrator about newly uploaded audio for review and tells the user it was
+    submitted"""
+    subject = 'Audio file uploaded for %s' % sat.norad_id
+    url = reverse('admin:satsound_satelliteaudio_change', args=(sa.pk,))
+    params = {
+        'username': request.user.username,
+        'sat_id': sat.norad_id,
+        'sat_name': sat.name,
+        'url': request.build_absolute_uri(url)
+    }
+    message = ('{username} uploaded an audio file for satellite {sat_id} ({sat_name}). '
+               'To approve or remove this contribution:\n{url}'''.format(**params))
+    # sent by run_jobs, retried if the mail server is unavailable, rather than holding up the upload
+    Job.objects.enqueue('satsound.tasks.email_admin', subject=subject, message=message)
+
+    messages.success(request,
+                     '''Audio for %s successfully submitted. The audio will be available to the system once '''
+                     ''' it has been reviewed by an administrator.''' % sat.name)
+
+
+@login_required
+def sataudio(request, norad_id):
+    sat, newsat = _resolve_satellite(norad_id)
 
     status = 200
     if request.method == 'POST':
         form = SatelliteAudioForm(request.POST, request.FILES)
+        if 'audio' in getattr(request, 'oversized_uploads', ()):
+            form.add_error('audio', audio_size_message())
         if form.is_valid():
             sa = SatelliteAudio()
             if newsat:
@@ -61,28 +96,7 @@ def sataudio(request, norad_id):
             sa.audio = request.FILES['audio']
             sa.type = form.cleaned_data['type']
             sa.save()
-
-            try:
-                subject = 'Audio file uploaded for %s' % sat.norad_id
-                url = reverse('admin:satsound_satelliteaudio_change', args=(sa.pk,))
-                params = {
-                    'username': request.user.username,
-                    'sat_id': sat.norad_id,
-                    'sat_name': sat.name,
-                    'url': request.build_absolute_uri(url)
-                }
-                message = ('{username} uploaded an audio file for satellite {sat_id} ({sat_name}). '
-                           'To approve or remove this contribution:\n{url}'''.format(**params))
-                send_mail(subject, message, settings.ADMINS[0][1], [settings.ADMINS[0][1]])
-            except SMTPException:
-                messages.error(request,
-                               '''Error emailing administrator for review. Please contact %s with this error '''
-                               '''and the id of the satellite (%s) for which you uploaded audio.'''
-                               % (settings.ADMINS[0][1], sat.norad_id))
-
-            messages.success(request,
-                             '''Audio for %s successfully submitted. The audio will be available to the system once '''
-                             ''' it has been reviewed by an administrator.''' % sat.name)
+            _submitted(request, sat, sa)
             return HttpResponseRedirect(reverse('index'))
 
         else:
@@ -93,4 +107,71 @@ def sataudio(request, norad_id):
 
     else:
         form = SatelliteAudioForm()
-    return render(request, 'satsound/satellite.html', {'sat': sat, 'form': form, 'norad_id': norad_id}, status=status)
+    return render(request, 'satsound/satellite.html', {
+        'sat': sat, 'form': form, 'norad_id': norad_id, 'direct_upload': settings.USE_S3
+    }, status=status)
+
+
+@login_required
+@require_POST
+def sataudio_upload(request, norad_id):
+    """Step one of a direct upload: returns a presigned POST with which the browser uploads the audio file straight
+    to the bucket, under the key SatelliteAudio.audio would give it, and a token for completing the upload"""
+    if not settings.USE_S3:
+        return JsonResponse({'error': 'Direct uploads need S3 storage.'}, status=400)
+    sat, newsat = _resolve_satellite(norad_id)
+    if sat is None:
+        return JsonResponse({'error': 'Invalid satellite id %s.' % norad_id}, status=404)
+    form = DirectAudioUploadForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=422)
+
+    name = available_name(satellite_upload(SatelliteAudio(satellite=sat), form.cleaned_data['filename']))
+    token = signing.dumps({
+        'user': request.user.pk,
+        'norad_id': sat.pk,
+        'name': name,
+        'attribution': form.cleaned_data['attribution'],
+        'type': form.cleaned_data['type'],
+    }, salt=DIRECT_UPLOAD_SALT)
+    # removes the file if the upload is never completed, well after the token has expired
+    Job.objects.enqueue('satsound.tasks.prune_upload', name=name,
+                        run_at=timezone.now() + timedelta(seconds=2 * settings.AUDIO_UPLOAD_EXPIRY))
+    return JsonResponse({'upload': presigned_post(name, form.cleaned_data['content_type']), 'token': token})
+
+
+@login_required
+@require_POST
+def sataudio_complete(request, norad_id):
+    """Step two of a direct upload, once the browser has uploaded the file: checks the uploaded object's size and
+    header, makes it public and adds the audio, as sataudio does for a file uploaded through us"""
+    try:
+        upload = signing.loads(request.POST.get('token', ''), salt=DIRECT_UPLOAD_SALT,
+                               max_age=settings.AUDIO_UPLOAD_EXPIRY)
+    except signing.BadSignature:
+        return JsonResponse({'error': 'Invalid or expired upload.'}, status=400)
+    if upload['user'] != request.user.pk or str(upload['norad_id']) != norad_id:
+        return JsonResponse({'error': 'Invalid upload.'}, status=400)
+
+    name = upload['name']
+    # completing twice (e.g. a retried request) adds the audio once
+    sa = SatelliteAudio.objects.filter(audio=name, user=request.user).first()
+    if sa is None:
+        try:
+            check_audio_size(uploaded_object(name).content_length)
+            check_audio_header(read_header(name))
+            make_public(name)
+        except ClientError:
+            return JsonResponse({'error': 'Upload not found.'}, status=400)
+        except ValidationError as e:
+            default_storage.delete(name)
+            return JsonResponse({'errors': {'audio': e.messages}}, status=422)
+
+        sat, newsat = _resolve_satellite(norad_id)
+        if newsat:
+            sat.save()
+        sa = SatelliteAudio(satellite=sat, user=request.user, attribution=upload['attribution'], type=upload['type'])
+        sa.audio.name = name  # already stored; assigning the name rather than a file saves nothing
+        sa.save()
+        _submitted(request, sat, sa)
+    return JsonResponse({'redirect_url': reverse('index')})